@@ -0,0 +1,183 @@
+"""
+Локальный нагрузочный тест HTTP API.
+
+Поднимает ApiServer в том же процессе (или бьёт в уже запущенный
+через --url), открывает N keep-alive соединений и в течение заданного
+времени шлёт запросы. Печатает requests/sec и перцентили задержки.
+
+Запуск:
+    python -m valutatrade_hub.api.loadtest --connections 50 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import secrets
+import time
+from urllib.parse import urlsplit
+
+from valutatrade_hub.api.server import ApiServer
+
+
+class _Client:
+    """
+    Минимальный keep-alive HTTP/1.1 клиент.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        data: dict | None = None,
+        token: str | None = None,
+    ) -> tuple[int, dict]:
+        body = json.dumps(data).encode("utf-8") if data is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+        if token:
+            head += f"Authorization: Bearer {token}\r\n"
+        head += f"Content-Length: {len(body)}\r\n\r\n"
+
+        self.writer.write(head.encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        status = int(status_line.split()[1])
+
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+
+        payload = await self.reader.readexactly(length)
+        return status, json.loads(payload)
+
+    async def close(self) -> None:
+        self.writer.close()
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def _worker(
+    host: str,
+    port: int,
+    scenario: str,
+    token: str | None,
+    deadline: float,
+    latencies: list[float],
+    errors: list[int],
+) -> None:
+    client = _Client(host, port)
+    await client.connect()
+
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if scenario == "portfolio":
+                status, _ = await client.request("GET", "/portfolio", token=token)
+            elif scenario == "buy":
+                status, _ = await client.request(
+                    "POST", "/buy", {"currency": "BTC", "amount": 0.001}, token=token
+                )
+            else:
+                status, _ = await client.request("GET", "/rate?from=BTC&to=USD")
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        await client.close()
+
+
+async def run_load_test(
+    host: str,
+    port: int,
+    connections: int,
+    duration: float,
+    scenario: str,
+) -> dict:
+    token = None
+    if scenario in ("portfolio", "buy"):
+        client = _Client(host, port)
+        await client.connect()
+        credentials = {"username": f"load-{secrets.token_hex(4)}", "password": "load"}
+        await client.request("POST", "/register", credentials)
+        _, login = await client.request("POST", "/login", credentials)
+        token = login["token"]
+        await client.close()
+
+    latencies: list[float] = []
+    errors: list[int] = []
+    deadline = time.perf_counter() + duration
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(host, port, scenario, token, deadline, latencies, errors)
+        for _ in range(connections)
+    ))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "connections": connections,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round((latencies[-1] if latencies else 0.0) * 1000, 2),
+    }
+
+
+async def _main(args: argparse.Namespace) -> dict:
+    if args.url:
+        url = urlsplit(args.url)
+        return await run_load_test(
+            url.hostname, url.port or 80, args.connections, args.duration, args.scenario
+        )
+
+    server = ApiServer(host="127.0.0.1", port=0)
+    await server.start()
+    try:
+        return await run_load_test(
+            server.host, server.port, args.connections, args.duration, args.scenario
+        )
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ValutaTrade Hub API load test")
+    parser.add_argument("--url", help="адрес уже запущенного сервера")
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument(
+        "--scenario", choices=("rate", "portfolio", "buy"), default="rate"
+    )
+    args = parser.parse_args()
+
+    result = asyncio.run(_main(args))
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+Asyncio HTTP/JSON сервис ValutaTrade Hub.
+
+Обёртка над use cases (register / login / get-rate / buy / sell /
+portfolio / trades) для множества одновременных клиентов:
+- сессии на уровне запроса (Bearer-токен вместо current_user.json);
+- блокирующая работа с JSON-хранилищем — в ограниченном пуле потоков;
+- изменяющие операции не сериализуются глобально: хранилище само
+  держит lock-файлы (шард портфеля, users.json, ledger); сделки одного
+  пользователя идут по очереди в порядке поступления;
+- сделки (buy / sell / convert) исполняются воркерами-владельцами
+  пользователей на пуле процессов (core.executor), если EXECUTOR_WORKERS > 0.
+
+Только стандартная библиотека (asyncio streams, минимальный HTTP/1.1).
+"""
+
+import asyncio
+import json
+import logging
+import secrets
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+
+from valutatrade_hub.core import executor as trade_executor
+from valutatrade_hub.core import usecases
+from valutatrade_hub.core.exceptions import (
+    ApiRequestError,
+    CurrencyNotFoundError,
+    InsufficientFundsError,
+    ValutaTradeError,
+)
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.logging_config import setup_logging
+
+
+logger = logging.getLogger("valutatrade")
+
+MAX_HEADER_LINES = 100
+MAX_BODY_SIZE = 64 * 1024
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        self.status = status
+        self.message = message
+        super().__init__(message)
+
+
+# =========================
+# sessions
+# =========================
+
+class SessionStore:
+    """
+    Сессии API в памяти процесса: token → пользователь.
+    """
+
+    def __init__(self, ttl_seconds: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._sessions: dict[str, tuple[dict, float]] = {}
+
+    def create(self, user: dict) -> str:
+        token = secrets.token_hex(16)
+        self._sessions[token] = (user, time.monotonic() + self.ttl_seconds)
+        return token
+
+    def get(self, token: str) -> dict | None:
+        entry = self._sessions.get(token)
+        if entry is None:
+            return None
+
+        user, expires = entry
+        if time.monotonic() > expires:
+            del self._sessions[token]
+            return None
+        return user
+
+    def drop(self, token: str) -> None:
+        self._sessions.pop(token, None)
+
+
+# =========================
+# server
+# =========================
+
+class ApiServer:
+    def __init__(
+        self,
+        host: str | None = None,
+        port: int | None = None,
+        max_workers: int | None = None,
+    ) -> None:
+        settings = SettingsLoader()
+
+        self.host = host or settings.get("API_HOST")
+        self.port = port if port is not None else settings.get("API_PORT")
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.get("API_MAX_WORKERS"),
+            thread_name_prefix="valutatrade-api",
+        )
+        self.sessions = SessionStore(settings.get("API_SESSION_TTL_SECONDS"))
+        self.trades = trade_executor.from_settings()
+
+        # user_id → asyncio.Lock; запись исчезает вместе с последней ссылкой
+        self._user_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+        self._server: asyncio.AbstractServer | None = None
+
+        self._routes: dict[tuple[str, str], Callable] = {
+            ("POST", "/register"): self._register,
+            ("POST", "/login"): self._login,
+            ("POST", "/logout"): self._logout,
+            ("GET", "/rate"): self._get_rate,
+            ("POST", "/buy"): self._buy,
+            ("POST", "/sell"): self._sell,
+            ("POST", "/convert"): self._convert,
+            ("GET", "/portfolio"): self._portfolio,
+            ("GET", "/trades"): self._trades,
+        }
+
+    # =========================
+    # lifecycle
+    # =========================
+
+    async def start(self) -> None:
+        if self.trades is not None:
+            self.trades.start()
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        # порт 0 → выбранный ОС порт
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"API server listening on {self.host}:{self.port}")
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=True)
+        if self.trades is not None:
+            self.trades.close()
+
+    # =========================
+    # HTTP
+    # =========================
+
+    async def _handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    await self._write_response(
+                        writer, e.status, {"error": "HttpError", "message": e.message},
+                        keep_alive=False,
+                    )
+                    break
+
+                if request is None:
+                    break
+
+                method, target, headers, body = request
+                status, payload = await self._dispatch(method, target, headers, body)
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Некорректная строка запроса")
+
+        headers: dict[str, str] = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HttpError(400, "Слишком много заголовков")
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Некорректный Content-Length")
+        if length < 0:
+            raise HttpError(400, "Некорректный Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HttpError(413, "Слишком большое тело запроса")
+
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def _write_response(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: Any,
+        keep_alive: bool,
+    ) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(
+        self,
+        method: str,
+        target: str,
+        headers: dict[str, str],
+        body: bytes,
+    ) -> tuple[int, Any]:
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        handler = self._routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self._routes):
+                return 405, {"error": "HttpError", "message": "Метод не поддерживается"}
+            return 404, {"error": "HttpError", "message": "Ресурс не найден"}
+
+        try:
+            data = json.loads(body) if body else {}
+            if not isinstance(data, dict):
+                raise ValueError
+        except ValueError:
+            return 400, {"error": "HttpError", "message": "Тело должно быть JSON-объектом"}
+
+        try:
+            return 200, await handler(query=query, data=data, headers=headers)
+        except HttpError as e:
+            return e.status, {"error": "HttpError", "message": e.message}
+        except ValutaTradeError as e:
+            return self._error_status(e), {"error": type(e).__name__, "message": str(e)}
+        except Exception as e:
+            logger.exception(f"API: unexpected error: {e}")
+            return 500, {"error": type(e).__name__, "message": "Внутренняя ошибка"}
+
+    @staticmethod
+    def _error_status(error: ValutaTradeError) -> int:
+        if isinstance(error, CurrencyNotFoundError):
+            return 404
+        if isinstance(error, InsufficientFundsError):
+            return 409
+        if isinstance(error, ApiRequestError):
+            return 503
+        return 400
+
+    # =========================
+    # helpers
+    # =========================
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def _user_lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def _run_trade(
+        self,
+        operation: str,
+        user: dict,
+        *args,
+        idempotency_key: str | None = None,
+    ) -> Any:
+        if self.trades is None:
+            trade = {
+                "buy": usecases.buy_currency,
+                "sell": usecases.sell_currency,
+                "convert": usecases.convert_currency,
+            }[operation]
+            async with self._user_lock(user["user_id"]):
+                return await self._run(
+                    trade, *args, user=user, idempotency_key=idempotency_key
+                )
+
+        future = self.trades.submit(operation, user, *args, idempotency_key=idempotency_key)
+        return await asyncio.wrap_future(future)
+
+    def _session_user(self, headers: dict[str, str]) -> dict:
+        auth = headers.get("authorization", "")
+        scheme, _, token = auth.partition(" ")
+        user = self.sessions.get(token) if scheme.lower() == "bearer" else None
+        if user is None:
+            raise HttpError(401, "Требуется вход: передайте 'Authorization: Bearer <token>'")
+        return user
+
+    @staticmethod
+    def _amount(data: dict) -> float:
+        amount = data.get("amount")
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+            raise HttpError(400, "'amount' должен быть числом")
+        return amount
+
+    # =========================
+    # handlers
+    # =========================
+
+    async def _register(self, query, data, headers):
+        # уникальность имени и user_id — под lock-файлом users.json
+        return await self._run(
+            usecases.register_user, data.get("username", ""), data.get("password")
+        )
+
+    async def _login(self, query, data, headers):
+        user = await self._run(
+            usecases.authenticate_user,
+            data.get("username", ""),
+            data.get("password"),
+        )
+        return {"token": self.sessions.create(user), **user}
+
+    async def _logout(self, query, data, headers):
+        self._session_user(headers)
+        self.sessions.drop(headers["authorization"].partition(" ")[2])
+        return {"ok": True}
+
+    async def _get_rate(self, query, data, headers):
+        return await self._run(
+            usecases.get_rate, query.get("from", ""), query.get("to", "")
+        )
+
+    async def _buy(self, query, data, headers):
+        user = self._session_user(headers)
+        return await self._run_trade(
+            "buy",
+            user,
+            data.get("currency", ""),
+            self._amount(data),
+            data.get("base"),
+            idempotency_key=headers.get("idempotency-key"),
+        )
+
+    async def _sell(self, query, data, headers):
+        user = self._session_user(headers)
+        return await self._run_trade(
+            "sell",
+            user,
+            data.get("currency", ""),
+            self._amount(data),
+            data.get("base"),
+            idempotency_key=headers.get("idempotency-key"),
+        )
+
+    async def _convert(self, query, data, headers):
+        user = self._session_user(headers)
+        return await self._run_trade(
+            "convert",
+            user,
+            data.get("from", ""),
+            data.get("to", ""),
+            self._amount(data),
+            idempotency_key=headers.get("idempotency-key"),
+        )
+
+    async def _portfolio(self, query, data, headers):
+        user = self._session_user(headers)
+        return await self._run(usecases.show_portfolio, query.get("base"), user=user)
+
+    async def _trades(self, query, data, headers):
+        user = self._session_user(headers)
+        try:
+            limit = int(query.get("limit", 50))
+            cursor = int(query["cursor"]) if query.get("cursor") else None
+        except ValueError:
+            raise HttpError(400, "'limit' и 'cursor' должны быть целыми числами")
+
+        return await self._run(
+            usecases.list_trades,
+            limit=limit,
+            cursor=cursor,
+            since=query.get("since"),
+            until=query.get("until"),
+            currency=query.get("currency"),
+            user=user,
+        )
+
+
+def main() -> None:
+    setup_logging()
+
+    server = ApiServer()
+    print(f"ValutaTrade Hub API: http://{server.host}:{server.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
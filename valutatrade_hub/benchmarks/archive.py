@@ -0,0 +1,162 @@
+"""
+Бенчмарк архива истории курсов: exchange_rates.json против сегментов.
+
+Во временном каталоге пишется история --pairs пар с шагом --step-minutes
+за --days дней (в формате RatesStorage: indent=4, id/source/meta на
+каждой записи). Замеряются размер и время чтения:
+- полный проход по всем точкам;
+- точки одной пары (JSON читается целиком, архив — только её сегменты);
+- добавление одной записи в историю (перезапись exchange_rates.json).
+Затем RatesArchive.roll переносит всё в сегменты, и те же замеры
+повторяются по архиву.
+
+Запуск:
+    python -m valutatrade_hub.benchmarks.archive --days 365 --pairs 8
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from valutatrade_hub.parser_service.archive import RateSegment
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import RatesStorage
+
+
+PAIRS = ("BTC_USD", "ETH_USD", "SOL_USD", "EUR_USD", "GBP_USD", "RUB_USD", "JPY_USD", "CNY_USD")
+
+
+def _best_of(repeat: int, fn) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _history(storage: RatesStorage, pairs: list[str], days: int, step_minutes: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=days + 1)
+    steps = days * 24 * 60 // step_minutes
+
+    records = []
+    for pair in pairs:
+        rate = rng.uniform(1, 60000)
+        for i in range(steps):
+            rate *= 1 + rng.gauss(0, 0.002)
+            ts = start + timedelta(minutes=i * step_minutes)
+            records.append(storage._make_history_record(
+                pair, rate, ts.isoformat().replace("+00:00", "Z"), "CoinGecko"
+            ))
+    records.sort(key=lambda r: r["timestamp"])
+    return records
+
+
+def run(days: int, pairs: int, step_minutes: int, repeat: int, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        config = ParserConfig(
+            RATES_FILE_PATH=str(root / "rates.json"),
+            RATES_BINARY_PATH=str(root / "rates.bin"),
+            HISTORY_FILE_PATH=str(root / "exchange_rates.json"),
+            ARCHIVE_DIR_PATH=str(root / "archive"),
+        )
+        storage = RatesStorage(config)
+        names = list(PAIRS[:pairs])
+        probe = names[0]
+
+        storage._atomic_write(storage.history_path, _history(storage, names, days, step_minutes, seed))
+        points = len(storage._load_history())
+        json_bytes = storage.history_path.stat().st_size
+
+        def json_scan() -> float:
+            return sum(float(r["rate"]) for r in storage._load_history())
+
+        def json_pair() -> float:
+            return sum(
+                float(r["rate"]) for r in storage._load_history()
+                if f"{r['from_currency']}_{r['to_currency']}" == probe
+            )
+
+        extra = storage._make_history_record(probe, 1.0, "2100-01-01T00:00:00Z", "bench")
+
+        def append() -> None:
+            storage._append_history_records([extra])
+
+        json_scan_s, json_total = _best_of(repeat, json_scan)
+        json_pair_s, _ = _best_of(repeat, json_pair)
+        json_append_s, _ = _best_of(repeat, append)
+        # свежие записи append остаются в горячем файле
+        storage._atomic_write(
+            storage.history_path,
+            [r for r in storage._load_history() if r["source"] != "bench"],
+        )
+
+        start = time.perf_counter()
+        moved = storage.archive.roll(datetime.now(timezone.utc))
+        roll_s = time.perf_counter() - start
+
+        archive = storage.archive
+        archive_bytes = sum(p.stat().st_size for pair in archive.pairs() for p in archive.segments(pair))
+
+        def archive_scan() -> float:
+            total = 0.0
+            for pair in archive.pairs():
+                for path in archive.segments(pair):
+                    with RateSegment(path) as segment:
+                        total += sum(segment.rates)
+            return total
+
+        def archive_pair() -> float:
+            total = 0.0
+            for path in archive.segments(probe):
+                with RateSegment(path) as segment:
+                    total += sum(segment.rates)
+            return total
+
+        archive_scan_s, archive_total = _best_of(repeat, archive_scan)
+        archive_pair_s, _ = _best_of(repeat, archive_pair)
+        archive_append_s, _ = _best_of(repeat, append)
+
+    if abs(archive_total - json_total) > 1e-6 * abs(json_total):
+        raise RuntimeError("Сумма курсов архива не совпала с историей")
+
+    return {
+        "points": points,
+        "moved": moved,
+        "roll_s": roll_s,
+        "json": {"bytes": json_bytes, "scan_s": json_scan_s, "pair_s": json_pair_s, "append_s": json_append_s},
+        "archive": {"bytes": archive_bytes, "scan_s": archive_scan_s, "pair_s": archive_pair_s, "append_s": archive_append_s},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rate history archive benchmark")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--pairs", type=int, default=len(PAIRS), choices=range(1, len(PAIRS) + 1))
+    parser.add_argument("--step-minutes", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    r = run(args.days, args.pairs, args.step_minutes, args.repeat, args.seed)
+    j, a = r["json"], r["archive"]
+
+    print(f"points: {r['points']}, archived: {r['moved']} за {r['roll_s']:.2f} с")
+    print(f"{'':<22}{'json':>12}{'archive':>12}{'x':>8}")
+    rows = (
+        ("size, KiB", j["bytes"] / 1024, a["bytes"] / 1024),
+        ("full scan, ms", j["scan_s"] * 1000, a["scan_s"] * 1000),
+        ("one pair, ms", j["pair_s"] * 1000, a["pair_s"] * 1000),
+        ("append, ms", j["append_s"] * 1000, a["append_s"] * 1000),
+    )
+    for name, before, after in rows:
+        print(f"{name:<22}{before:>12.1f}{after:>12.1f}{before / max(after, 1e-9):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
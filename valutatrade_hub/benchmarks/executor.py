@@ -0,0 +1,191 @@
+"""
+Бенчмарк исполнителя сделок: пропускная способность от числа воркеров.
+
+Для каждого числа воркеров (1, 2, 4, ... до --max-workers) — отдельный
+процесс со свежим временным хранилищем на --users пользователей (шарды
+портфелей, rates.json со свежими курсами): замеры не зависят от
+данных, накопленных предыдущими. Исполняется --trades сделок
+покупки/продажи случайных пользователей; продаётся только купленное
+раньше, поэтому ни одна сделка не должна завершиться ошибкой —
+иначе замер прерывается. Сделки идут полным путём use cases: шарды,
+ledger, P&L, ключи идемпотентности.
+
+Запуск:
+    python -m valutatrade_hub.benchmarks.executor --users 20000 --trades 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+PAIRS = {"BTC_USD": 60000.0, "ETH_USD": 3000.0, "EUR_USD": 1.08}
+
+PYPROJECT = """
+[tool.valutatrade]
+DATA_DIR = "data"
+LOG_DIR = "logs"
+PORTFOLIO_SHARDS = 16
+# курсы не устаревают за время замера
+RATES_TTL_SECONDS = 1000000000
+"""
+
+
+def _prepare(directory: Path, users: int) -> list[dict]:
+    """
+    Каталог с pyproject.toml и данными; use cases читают настройки
+    из текущего каталога, поэтому импорт — только после chdir.
+    """
+    (directory / "pyproject.toml").write_text(PYPROJECT, encoding="utf-8")
+    data_dir = directory / "data"
+    data_dir.mkdir()
+
+    now = datetime.now(timezone.utc).isoformat()
+    rates = {pair: {"rate": rate, "updated_at": now} for pair, rate in PAIRS.items()}
+    (data_dir / "rates.json").write_text(json.dumps(rates), encoding="utf-8")
+
+    accounts = [
+        {"user_id": user_id, "username": f"bench{user_id}"}
+        for user_id in range(1, users + 1)
+    ]
+    portfolios = [
+        {"user_id": a["user_id"], "wallets": {"USD": {"balance": 10000.0}}}
+        for a in accounts
+    ]
+    # первое обращение раскладывает portfolios.json по шардам
+    (data_dir / "portfolios.json").write_text(json.dumps(portfolios), encoding="utf-8")
+
+    os.chdir(directory)
+    from valutatrade_hub.core import usecases
+    from valutatrade_hub.logging_config import setup_logging
+
+    # журнал операций — в файл временного каталога, как у сервера
+    setup_logging()
+    usecases._portfolios.layout()
+    return accounts
+
+
+def _orders(accounts: list[dict], trades: int, seed: int) -> list[tuple[dict, str, str]]:
+    """
+    ~70% покупок / ~30% продаж по 0.01; продажа — только если у
+    пользователя уже куплено (сделки одного пользователя исполняются
+    по порядку), так что все сделки проходят.
+    """
+    rng = random.Random(seed)
+    held: dict[tuple[int, str], int] = {}
+    orders = []
+    for _ in range(trades):
+        user = rng.choice(accounts)
+        code = rng.choice(("BTC", "ETH", "EUR"))
+        key = (user["user_id"], code)
+
+        side = "sell" if held.get(key, 0) > 0 and rng.random() < 0.3 else "buy"
+        held[key] = held.get(key, 0) + (1 if side == "buy" else -1)
+        orders.append((user, side, code))
+    return orders
+
+
+def run(workers: int, accounts: list[dict], trades: int, seed: int) -> dict:
+    from valutatrade_hub.core.executor import TradeExecutor
+
+    orders = _orders(accounts, trades, seed)
+
+    start = time.perf_counter()
+    executor = TradeExecutor(workers)
+    executor.start()
+    startup_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    futures = [
+        executor.submit(side, user, code, 0.01)
+        for user, side, code in orders
+    ]
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    elapsed = time.perf_counter() - start
+
+    executor.close()
+
+    if errors:
+        raise RuntimeError(
+            f"{len(errors)} из {trades} сделок завершились ошибкой, "
+            f"первая: {errors[0]!r}"
+        )
+
+    return {
+        "workers": workers,
+        "trades": trades,
+        "startup_ms": round(startup_s * 1000, 1),
+        "elapsed_s": round(elapsed, 3),
+        "trades_per_s": round(trades / elapsed),
+    }
+
+
+def _run_fresh(workers: int, args: argparse.Namespace) -> dict:
+    """
+    Замер в отдельном процессе: use cases и их кэши (ledger, шарды,
+    идемпотентность) привязаны к каталогу данных процесса.
+    """
+    proc = subprocess.run(
+        [
+            sys.executable, "-m", "valutatrade_hub.benchmarks.executor",
+            "--run", str(workers),
+            "--users", str(args.users),
+            "--trades", str(args.trades),
+            "--seed", str(args.seed),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"workers={workers}: замер не удался\n{proc.stderr}")
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def _run_once(workers: int, args: argparse.Namespace) -> None:
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            accounts = _prepare(Path(tmp), args.users)
+            print(json.dumps(run(workers, accounts, args.trades, args.seed)))
+        finally:
+            os.chdir(cwd)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Partitioned trade executor throughput")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--trades", type=int, default=20_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=42)
+    # один замер в свежем каталоге (запускается из main)
+    parser.add_argument("--run", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        _run_once(args.run, args)
+        return
+
+    counts = [1]
+    while counts[-1] * 2 <= args.max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != args.max_workers:
+        counts.append(args.max_workers)
+
+    print(f"cpu_count: {os.cpu_count()}, users: {args.users}")
+    for workers in counts:
+        r = _run_fresh(workers, args)
+        print(
+            f"workers={r['workers']:>3}  trades/s={r['trades_per_s']:>8}  "
+            f"elapsed={r['elapsed_s']}s  startup={r['startup_ms']}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
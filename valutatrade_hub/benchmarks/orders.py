@@ -0,0 +1,99 @@
+"""
+Бенчмарк книги ордеров: задержка snapshot → исполнение.
+
+На паре BTC_USD через place() выставляется N ордеров со случайными
+trigger, затем прогоняются snapshot с небольшими движениями цены;
+для каждого измеряется время on_snapshot. Журнал ордеров пишется
+как в работе (строка на выставление и на исполнение, уплотнение);
+подменено только исполнение сделки (no-op), чтобы измерять книгу,
+а не use cases. В конце книга перечитывается из журнала и сверяется.
+
+Запуск:
+    python -m valutatrade_hub.benchmarks.orders --orders 100000
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from valutatrade_hub.core.orders import OrderBook
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(orders: int, snapshots: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    price = 60000.0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "orders.jsonl"
+        book = OrderBook(path, executor=lambda order, p: {})
+
+        place_latencies = []
+        start = time.perf_counter()
+        for order_id in range(1, orders + 1):
+            side = rng.choice(("buy", "sell"))
+            order_type = rng.choice(("limit", "stop"))
+            below = (side, order_type) in (("buy", "limit"), ("sell", "stop"))
+            offset = rng.uniform(0.001, 0.2) * price
+
+            t = time.perf_counter()
+            book.place(
+                order_id % 1000, side, order_type, "BTC", "USD", 0.01,
+                price - offset if below else price + offset,
+            )
+            place_latencies.append(time.perf_counter() - t)
+        build_s = time.perf_counter() - start
+
+        latencies = []
+        filled = 0
+        for _ in range(snapshots):
+            price *= 1 + rng.uniform(-0.002, 0.002)
+            start = time.perf_counter()
+            fills = book.on_snapshot({"BTC_USD": price}, "bench")
+            latencies.append(time.perf_counter() - start)
+            filled += len(fills)
+
+        resting = len(book)
+        # журнал восстанавливает ту же книгу
+        reloaded = len(OrderBook(path, executor=lambda order, p: {}))
+        journal_kb = path.stat().st_size / 1024
+
+    if reloaded != resting:
+        raise RuntimeError(f"Книга из журнала: {reloaded} ордеров вместо {resting}")
+
+    latencies.sort()
+    place_latencies.sort()
+    return {
+        "orders": orders,
+        "snapshots": snapshots,
+        "filled": filled,
+        "resting_left": resting,
+        "journal_kb": round(journal_kb, 1),
+        "build_ms": round(build_s * 1000, 1),
+        "place_p50_us": round(_percentile(place_latencies, 0.50) * 1e6, 1),
+        "place_p99_us": round(_percentile(place_latencies, 0.99) * 1e6, 1),
+        "p50_us": round(_percentile(latencies, 0.50) * 1e6, 1),
+        "p99_us": round(_percentile(latencies, 0.99) * 1e6, 1),
+        "max_us": round(latencies[-1] * 1e6, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Order book snapshot-to-fill benchmark")
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--snapshots", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for key, value in run(args.orders, args.snapshots, args.seed).items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import json
+from datetime import datetime, timezone
 from pathlib import Path
 
 from valutatrade_hub.logging_config import setup_logging
@@ -9,7 +10,22 @@ from valutatrade_hub.core.usecases import (
     show_portfolio,
     buy_currency,
     sell_currency,
+    convert_currency,
     get_rate,
+    place_order,
+    cancel_order,
+    list_orders,
+    get_order_book,
+    subscribe_alert,
+    cancel_alert,
+    list_alerts,
+    list_notifications,
+    get_alert_book,
+    portfolio_history,
+    top_portfolios,
+    my_rank,
+    get_leaderboard,
+    list_trades,
     CURRENT_USER_FILE,
     _get_current_user,
 )
@@ -22,6 +38,7 @@ from valutatrade_hub.core.exceptions import (
 
 from valutatrade_hub.parser_service.config import ParserConfig
 from valutatrade_hub.parser_service.storage import RatesStorage
+from valutatrade_hub.parser_service.snapshot import RatesSnapshotReader
 from valutatrade_hub.parser_service.api_clients import (
     CoinGeckoClient,
     ExchangeRateApiClient,
@@ -48,6 +65,12 @@ def print_menu():
     print("6. Получить курс валют")
     print("7. Обновить курсы валют (update-rates)")
     print("8. Показать курсы из кеша (show-rates)")
+    print("9. Лимитные и стоп-ордера")
+    print("10. Оповещения о курсах")
+    print("11. История стоимости портфеля")
+    print("12. Топ портфелей")
+    print("13. История сделок")
+    print("14. Конвертировать валюту")
     print("0. Выход")
     print("---------------------------------")
 
@@ -101,13 +124,25 @@ def handle_show_portfolio():
             return
 
         for w in r["wallets"]:
-            print(
+            line = (
                 f"- {w['currency']}: {w['balance']:.4f} "
                 f"→ {w['value_in_base']:.2f} {r['base']}"
             )
+            if w["unrealized_pnl"] is not None:
+                line += (
+                    f" | себестоимость {w['cost_basis']:.2f}, "
+                    f"P&L {w['unrealized_pnl']:+.2f}"
+                )
+            print(line)
 
         print("---------------------------------")
         print(f"ИТОГО: {r['total']:.2f} {r['base']}")
+        print(
+            f"P&L: нереализованный {r['unrealized_pnl']:+.2f}, "
+            f"реализованный {r['realized_pnl']:+.2f} {r['base']}"
+        )
+        if r["var_95"]:
+            print(f"VaR (95%, 1 день): {r['var_95']:.2f} {r['base']}")
 
     except CurrencyNotFoundError as e:
         print(f"\n❌ Неизвестная валюта: {e}")
@@ -164,6 +199,7 @@ def handle_sell():
         )
         print(f"- Баланс: {r['before']:.4f} → {r['after']:.4f}")
         print(f"- Выручка: {r['proceeds']:.2f} {r['base']}")
+        print(f"- Реализованный P&L: {r['realized_pnl']:+.2f} {r['pnl_currency']}")
 
     except ValueError:
         print("\n❌ Некорректная сумма: amount должен быть числом")
@@ -177,6 +213,40 @@ def handle_sell():
         print(f"\n❌ Ошибка продажи: {e}")
 
 
+def handle_convert():
+    if not _require_login():
+        return
+
+    from_cur = input("Из валюты (например EUR): ").strip()
+    to_cur = input("В валюту (например BTC): ").strip()
+    amount_raw = input("Количество: ").strip()
+
+    try:
+        amount = float(amount_raw)
+        r = convert_currency(from_cur, to_cur, amount)
+
+        print("\n✅ Конвертация выполнена")
+        print(
+            f"- Списано: {r['amount']:.4f} {r['currency']} "
+            f"по курсу {r['rate']} {r['base']}/{r['currency']}"
+        )
+        print(f"- Зачислено: {r['received']:.8f} {r['base']}")
+        print(f"- Баланс {r['currency']}: {r['before']:.4f} → {r['after']:.4f}")
+        print(f"- Баланс {r['base']}: {r['target_before']:.8f} → {r['target_after']:.8f}")
+        print(f"- Реализованный P&L: {r['realized_pnl']:+.2f} {r['pnl_currency']}")
+
+    except ValueError:
+        print("\n❌ Некорректная сумма: amount должен быть числом")
+    except CurrencyNotFoundError as e:
+        print(f"\n❌ Неизвестная валюта: {e}")
+    except InsufficientFundsError as e:
+        print(f"\n❌ Недостаточно средств: {e}")
+    except ApiRequestError as e:
+        print(f"\n❌ Курс недоступен: {e}")
+    except ValutaTradeError as e:
+        print(f"\n❌ Ошибка конвертации: {e}")
+
+
 def handle_get_rate():
     print("\nПолучение курса валют")
     from_cur = input("Из валюты (например USD): ").strip()
@@ -189,6 +259,9 @@ def handle_get_rate():
             f"(обновлено: {r['updated_at']})"
         )
 
+        if r.get("stale"):
+            print("⚠️  Курс устарел, обновление запущено в фоне")
+
         if r["reverse_rate"] is not None:
             print(
                 f"Обратный курс {r['to']} → {r['from']}: {r['reverse_rate']}"
@@ -213,6 +286,11 @@ def handle_update_rates():
         ExchangeRateApiClient(config),
     ]
 
+    # отложенные ордера исполняются по изменившимся парам нового snapshot
+    storage.subscribe(get_order_book().on_snapshot)
+    storage.subscribe(get_alert_book().on_snapshot)
+    storage.subscribe(get_leaderboard().on_snapshot)
+
     updater = RatesUpdater(clients=clients, storage=storage)
     result = updater.run_update()
 
@@ -220,7 +298,8 @@ def handle_update_rates():
         print("Update completed with errors.")
     else:
         print(
-            f"Update successful. Total rates updated: {result['count']}. "
+            f"Update successful. Total rates updated: {result['count']} "
+            f"(changed: {result['changed']}). "
             f"Last refresh: {result['last_refresh']}"
         )
 
@@ -229,6 +308,16 @@ def handle_update_rates():
         for e in result["errors"]:
             print(f"- {e}")
 
+    open_breakers = {
+        source: state
+        for source, state in result["breakers"].items()
+        if state != "closed"
+    }
+    if open_breakers:
+        print("Providers:")
+        for source, state in open_breakers.items():
+            print(f"- {source}: {state}")
+
 
 def handle_show_rates():
     """
@@ -236,15 +325,33 @@ def handle_show_rates():
     """
     config = ParserConfig()
     rates_file = Path(config.RATES_FILE_PATH)
+    binary_file = Path(config.RATES_BINARY_PATH)
+
+    if binary_file.exists():
+        # бинарный snapshot: без разбора rates.json
+        reader = RatesSnapshotReader(binary_file)
+        pairs = {}
+        last_ts = None
+        for pair, rate, updated_ts, _ in reader.items():
+            pairs[pair] = {"rate": rate}
+            last_ts = max(last_ts or updated_ts, updated_ts)
+        reader.close()
+
+        updated_at = None
+        if last_ts is not None:
+            updated_at = datetime.fromtimestamp(last_ts, timezone.utc).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            )
 
-    if not rates_file.exists():
+    elif rates_file.exists():
+        data = json.loads(rates_file.read_text(encoding="utf-8"))
+        pairs = data.get("pairs", {})
+        updated_at = data.get("last_refresh")
+
+    else:
         print("\nЛокальный кеш курсов пуст. Выполните 'update-rates'.")
         return
 
-    data = json.loads(rates_file.read_text(encoding="utf-8"))
-    pairs = data.get("pairs", {})
-    updated_at = data.get("last_refresh")
-
     if not pairs:
         print("\nЛокальный кеш курсов пуст.")
         return
@@ -287,6 +394,212 @@ def handle_show_rates():
         print(f"- {pair}: {info['rate']}")
 
 
+def handle_orders():
+    if not _require_login():
+        return
+
+    print("\n1. Мои ордера")
+    print("2. Выставить ордер")
+    print("3. Отменить ордер")
+    choice = input("Выберите действие: ").strip()
+
+    try:
+        if choice == "1":
+            orders = list_orders()
+            if not orders:
+                print("\nАктивных ордеров нет")
+                return
+            print("\n📋 Активные ордера:")
+            for o in orders:
+                print(
+                    f"- #{o['order_id']} {o['side'].upper()} {o['type']} "
+                    f"{o['amount']:.4f} {o['currency']} "
+                    f"@ {o['trigger_price']} {o['base']}"
+                )
+
+        elif choice == "2":
+            side = input("Сторона (buy/sell): ").strip().lower()
+            order_type = input("Тип (limit/stop): ").strip().lower()
+            currency = input("Код валюты (например BTC): ").strip()
+            amount = float(input("Количество: ").strip())
+            trigger = float(input("Цена срабатывания (USD): ").strip())
+
+            o = place_order(side, order_type, currency, amount, trigger)
+            print(
+                f"\n✅ Ордер #{o['order_id']} выставлен: {o['side'].upper()} "
+                f"{o['type']} {o['amount']:.4f} {o['currency']} "
+                f"@ {o['trigger_price']} {o['base']}"
+            )
+
+        elif choice == "3":
+            order_id = int(input("Номер ордера: ").strip())
+            o = cancel_order(order_id)
+            print(f"\n✅ Ордер #{o['order_id']} отменён")
+
+        else:
+            print("\n❌ Неизвестная команда")
+
+    except ValueError:
+        print("\n❌ Некорректное число")
+    except CurrencyNotFoundError as e:
+        print(f"\n❌ Неизвестная валюта: {e}")
+    except ValutaTradeError as e:
+        print(f"\n❌ Ошибка: {e}")
+
+
+def _describe_alert(a: dict) -> str:
+    if a["kind"] == "move":
+        return f"{a['pair']} ±{a['threshold']}% за {a['window_minutes']} мин"
+    sign = ">=" if a["kind"] == "above" else "<="
+    return f"{a['pair']} {sign} {a['threshold']}"
+
+
+def handle_alerts():
+    if not _require_login():
+        return
+
+    print("\n1. Мои оповещения")
+    print("2. Новое оповещение")
+    print("3. Отменить оповещение")
+    print("4. Сработавшие оповещения")
+    choice = input("Выберите действие: ").strip()
+
+    try:
+        if choice == "1":
+            alerts = list_alerts()
+            if not alerts:
+                print("\nАктивных оповещений нет")
+                return
+            print("\n🔔 Активные оповещения:")
+            for a in alerts:
+                print(f"- #{a['alert_id']} {_describe_alert(a)}")
+
+        elif choice == "2":
+            currency = input("Код валюты (например BTC): ").strip()
+            kind = input("Вид (above/below/move): ").strip().lower()
+            window = None
+            if kind == "move":
+                threshold = float(input("Изменение, %: ").strip())
+                window = int(input("Окно, минут: ").strip())
+            else:
+                threshold = float(input("Порог цены (USD): ").strip())
+
+            a = subscribe_alert(currency, kind, threshold, window)
+            print(f"\n✅ Оповещение #{a['alert_id']}: {_describe_alert(a)}")
+
+        elif choice == "3":
+            alert_id = int(input("Номер оповещения: ").strip())
+            a = cancel_alert(alert_id)
+            print(f"\n✅ Оповещение #{a['alert_id']} отменено")
+
+        elif choice == "4":
+            notes = list_notifications()
+            if not notes:
+                print("\nСработавших оповещений нет")
+                return
+            for n in notes:
+                print(
+                    f"- [{n['triggered_at']}] #{n['alert_id']} "
+                    f"{_describe_alert(n)}: цена {n['price']}"
+                )
+
+        else:
+            print("\n❌ Неизвестная команда")
+
+    except ValueError:
+        print("\n❌ Некорректное число")
+    except CurrencyNotFoundError as e:
+        print(f"\n❌ Неизвестная валюта: {e}")
+    except ValutaTradeError as e:
+        print(f"\n❌ Ошибка: {e}")
+
+
+def handle_portfolio_history():
+    if not _require_login():
+        return
+
+    days_raw = input("За сколько дней (по умолчанию 30): ").strip() or "30"
+    resolution = input("Шаг (15m / 1h / 1d, по умолчанию 1d): ").strip() or "1d"
+    base = input("Базовая валюта (по умолчанию USD): ").strip() or "USD"
+
+    try:
+        r = portfolio_history(int(days_raw), resolution, base)
+
+        print(f"\n📈 Стоимость портфеля (база: {r['base']}, шаг: {r['resolution']}):")
+        for p in r["points"]:
+            value = "нет курса" if p["value"] is None else f"{p['value']:.2f}"
+            print(f"- {p['timestamp']}: {value}")
+
+    except ValueError:
+        print("\n❌ Некорректное число дней")
+    except CurrencyNotFoundError as e:
+        print(f"\n❌ Неизвестная валюта: {e}")
+    except ValutaTradeError as e:
+        print(f"\n❌ Ошибка: {e}")
+
+
+def handle_leaderboard():
+    n_raw = input("Сколько мест показать (по умолчанию 10): ").strip() or "10"
+    base = input("Базовая валюта (по умолчанию USD): ").strip() or "USD"
+
+    try:
+        r = top_portfolios(int(n_raw), base)
+
+        print(f"\n🏆 Топ портфелей (база: {r['base']}, всего: {r['total_users']}):")
+        if not r["top"]:
+            print("Рейтинг пуст")
+        for e in r["top"]:
+            name = e["username"] or f"user #{e['user_id']}"
+            print(f"{e['rank']:>3}. {name}: {e['value']:.2f} {r['base']}")
+
+        if Path(CURRENT_USER_FILE).exists():
+            rank = my_rank()
+            if rank is not None:
+                print(f"\nВаше место: {rank}")
+
+    except ValueError:
+        print("\n❌ Некорректное число")
+    except CurrencyNotFoundError as e:
+        print(f"\n❌ Неизвестная валюта: {e}")
+    except ValutaTradeError as e:
+        print(f"\n❌ Ошибка: {e}")
+
+
+def handle_trades():
+    if not _require_login():
+        return
+
+    currency = input("Валюта (пусто — все): ").strip() or None
+    since = input("С даты (ISO, пусто — без ограничения): ").strip() or None
+    until = input("По дату (ISO, пусто — без ограничения): ").strip() or None
+
+    cursor = None
+    try:
+        while True:
+            page = list_trades(20, cursor, since, until, currency)
+            if not page["trades"] and cursor is None:
+                print("\nСделок нет")
+                return
+
+            for t in page["trades"]:
+                print(
+                    f"- #{t['trade_id']} [{t['timestamp']}] {t['side'].upper()} "
+                    f"{t['amount']:.4f} {t['currency']} по {t['rate']} {t['base']} "
+                    f"({t['before']:.4f} → {t['after']:.4f})"
+                )
+
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+            if input("Дальше? (y/n): ").strip().lower() != "y":
+                return
+
+    except CurrencyNotFoundError as e:
+        print(f"\n❌ Неизвестная валюта: {e}")
+    except ValutaTradeError as e:
+        print(f"\n❌ Ошибка: {e}")
+
+
 def main_menu():
     while True:
         print_menu()
@@ -308,6 +621,18 @@ def main_menu():
             handle_update_rates()
         elif choice == "8":
             handle_show_rates()
+        elif choice == "9":
+            handle_orders()
+        elif choice == "10":
+            handle_alerts()
+        elif choice == "11":
+            handle_portfolio_history()
+        elif choice == "12":
+            handle_leaderboard()
+        elif choice == "13":
+            handle_trades()
+        elif choice == "14":
+            handle_convert()
         elif choice == "0":
             print("\nДо свидания!")
             break
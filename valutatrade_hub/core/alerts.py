@@ -0,0 +1,336 @@
+"""
+Подписки на оповещения о курсах, проверяемые по новым snapshot.
+
+Виды оповещений по паре <from>_<to>:
+- above: цена >= threshold;
+- below: цена <= threshold;
+- move:  |изменение цены| >= threshold % за последние window_minutes.
+
+Оповещения одноразовые: сработавшее уведомление пишется в outbox
+(alerts_outbox.jsonl, JSON Lines) и снимается с подписки.
+
+Индексы как у книги ордеров: списки (threshold, alert_id),
+отсортированные по threshold — на snapshot O(log n + k) по паре
+(для move — по каждому окну пары).
+"""
+
+import json
+import os
+import tempfile
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from pathlib import Path
+
+from valutatrade_hub.core.exceptions import ValutaTradeError
+from valutatrade_hub.infra.locks import FileLock
+
+
+ALERT_KINDS = ("above", "below", "move")
+
+
+def _to_epoch(timestamp: str) -> float:
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class _PairAlerts:
+    """
+    Индексы одной пары.
+    """
+
+    __slots__ = ("above", "below", "moves")
+
+    def __init__(self) -> None:
+        self.above: list[tuple[float, int]] = []
+        self.below: list[tuple[float, int]] = []
+        # window_minutes → [(pct, alert_id)]
+        self.moves: dict[int, list[tuple[float, int]]] = {}
+
+    def _target(self, alert: dict) -> list[tuple[float, int]]:
+        if alert["kind"] == "move":
+            return self.moves.setdefault(alert["window_minutes"], [])
+        return self.above if alert["kind"] == "above" else self.below
+
+    def add(self, alert: dict, keep_sorted: bool = True) -> None:
+        key = (alert["threshold"], alert["alert_id"])
+        if keep_sorted:
+            insort(self._target(alert), key)
+        else:
+            self._target(alert).append(key)
+
+    def sort(self) -> None:
+        self.above.sort()
+        self.below.sort()
+        for items in self.moves.values():
+            items.sort()
+
+    def remove(self, alert: dict) -> None:
+        target = self._target(alert)
+        key = (alert["threshold"], alert["alert_id"])
+        i = bisect_left(target, key)
+        if i < len(target) and target[i] == key:
+            del target[i]
+
+    def pop_price_crossed(self, price: float) -> list[int]:
+        # above: срабатывают threshold <= price
+        j = bisect_right(self.above, (price, float("inf")))
+        fired = [alert_id for _, alert_id in self.above[:j]]
+        del self.above[:j]
+
+        # below: срабатывают threshold >= price
+        i = bisect_left(self.below, (price, -1))
+        fired.extend(alert_id for _, alert_id in self.below[i:])
+        del self.below[i:]
+
+        return fired
+
+    def pop_moved(self, window: int, change_pct: float) -> list[int]:
+        target = self.moves.get(window, [])
+        j = bisect_right(target, (change_pct, float("inf")))
+        fired = [alert_id for _, alert_id in target[:j]]
+        del target[:j]
+        return fired
+
+    def max_window(self) -> int:
+        return max((w for w, items in self.moves.items() if items), default=0)
+
+
+class AlertBook:
+    """
+    Подписки всех пользователей + outbox уведомлений.
+
+    Подключается к RatesStorage: storage.subscribe(book.on_snapshot).
+    Для move-оповещений хранит в памяти ряд цен пары за максимальное
+    окно подписок (наполняется приходящими snapshot).
+    """
+
+    def __init__(self, path: Path, outbox_path: Path, lock_path: Path | None = None) -> None:
+        self.path = Path(path)
+        self.outbox_path = Path(outbox_path)
+        self.lock = FileLock(lock_path or self.path.with_suffix(".lock"))
+
+        self._alerts: dict[int, dict] = {}
+        self._indexes: dict[str, _PairAlerts] = {}
+        self._next_id = 1
+        self._mtime: int | None = None
+
+        # pair → ([epoch], [price]) за последнее окно
+        self._series: dict[str, tuple[list[float], list[float]]] = {}
+
+        self._reload_if_changed()
+
+    # =========================
+    # public API
+    # =========================
+
+    def subscribe(
+        self,
+        user_id: int,
+        pair: str,
+        kind: str,
+        threshold: float,
+        window_minutes: int | None = None,
+    ) -> dict:
+        if kind not in ALERT_KINDS:
+            raise ValutaTradeError(f"Неизвестный вид оповещения '{kind}'")
+        if not isinstance(threshold, (int, float)) or threshold <= 0:
+            raise ValutaTradeError("Порог оповещения должен быть положительным числом")
+        if kind == "move" and (not isinstance(window_minutes, int) or window_minutes <= 0):
+            raise ValutaTradeError("Окно для 'move' должно быть положительным числом минут")
+
+        with self.lock:
+            self._reload_if_changed()
+
+            alert = {
+                "alert_id": self._next_id,
+                "user_id": user_id,
+                "pair": pair,
+                "kind": kind,
+                "threshold": float(threshold),
+                "window_minutes": window_minutes if kind == "move" else None,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._add(alert)
+            self._save()
+
+        return dict(alert)
+
+    def cancel(self, alert_id: int, user_id: int) -> dict:
+        with self.lock:
+            self._reload_if_changed()
+
+            alert = self._alerts.get(alert_id)
+            if alert is None or alert["user_id"] != user_id:
+                raise ValutaTradeError(f"Оповещение #{alert_id} не найдено")
+
+            self._indexes[alert["pair"]].remove(alert)
+            del self._alerts[alert_id]
+            self._save()
+
+        return alert
+
+    def list_alerts(self, user_id: int) -> list[dict]:
+        self._reload_if_changed()
+        return [dict(a) for a in self._alerts.values() if a["user_id"] == user_id]
+
+    def notifications(self, user_id: int) -> list[dict]:
+        """
+        Уведомления пользователя из outbox (в порядке срабатывания).
+        """
+        if not self.outbox_path.exists():
+            return []
+
+        result = []
+        with open(self.outbox_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["user_id"] == user_id:
+                    result.append(record)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def on_snapshot(self, changed: dict[str, float], updated_at: str) -> list[dict]:
+        """
+        Подписчик RatesStorage: проверяет оповещения изменившихся пар
+        и пишет сработавшие в outbox.
+        """
+        now = _to_epoch(updated_at)
+
+        with self.lock:
+            self._reload_if_changed()
+
+            fired: list[dict] = []
+            for pair, price in changed.items():
+                index = self._indexes.get(pair)
+                self._record_price(pair, now, price, index)
+                if not index:
+                    continue
+
+                for alert_id in index.pop_price_crossed(price):
+                    fired.append(self._notification(alert_id, price, updated_at))
+
+                for window in list(index.moves):
+                    change_pct = self._change_pct(pair, now, window)
+                    if change_pct is None:
+                        continue
+                    for alert_id in index.pop_moved(window, abs(change_pct)):
+                        note = self._notification(alert_id, price, updated_at)
+                        note["change_pct"] = round(change_pct, 4)
+                        fired.append(note)
+
+            if not fired:
+                return []
+
+            self._append_outbox(fired)
+            self._save()
+
+        return fired
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _add(self, alert: dict, keep_sorted: bool = True) -> None:
+        self._alerts[alert["alert_id"]] = alert
+        self._indexes.setdefault(alert["pair"], _PairAlerts()).add(alert, keep_sorted)
+        self._next_id = max(self._next_id, alert["alert_id"] + 1)
+
+    def _notification(self, alert_id: int, price: float, updated_at: str) -> dict:
+        alert = self._alerts.pop(alert_id)
+        return {
+            "alert_id": alert_id,
+            "user_id": alert["user_id"],
+            "pair": alert["pair"],
+            "kind": alert["kind"],
+            "threshold": alert["threshold"],
+            "window_minutes": alert["window_minutes"],
+            "price": price,
+            "triggered_at": updated_at,
+        }
+
+    def _record_price(
+        self,
+        pair: str,
+        now: float,
+        price: float,
+        index: _PairAlerts | None,
+    ) -> None:
+        max_window = index.max_window() if index else 0
+        if not max_window:
+            self._series.pop(pair, None)
+            return
+
+        times, prices = self._series.setdefault(pair, ([], []))
+        times.append(now)
+        prices.append(price)
+
+        # храним ровно одну точку старше окна — опорную цену
+        cut = bisect_left(times, now - max_window * 60)
+        if cut > 1:
+            del times[:cut - 1]
+            del prices[:cut - 1]
+
+    def _change_pct(self, pair: str, now: float, window: int) -> float | None:
+        times, prices = self._series.get(pair, ([], []))
+        if len(times) < 2:
+            return None
+
+        # опорная цена — последняя точка не позже начала окна,
+        # иначе самая старая из известных
+        i = bisect_right(times, now - window * 60) - 1
+        reference = prices[max(i, 0)]
+        return (prices[-1] / reference - 1) * 100
+
+    def _append_outbox(self, notes: list[dict]) -> None:
+        self.outbox_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.outbox_path, "a", encoding="utf-8") as f:
+            for note in notes:
+                f.write(json.dumps(note, ensure_ascii=False) + "\n")
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime == self._mtime:
+            return
+
+        alerts = []
+        if mtime is not None and self.path.stat().st_size:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            alerts = data.get("alerts", [])
+            self._next_id = data.get("next_id", 1)
+
+        self._alerts = {}
+        self._indexes = {}
+        # массовая загрузка: append + одна сортировка вместо insort на каждую
+        for alert in alerts:
+            self._add(alert, keep_sorted=False)
+        for index in self._indexes.values():
+            index.sort()
+
+        self._mtime = mtime
+
+    def _save(self) -> None:
+        data = {"next_id": self._next_id, "alerts": list(self._alerts.values())}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding="utf-8",
+            delete=False,
+            dir=self.path.parent,
+        ) as tmp:
+            json.dump(data, tmp, ensure_ascii=False)
+            temp_name = tmp.name
+
+        os.replace(temp_name, self.path)
+        self._mtime = self.path.stat().st_mtime_ns
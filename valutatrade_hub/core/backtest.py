@@ -0,0 +1,436 @@
+"""
+Бэктест стратегий ребалансировки на истории курсов.
+
+История (exchange_rates.json + архив) выравнивается на сетку времени
+через as-of join (core.valuation), затем на каждом шаге:
+- стратегия получает StepContext и возвращает целевые веса {код: доля}
+  (остаток — деньги в base) или None — ничего не делать;
+- движок ребалансирует симулированный портфель: сначала продажи,
+  затем покупки, с теми же проверками, что buy_currency / sell_currency
+  (положительная сумма, известная валюта, наличие кошелька и средств).
+
+В отличие от живых use case, симуляция ведёт кошелёк base (деньги):
+покупка списывает стоимость, продажа зачисляет выручку.
+
+Прогоны независимы и запускаются параллельно в пуле процессов;
+матрица цен передаётся каждому процессу один раз (initializer).
+Стратегии должны быть picklable: функции модуля или объекты классов.
+"""
+
+import argparse
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from valutatrade_hub.core import valuation
+from valutatrade_hub.core.currencies import get_currency
+from valutatrade_hub.core.exceptions import InsufficientFundsError, ValutaTradeError
+
+
+SECONDS_PER_YEAR = 365 * 86400
+
+
+# =========================
+# prices
+# =========================
+
+@dataclass(frozen=True)
+class PriceMatrix:
+    """
+    Цены валют в base на общей сетке: columns[code][i] — цена в timestamps[i].
+    """
+
+    base: str
+    step: int
+    timestamps: list[float]
+    columns: dict[str, list[float]]
+
+
+def load_prices(
+    codes: list[str] | None = None,
+    days: int = 90,
+    resolution: str = "1d",
+    base: str = "USD",
+) -> PriceMatrix:
+    """
+    Матрица цен из сохранённой истории. Сетка начинается с первой точки,
+    где известны курсы всех валют.
+    """
+    base = get_currency(base).code
+    step = valuation.parse_resolution(resolution)
+    history = valuation.load_rate_history()
+
+    if codes is None:
+        codes = sorted(
+            pair.split("_", 1)[0] for pair in history if pair.endswith(f"_{base}")
+        )
+    codes = [get_currency(c).code for c in codes if c != base]
+    if not codes:
+        raise ValutaTradeError("Нет истории курсов для бэктеста")
+
+    end = time.time() // step * step
+    grid = valuation.make_grid(end - days * 86400, end, step)
+    builder = valuation.ValueCurveBuilder(history, grid, base)
+    columns = {code: [float(v) for v in builder.rates_for(code)] for code in codes}
+
+    first = next(
+        (
+            i for i in range(len(grid))
+            if not any(math.isnan(columns[c][i]) for c in codes)
+        ),
+        None,
+    )
+    if first is None:
+        raise ValutaTradeError("История курсов не покрывает выбранный период")
+
+    return PriceMatrix(
+        base=base,
+        step=step,
+        timestamps=grid[first:],
+        columns={code: column[first:] for code, column in columns.items()},
+    )
+
+
+# =========================
+# simulation
+# =========================
+
+class SimulatedPortfolio:
+    """
+    Портфель бэктеста: деньги в base + кошельки валют.
+    """
+
+    def __init__(self, base: str, cash: float, fee_rate: float = 0.0) -> None:
+        self.base = base
+        self.cash = cash
+        self.fee_rate = fee_rate
+        self.wallets: dict[str, float] = {}
+        self.trades = 0
+        self.fees_paid = 0.0
+
+    def value(self, prices: dict[str, float]) -> float:
+        return self.cash + sum(b * prices[c] for c, b in self.wallets.items())
+
+    def buy(self, currency: str, amount: float, price: float) -> None:
+        if not isinstance(amount, (int, float)) or amount <= 0:
+            raise ValutaTradeError("'amount' должен быть положительным числом")
+        code = get_currency(currency).code
+
+        cost = amount * price
+        fee = cost * self.fee_rate
+        if cost + fee > self.cash:
+            raise InsufficientFundsError(
+                available=round(self.cash, 4),
+                required=round(cost + fee, 4),
+                code=self.base,
+            )
+
+        self.cash -= cost + fee
+        self.wallets[code] = round(self.wallets.get(code, 0.0) + amount, 4)
+        self.trades += 1
+        self.fees_paid += fee
+
+    def sell(self, currency: str, amount: float, price: float) -> None:
+        if not isinstance(amount, (int, float)) or amount <= 0:
+            raise ValutaTradeError("'amount' должен быть положительным числом")
+        code = get_currency(currency).code
+
+        if code not in self.wallets:
+            raise ValutaTradeError(f"У вас нет кошелька '{code}'")
+        before = self.wallets[code]
+        if amount > before:
+            raise InsufficientFundsError(
+                available=round(before, 4),
+                required=round(amount, 4),
+                code=code,
+            )
+
+        proceeds = amount * price
+        fee = proceeds * self.fee_rate
+        self.cash += proceeds - fee
+        self.wallets[code] = round(before - amount, 4)
+        self.trades += 1
+        self.fees_paid += fee
+
+
+class StepContext:
+    """
+    Что видит стратегия на шаге index (только прошлое и настоящее).
+    """
+
+    __slots__ = ("index", "timestamp", "prices", "portfolio", "_matrix")
+
+    def __init__(
+        self,
+        index: int,
+        matrix: PriceMatrix,
+        prices: dict[str, float],
+        portfolio: SimulatedPortfolio,
+    ) -> None:
+        self.index = index
+        self.timestamp = matrix.timestamps[index]
+        self.prices = prices
+        self.portfolio = portfolio
+        self._matrix = matrix
+
+    def history(self, code: str, lookback: int) -> list[float]:
+        """
+        Последние lookback + 1 цен валюты, включая текущую.
+        """
+        start = max(0, self.index - lookback)
+        return self._matrix.columns[code][start:self.index + 1]
+
+
+# стратегия: контекст шага → целевые веса {код: доля} или None
+Strategy = Callable[[StepContext], dict[str, float] | None]
+
+
+def _rebalance(
+    portfolio: SimulatedPortfolio,
+    weights: dict[str, float],
+    prices: dict[str, float],
+) -> int:
+    """
+    Приводит портфель к целевым весам. Возвращает число отклонённых заявок.
+    Валюта вне матрицы цен (prices) — ошибка стратегии.
+    """
+    unknown = sorted(set(weights) - set(prices))
+    if unknown:
+        raise ValutaTradeError(
+            f"Стратегия вернула веса для валют вне матрицы цен: {', '.join(unknown)}; "
+            f"доступны: {', '.join(sorted(prices))}"
+        )
+
+    total = portfolio.value(prices)
+    rejected = 0
+
+    deltas = {}
+    for code in set(weights) | set(portfolio.wallets):
+        target = total * weights.get(code, 0.0) / prices[code]
+        delta = round(target - portfolio.wallets.get(code, 0.0), 4)
+        if delta:
+            deltas[code] = delta
+
+    # сначала продажи: освобождают деньги под покупки
+    for code, delta in sorted(deltas.items(), key=lambda item: item[1]):
+        try:
+            if delta < 0:
+                portfolio.sell(code, -delta, prices[code])
+            else:
+                # комиссия и округление не должны приводить к отказу
+                affordable = portfolio.cash / (prices[code] * (1 + portfolio.fee_rate))
+                amount = min(delta, math.floor(affordable * 10_000) / 10_000)
+                if amount > 0:
+                    portfolio.buy(code, amount, prices[code])
+        except ValutaTradeError:
+            rejected += 1
+
+    return rejected
+
+
+def _metrics(values: list[float], step: int) -> dict[str, float]:
+    returns = [b / a - 1 for a, b in zip(values, values[1:]) if a]
+    periods_per_year = SECONDS_PER_YEAR / step
+
+    volatility = statistics.pstdev(returns) if len(returns) > 1 else 0.0
+    mean = statistics.fmean(returns) if returns else 0.0
+
+    peak = values[0]
+    max_drawdown = 0.0
+    for v in values:
+        peak = max(peak, v)
+        if peak:
+            max_drawdown = max(max_drawdown, 1 - v / peak)
+
+    return {
+        "total_return": round(values[-1] / values[0] - 1, 6) if values[0] else 0.0,
+        "volatility": round(volatility * math.sqrt(periods_per_year), 6),
+        "sharpe": (
+            round(mean / volatility * math.sqrt(periods_per_year), 4)
+            if volatility else 0.0
+        ),
+        "max_drawdown": round(max_drawdown, 6),
+    }
+
+
+def run_backtest(
+    strategy: Strategy,
+    matrix: PriceMatrix,
+    initial_cash: float = 10_000.0,
+    fee_rate: float = 0.0,
+) -> dict[str, Any]:
+    portfolio = SimulatedPortfolio(matrix.base, initial_cash, fee_rate)
+    codes = list(matrix.columns)
+
+    values = []
+    rejected = 0
+
+    for i in range(len(matrix.timestamps)):
+        prices = {code: matrix.columns[code][i] for code in codes}
+
+        weights = strategy(StepContext(i, matrix, prices, portfolio))
+        if weights is not None:
+            if any(w < 0 for w in weights.values()) or sum(weights.values()) > 1 + 1e-9:
+                raise ValutaTradeError("Веса стратегии должны быть >= 0 и в сумме <= 1")
+            rejected += _rebalance(portfolio, weights, prices)
+
+        values.append(portfolio.value(prices))
+
+    return {
+        "final_value": round(values[-1], 2),
+        "trades": portfolio.trades,
+        "rejected": rejected,
+        "fees_paid": round(portfolio.fees_paid, 2),
+        "steps": len(values),
+        **_metrics(values, matrix.step),
+    }
+
+
+# =========================
+# strategies
+# =========================
+
+class FixedWeights:
+    """
+    Постоянные веса; ребалансировка каждые `every` шагов
+    (every=0 — купить на первом шаге и держать).
+    """
+
+    def __init__(self, weights: dict[str, float], every: int = 1) -> None:
+        self.weights = weights
+        self.every = every
+
+    def __call__(self, ctx: StepContext) -> dict[str, float] | None:
+        if ctx.index == 0 or (self.every and ctx.index % self.every == 0):
+            return self.weights
+        return None
+
+    def __repr__(self) -> str:
+        return f"FixedWeights({self.weights}, every={self.every})"
+
+
+class Momentum:
+    """
+    Поровну в `top` валют с лучшей доходностью за lookback шагов.
+    """
+
+    def __init__(self, lookback: int, top: int = 1) -> None:
+        self.lookback = lookback
+        self.top = top
+
+    def __call__(self, ctx: StepContext) -> dict[str, float] | None:
+        if ctx.index < self.lookback:
+            return None
+
+        scores = {}
+        for code in ctx.prices:
+            window = ctx.history(code, self.lookback)
+            scores[code] = window[-1] / window[0] - 1
+
+        best = sorted(scores, key=scores.get, reverse=True)[:self.top]
+        return {code: 1 / len(best) for code in best}
+
+    def __repr__(self) -> str:
+        return f"Momentum(lookback={self.lookback}, top={self.top})"
+
+
+# =========================
+# parallel runs
+# =========================
+
+@dataclass(frozen=True)
+class BacktestRun:
+    name: str
+    strategy: Strategy
+    initial_cash: float = 10_000.0
+    fee_rate: float = 0.0
+
+
+_worker_matrix: PriceMatrix | None = None
+
+
+def _init_worker(matrix: PriceMatrix) -> None:
+    global _worker_matrix
+    _worker_matrix = matrix
+
+
+def _run_in_worker(run: BacktestRun) -> dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        result = run_backtest(run.strategy, _worker_matrix, run.initial_cash, run.fee_rate)
+    except ValutaTradeError as e:
+        result = {"error": str(e)}
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return {"name": run.name, **result}
+
+
+def run_many(
+    runs: list[BacktestRun],
+    matrix: PriceMatrix,
+    processes: int | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Запускает прогоны в пуле процессов; результаты — в порядке runs.
+    processes=1 — последовательно в текущем процессе.
+    """
+    if processes == 1:
+        _init_worker(matrix)
+        return [_run_in_worker(run) for run in runs]
+
+    with ProcessPoolExecutor(
+        max_workers=processes or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(matrix,),
+    ) as pool:
+        return list(pool.map(_run_in_worker, runs))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бэктест стратегий ребалансировки")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--resolution", default="1d")
+    parser.add_argument("--base", default="USD")
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        matrix = load_prices(days=args.days, resolution=args.resolution, base=args.base)
+    except ValutaTradeError as e:
+        print(f"❌ {e}")
+        return
+
+    codes = list(matrix.columns)
+    equal = {code: 1 / len(codes) for code in codes}
+
+    runs = [BacktestRun("hold-equal", FixedWeights(equal, every=0), fee_rate=args.fee)]
+    runs += [
+        BacktestRun(f"rebalance-{every}", FixedWeights(equal, every), fee_rate=args.fee)
+        for every in (1, 7, 30)
+    ]
+    runs += [
+        BacktestRun(f"momentum-{lookback}", Momentum(lookback), fee_rate=args.fee)
+        for lookback in (3, 7, 14)
+    ]
+
+    results = run_many(runs, matrix, args.processes)
+
+    print(f"{len(matrix.timestamps)} steps, {len(codes)} currencies, base {matrix.base}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['name']:<14} ❌ {r['error']}")
+            continue
+        print(
+            f"{r['name']:<14} final={r['final_value']:>12.2f} "
+            f"return={r['total_return']:+.2%} vol={r['volatility']:.2%} "
+            f"sharpe={r['sharpe']:+.2f} mdd={r['max_drawdown']:.2%} "
+            f"trades={r['trades']} ({r['elapsed_ms']} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Массовый импорт пользователей из CSV / JSONL.
+
+register_user на каждого пользователя переписывает users.json и шард
+и заново проверяет дубликаты — для сотен тысяч строк это квадратично.
+Импорт идёт в два шага:
+- без блокировки: имена существующих пользователей (вместе с холодным
+  хранилищем) собираются в множество, строки входного файла читаются
+  потоково и проверяются по нему, пароли хешируются пачками в пуле
+  процессов; готовые записи — во временный JSONL-файл;
+- под lock users.json: текущие пользователи потоково переносятся во
+  временный users.json, за ними — новые (имена, занятые за время
+  импорта, уходят в ошибки), затем rename; пустые портфели — одна
+  запись на шард.
+
+Ошибочные строки не прерывают импорт: они собираются в отчёт
+<файл>.errors.jsonl ({"line", "username", "error"}).
+
+Вход — CSV с колонками username,password[,registration_date]
+или JSON Lines с теми же ключами.
+"""
+
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator
+
+from valutatrade_hub.core import usecases
+from valutatrade_hub.core.exceptions import ValutaTradeError
+from valutatrade_hub.core.models import User
+
+
+BATCH_SIZE = 20_000
+PROGRESS_EVERY = 50_000
+
+
+def iter_rows(path: Path) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+    (номер строки, запись, ошибка разбора) по одной строке файла.
+    """
+    path = Path(path)
+
+    if path.suffix.lower() == ".csv":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or "username" not in reader.fieldnames:
+                raise ValutaTradeError("CSV должен содержать колонки username,password")
+            for row in reader:
+                yield reader.line_num, row, None
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"некорректный JSON: {e.msg}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "ожидался JSON-объект"
+                continue
+            yield line_no, row, None
+
+
+def _validate(row: dict, taken: set[str]) -> str | None:
+    username = row.get("username")
+    password = row.get("password")
+
+    if not isinstance(username, str) or not username.strip():
+        return "Имя пользователя не может быть пустым"
+    if not isinstance(password, str) or len(password) < 4:
+        return "Пароль должен быть не короче 4 символов"
+    if username in taken:
+        return f"Имя пользователя '{username}' уже занято"
+
+    registration_date = row.get("registration_date")
+    if registration_date:
+        try:
+            datetime.fromisoformat(registration_date)
+        except (TypeError, ValueError):
+            return f"Некорректная дата регистрации '{registration_date}'"
+    return None
+
+
+def _hash_chunk(chunk: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """
+    (пароль, соль) → (хеш, соль); выполняется в воркере пула.
+    """
+    result = []
+    for password, salt in chunk:
+        result.append((User.hash_password(password, salt), salt))
+    return result
+
+
+class _UsersWriter:
+    """
+    Временный users.json, в который пишутся существующие и новые записи.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._tmp = tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding="utf-8",
+            delete=False,
+            dir=path.parent,
+        )
+        self._tmp.write("[")
+        self._first = True
+
+    def write(self, record: dict) -> None:
+        self._tmp.write("\n    " if self._first else ",\n    ")
+        self._tmp.write(json.dumps(record, ensure_ascii=False))
+        self._first = False
+
+    def commit(self) -> None:
+        self._tmp.write("\n]\n")
+        self._tmp.close()
+        os.replace(self._tmp.name, self.path)
+
+    def abort(self) -> None:
+        self._tmp.close()
+        os.unlink(self._tmp.name)
+
+
+def import_users(
+    path: Path,
+    workers: int | None = None,
+    errors_path: Path | None = None,
+    progress: Callable[[dict], None] | None = None,
+) -> dict:
+    """
+    Импортирует пользователей из path. Возвращает счётчики
+    {"rows", "imported", "errors", "elapsed_s", "errors_path"};
+    progress вызывается каждые PROGRESS_EVERY строк.
+
+    Проверка строк и хеширование (долгая часть) идут без блокировки
+    users.json: готовые записи копятся во временном JSONL-файле. Под
+    lock остаётся только слияние с текущим users.json и rename —
+    регистрация и вход ждут секунды, а не весь импорт.
+    """
+    path = Path(path)
+    errors_path = Path(errors_path) if errors_path else path.with_name(path.name + ".errors.jsonl")
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    stats = {"rows": 0, "imported": 0, "errors": 0}
+    new_ids: list[int] = []
+
+    cold = usecases.get_cold_store()
+    store = usecases._portfolios
+
+    with open(errors_path, "w", encoding="utf-8") as errors, \
+            tempfile.TemporaryFile(mode="w+", encoding="utf-8", dir=errors_path.parent) as spool:
+
+        def report(line_no: int, username: str | None, error: str) -> None:
+            stats["errors"] += 1
+            errors.write(json.dumps(
+                {"line": line_no, "username": username, "error": error},
+                ensure_ascii=False,
+            ) + "\n")
+
+        # 1. проверка и хеширование — без блокировки
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            taken = {u["username"] for u in usecases.iter_users()}
+            taken.update(cold.usernames())
+
+            def flush(batch: list[tuple[int, dict]]) -> None:
+                if not batch:
+                    return
+
+                pairs = [(r["password"], User.generate_salt()) for _, r in batch]
+                size = max(1, -(-len(pairs) // workers))
+                chunks = [pairs[i:i + size] for i in range(0, len(pairs), size)]
+
+                hashed = [h for chunk in pool.map(_hash_chunk, chunks) for h in chunk]
+                now = datetime.now().isoformat()
+
+                for (line_no, row), (hashed_password, salt) in zip(batch, hashed):
+                    spool.write(json.dumps({
+                        "line": line_no,
+                        "username": row["username"],
+                        "hashed_password": hashed_password,
+                        "salt": salt,
+                        "registration_date": row.get("registration_date") or now,
+                    }, ensure_ascii=False) + "\n")
+
+                batch.clear()
+
+            batch: list[tuple[int, dict]] = []
+            for line_no, row, error in iter_rows(path):
+                stats["rows"] += 1
+
+                error = error or _validate(row, taken)
+                if error:
+                    report(line_no, row.get("username") if isinstance(row, dict) else None, error)
+                else:
+                    taken.add(row["username"])
+                    batch.append((line_no, row))
+
+                if len(batch) >= BATCH_SIZE:
+                    flush(batch)
+                if progress and stats["rows"] % PROGRESS_EVERY == 0:
+                    progress({**stats, "elapsed_s": time.perf_counter() - started})
+
+            flush(batch)
+            del taken
+
+        # 2. слияние под lock: пока шёл импорт, могли зарегистрироваться
+        # новые пользователи — имена и max user_id берутся заново
+        with usecases._users_lock():
+            writer = _UsersWriter(usecases.USERS_FILE)
+            try:
+                taken = set(cold.usernames())
+                max_id = cold.max_user_id
+                for u in usecases.iter_users():
+                    writer.write(u)
+                    taken.add(u["username"])
+                    max_id = max(max_id, u["user_id"])
+
+                spool.seek(0)
+                for line in spool:
+                    record = json.loads(line)
+                    line_no = record.pop("line")
+                    if record["username"] in taken:
+                        report(line_no, record["username"],
+                               f"Имя пользователя '{record['username']}' уже занято")
+                        continue
+
+                    max_id += 1
+                    taken.add(record["username"])
+                    writer.write({"user_id": max_id, **record})
+                    new_ids.append(max_id)
+            except BaseException:
+                writer.abort()
+                raise
+
+            # сначала пользователи, затем портфели: прерванный импорт не
+            # оставляет портфелей с id, которые будут выданы повторно
+            writer.commit()
+
+        stats["imported"] = len(new_ids)
+
+        shards: dict[Path, list[int]] = {}
+        for user_id in new_ids:
+            shards.setdefault(store.path_for(user_id), []).append(user_id)
+
+        for user_ids in shards.values():
+            with store.writing(user_ids[0]) as shard_path:
+                portfolios = usecases._load_json(shard_path) or []
+                portfolios.extend({"user_id": uid, "wallets": {}} for uid in user_ids)
+                usecases._save_json(shard_path, portfolios)
+            usecases._record_portfolio_changes(user_ids, "upsert")
+
+    if not stats["errors"]:
+        errors_path.unlink()
+
+    stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+    stats["errors_path"] = str(errors_path) if stats["errors"] else None
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import users from CSV / JSONL")
+    parser.add_argument("path", type=Path, help="файл .csv или .jsonl")
+    parser.add_argument("--workers", type=int, default=None, help="процессов для хеширования")
+    parser.add_argument("--errors", type=Path, default=None, help="отчёт об ошибках (JSONL)")
+    args = parser.parse_args()
+
+    def progress(s: dict) -> None:
+        print(
+            f"... строк: {s['rows']}, импортировано: {s['imported']}, "
+            f"ошибок: {s['errors']} ({s['elapsed_s']:.1f} с)"
+        )
+
+    r = import_users(args.path, args.workers, args.errors, progress)
+    print(
+        f"Готово: строк {r['rows']}, импортировано {r['imported']}, "
+        f"ошибок {r['errors']} за {r['elapsed_s']} с"
+    )
+    if r["errors"]:
+        print(f"Ошибки по строкам: {r['errors_path']}")
+
+
+if __name__ == "__main__":
+    main()
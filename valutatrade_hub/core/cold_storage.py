@@ -0,0 +1,188 @@
+"""
+Холодное хранилище неактивных аккаунтов.
+
+users.json и шарды портфелей держат только активных пользователей;
+аккаунты без активности дольше ARCHIVE_INACTIVE_DAYS переносятся сюда
+(usecases.archive_dormant_users) и возвращаются при входе.
+
+Файлы в data/cold/:
+- <run>-XX.jsonl.gz — сжатые записи {"user": ..., "portfolio": ...},
+                      один сегмент на шард за прогон архивации;
+- index.json        — {"max_user_id": n, "users": {username: {"user_id", "segment"}}}.
+
+Поиск при входе — словарь индекса, затем чтение одного небольшого
+сегмента. max_user_id нужен регистрации: id архивных пользователей
+не выдаются повторно.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from valutatrade_hub.infra.locks import FileLock
+
+
+class ColdStore:
+    def __init__(self, directory: Path, lock_path: Path | None = None) -> None:
+        self.directory = Path(directory)
+        self.index_path = self.directory / "index.json"
+        self.lock = FileLock(lock_path or self.directory / "index.lock")
+
+        self._users: dict[str, dict] = {}
+        self._max_user_id = 0
+        self._mtime: int | None = None
+
+    # =========================
+    # read
+    # =========================
+
+    def get(self, username: str) -> dict | None:
+        """
+        Архивная запись {"user", "portfolio"} или None.
+
+        Под lock индекса: remove удаляет сегмент без ссылок, и чтение
+        не должно застать его посередине.
+        """
+        with self.lock:
+            self._reload_if_changed()
+            entry = self._users.get(username)
+            if entry is None:
+                return None
+
+            with gzip.open(self.directory / entry["segment"], "rt", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record["user"]["user_id"] == entry["user_id"]:
+                        return record
+        return None
+
+    def __contains__(self, username: str) -> bool:
+        self._reload_if_changed()
+        return username in self._users
+
+    def __len__(self) -> int:
+        self._reload_if_changed()
+        return len(self._users)
+
+    def usernames(self) -> set[str]:
+        self._reload_if_changed()
+        return set(self._users)
+
+    @property
+    def max_user_id(self) -> int:
+        self._reload_if_changed()
+        return self._max_user_id
+
+    # =========================
+    # write
+    # =========================
+
+    def put(self, records: list[dict], segment: str) -> None:
+        """
+        Записывает сегмент и только затем ссылается на него из индекса.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{segment}.jsonl.gz"
+
+        with tempfile.NamedTemporaryFile(delete=False, dir=self.directory) as tmp:
+            with gzip.GzipFile(fileobj=tmp, mode="wb") as gz:
+                for record in records:
+                    gz.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            temp_name = tmp.name
+        os.replace(temp_name, self.directory / name)
+
+        with self.lock:
+            self._reload_if_changed()
+            for record in records:
+                user = record["user"]
+                self._users[user["username"]] = {"user_id": user["user_id"], "segment": name}
+                self._max_user_id = max(self._max_user_id, user["user_id"])
+            self._save()
+
+    def remove(self, username: str) -> None:
+        """
+        Убирает пользователя из индекса (после возврата в горячие файлы).
+        Сегмент без ссылок удаляется.
+        """
+        with self.lock:
+            self._reload_if_changed()
+            entry = self._users.pop(username, None)
+            if entry is None:
+                return
+            self._save()
+
+            if not any(e["segment"] == entry["segment"] for e in self._users.values()):
+                try:
+                    (self.directory / entry["segment"]).unlink()
+                except FileNotFoundError:
+                    pass
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = self.index_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime == self._mtime:
+            return
+
+        data = {}
+        if mtime is not None:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+        self._users = data.get("users", {})
+        self._max_user_id = data.get("max_user_id", 0)
+        self._mtime = mtime
+
+    def _save(self) -> None:
+        data = {"max_user_id": self._max_user_id, "users": self._users}
+
+        with tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding="utf-8",
+            delete=False,
+            dir=self.directory,
+        ) as tmp:
+            json.dump(data, tmp, ensure_ascii=False)
+            temp_name = tmp.name
+
+        os.replace(temp_name, self.index_path)
+        self._mtime = self.index_path.stat().st_mtime_ns
+
+
+def main() -> None:
+    from valutatrade_hub.core import usecases
+
+    parser = argparse.ArgumentParser(description="Archive dormant accounts to cold storage")
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=None,
+        help="порог неактивности в днях (по умолчанию ARCHIVE_INACTIVE_DAYS)",
+    )
+    parser.add_argument(
+        "--empty-only",
+        action="store_true",
+        help="архивировать только аккаунты с нулевыми кошельками",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать")
+    args = parser.parse_args()
+
+    r = usecases.archive_dormant_users(args.days, args.empty_only, args.dry_run)
+    print(
+        f"Неактивных более {r['inactive_days']} дн.: {r['dormant']}, "
+        f"перенесено в холодное хранилище: {r['archived']}, "
+        f"в горячих файлах: {r['active']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -124,6 +124,16 @@ _CURRENCY_REGISTRY: Dict[str, Currency] = {
         code="EUR",
         issuing_country="Eurozone",
     ),
+    "GBP": FiatCurrency(
+        name="British Pound",
+        code="GBP",
+        issuing_country="United Kingdom",
+    ),
+    "RUB": FiatCurrency(
+        name="Russian Ruble",
+        code="RUB",
+        issuing_country="Russia",
+    ),
     "BTC": CryptoCurrency(
         name="Bitcoin",
         code="BTC",
@@ -136,6 +146,12 @@ _CURRENCY_REGISTRY: Dict[str, Currency] = {
         algorithm="Ethash",
         market_cap=4.5e11,
     ),
+    "SOL": CryptoCurrency(
+        name="Solana",
+        code="SOL",
+        algorithm="Proof of History",
+        market_cap=8.0e10,
+    ),
 }
 
 
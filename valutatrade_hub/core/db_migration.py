@@ -0,0 +1,456 @@
+"""
+Потоковая миграция JSON-хранилища в SQLite (infra.database).
+
+Источники: users.json, портфели (шарды), история курсов — архивные
+сегменты (data/archive, parser_service.archive) и exchange_rates.json.
+- записи читаются потоково (iter_json_array): память ограничена
+  размером пачки, а не размером файлов;
+- проход читает не живые файлы, а их snapshot (<db>.snapshot/<источник>):
+  жёсткие ссылки на текущие inode, снятые в начале прохода (копия, если
+  ссылка невозможна). Все файлы хранилища заменяются атомарно (rename),
+  поэтому содержимое snapshot не меняется, пока приложение пишет.
+  История курсов снимается под lock истории: перенос в архив не
+  попадает в snapshot наполовину;
+- вставка — пачками по MIGRATION_BATCH_SIZE, каждая пачка — одна
+  транзакция вместе с отметкой позиции в migration_state; позиция
+  отсчитывается в snapshot прохода, поэтому прерванная миграция
+  продолжается с последней пачки без дублей и пропусков, даже если
+  файлы за это время перезаписаны, перешардированы или в них удалены
+  записи;
+- контрольная сумма — сумма blake2b-хешей канонического JSON записей
+  (не зависит от порядка, хранится между запусками как число);
+- проверка (verify) заново считает число записей и сумму по snapshot
+  прохода и по таблицам и сравнивает их; snapshot удаляется после
+  успешной проверки. Без snapshot (удалён) сравниваются живые файлы:
+  пока приложение пишет, расхождение с ними ожидаемо.
+
+Файлы только читаются: приложение продолжает работать.
+Изменения, сделанные после снятия snapshot, переносит повторный запуск
+с --restart.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from valutatrade_hub.infra import database
+from valutatrade_hub.infra.json_stream import iter_json_array
+from valutatrade_hub.parser_service.archive import RateSegment
+
+
+CHECKSUM_MOD = 2 ** 61
+
+
+def _digest(record: dict) -> int:
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return int.from_bytes(hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+@dataclass(frozen=True)
+class Source:
+    name: str
+    table: str
+    columns: tuple[str, ...]
+    # текущие файлы источника (JSON-массивы записей), по порядку
+    paths: Callable[[], list[Path]]
+    # запись файла → нормализованная запись (её хеш и идёт в сумму)
+    normalize: Callable[[dict], dict]
+    to_row: Callable[[dict], tuple]
+    from_row: Callable[[tuple], dict]
+    # lock, под которым снимается snapshot (файлы, меняющиеся вместе)
+    snapshot_lock: Callable[[], Any] | None = None
+
+
+def _iter_records(paths: list[Path]) -> Iterator[dict]:
+    """
+    Записи файлов: JSON-массивы и архивные сегменты курсов (.seg; пара —
+    имя каталога сегмента, в snapshot — часть имени файла).
+    """
+    for path in paths:
+        if path.suffix == ".seg":
+            with RateSegment(path) as segment:
+                yield from segment.records(_segment_pair(path))
+        else:
+            yield from iter_json_array(path)
+
+
+def _segment_pair(path: Path) -> str:
+    # живой сегмент: archive/<PAIR>/<first>-<last>.seg;
+    # в snapshot: NNNN-<PAIR>-<first>-<last>.seg
+    if path.name.count("-") == 1:
+        return path.parent.name
+    return path.name.split("-", 2)[1]
+
+
+def _user(record: dict) -> dict:
+    return {
+        "user_id": record["user_id"],
+        "username": record["username"],
+        "hashed_password": record["hashed_password"],
+        "salt": record["salt"],
+        "registration_date": record["registration_date"],
+    }
+
+
+def _portfolio(record: dict) -> dict:
+    return {"user_id": record["user_id"], "wallets": record.get("wallets", {})}
+
+
+def _rate(record: dict) -> dict:
+    return {
+        "id": record["id"],
+        "from_currency": record["from_currency"],
+        "to_currency": record["to_currency"],
+        "rate": float(record["rate"]),
+        "timestamp": record["timestamp"],
+        "source": record.get("source"),
+        "meta": record.get("meta") or {},
+    }
+
+
+def sources() -> list[Source]:
+    from valutatrade_hub.core import usecases
+    from valutatrade_hub.parser_service.storage import RatesStorage
+
+    user_columns = ("user_id", "username", "hashed_password", "salt", "registration_date")
+    rate_columns = ("id", "from_currency", "to_currency", "rate", "timestamp", "source", "meta")
+    rates = RatesStorage()
+    store = usecases._portfolios
+
+    def history_paths() -> list[Path]:
+        # архив (старше ARCHIVE_AFTER_DAYS), затем горячий файл
+        segments = [
+            path
+            for pair in rates.archive.pairs()
+            for path in rates.archive.segments(pair)
+        ]
+        return segments + [rates.history_path]
+
+    return [
+        Source(
+            name="users",
+            table="users",
+            columns=user_columns,
+            paths=lambda: [usecases.USERS_FILE],
+            normalize=_user,
+            to_row=lambda r: tuple(r[c] for c in user_columns),
+            from_row=lambda row: dict(zip(user_columns, row)),
+        ),
+        Source(
+            name="portfolios",
+            table="portfolios",
+            columns=("user_id", "wallets"),
+            paths=store.shard_paths,
+            normalize=_portfolio,
+            to_row=lambda r: (r["user_id"], json.dumps(r["wallets"], ensure_ascii=False)),
+            from_row=lambda row: {"user_id": row[0], "wallets": json.loads(row[1])},
+        ),
+        Source(
+            name="rate_history",
+            table="rate_history",
+            columns=rate_columns,
+            paths=history_paths,
+            # перенос в архив пишет сегменты и укорачивает историю под этим lock
+            snapshot_lock=lambda: rates.history_lock,
+            normalize=_rate,
+            to_row=lambda r: tuple(
+                json.dumps(r[c], ensure_ascii=False) if c == "meta" else r[c]
+                for c in rate_columns
+            ),
+            from_row=lambda row: {
+                **dict(zip(rate_columns, row)),
+                "meta": json.loads(row[-1]) if row[-1] else {},
+            },
+        ),
+    ]
+
+
+# =========================
+# migrate
+# =========================
+
+def _load_state(conn: sqlite3.Connection, name: str) -> dict | None:
+    row = conn.execute(
+        "SELECT position, checksum, layout, completed_at FROM migration_state WHERE source = ?",
+        (name,),
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(("position", "checksum", "layout", "completed_at"), row))
+
+
+def _commit(
+    conn: sqlite3.Connection,
+    source: Source,
+    rows: list[tuple],
+    state: dict[str, Any],
+) -> None:
+    """
+    Пачка и отметка позиции — одной транзакцией.
+    """
+    columns = ", ".join(source.columns)
+    marks = ", ".join("?" for _ in source.columns)
+
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {source.table} ({columns}) VALUES ({marks})",
+            rows,
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO migration_state "
+            "(source, position, checksum, layout, completed_at) VALUES (?, ?, ?, ?, ?)",
+            (
+                source.name,
+                state["position"],
+                state["checksum"],
+                state["layout"],
+                state["completed_at"],
+            ),
+        )
+
+
+def _take_snapshot(source: Source, directory: Path) -> dict:
+    """
+    Снимает snapshot файлов источника в directory: {"id", "files"}.
+    snapshot.json пишется последним: каталог без него — недоснятый.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+
+    files = []
+    with source.snapshot_lock() if source.snapshot_lock else nullcontext():
+        for i, path in enumerate(source.paths()):
+            name = path.name
+            if path.suffix == ".seg":
+                name = f"{path.parent.name}-{name}"
+            target = directory / f"{i:04d}-{name}"
+            try:
+                os.link(path, target)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                # другая ФС / нет жёстких ссылок: копия открытого inode
+                # так же не видит последующих rename
+                shutil.copyfile(path, target)
+            files.append(target.name)
+
+    snapshot = {"id": datetime.now(timezone.utc).isoformat(), "files": files}
+    with open(directory / "snapshot.json", "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=4)
+    return snapshot
+
+
+def _load_snapshot(directory: Path) -> dict | None:
+    try:
+        with open(directory / "snapshot.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def migrate_source(
+    conn: sqlite3.Connection,
+    source: Source,
+    batch_size: int,
+    snapshot_dir: Path,
+    restart: bool = False,
+    progress: Callable[[str, int], None] | None = None,
+) -> dict:
+    """
+    Перенос одного источника. snapshot_dir — каталог snapshot этого
+    источника; id snapshot хранится в migration_state.layout, и позиция
+    действительна только для него.
+    """
+    state = _load_state(conn, source.name)
+
+    if state and state["completed_at"] and not restart:
+        return {"source": source.name, "status": "done", "records": state["position"]}
+
+    snapshot = _load_snapshot(snapshot_dir)
+    resumed = (
+        bool(state) and not restart
+        and snapshot is not None and state["layout"] == snapshot["id"]
+    )
+    if not resumed:
+        # новый проход: таблица собирается заново (удалённое в файлах
+        # не должно остаться в базе)
+        with conn:
+            conn.execute(f"DELETE FROM {source.table}")
+        snapshot = _take_snapshot(source, snapshot_dir)
+        state = {"position": 0, "checksum": 0, "layout": snapshot["id"]}
+
+    state = {**state, "completed_at": None}
+    skip = state["position"]
+
+    paths = [snapshot_dir / name for name in snapshot["files"]]
+    rows: list[tuple] = []
+    for i, record in enumerate(_iter_records(paths)):
+        if i < skip:
+            continue
+
+        normalized = source.normalize(record)
+        rows.append(source.to_row(normalized))
+        state["checksum"] = (state["checksum"] + _digest(normalized)) % CHECKSUM_MOD
+        state["position"] = i + 1
+
+        if len(rows) >= batch_size:
+            _commit(conn, source, rows, state)
+            rows = []
+            if progress:
+                progress(source.name, state["position"])
+
+    state["completed_at"] = datetime.now(timezone.utc).isoformat()
+    _commit(conn, source, rows, state)
+    # snapshot остаётся до успешной проверки (verify)
+
+    return {
+        "source": source.name,
+        "status": "resumed" if resumed and skip else "migrated",
+        "records": state["position"],
+        "resumed_from": skip if resumed else 0,
+    }
+
+
+def _snapshots_dir(db_path: Path) -> Path:
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.name}.snapshot")
+
+
+def migrate(
+    db_path: Path,
+    batch_size: int,
+    restart: bool = False,
+    progress: Callable[[str, int], None] | None = None,
+) -> list[dict]:
+    snapshots = _snapshots_dir(db_path)
+
+    conn = database.connect(db_path)
+    try:
+        return [
+            migrate_source(conn, source, batch_size, snapshots / source.name, restart, progress)
+            for source in sources()
+        ]
+    finally:
+        conn.close()
+
+
+# =========================
+# verify
+# =========================
+
+def verify(db_path: Path) -> list[dict]:
+    """
+    Число записей и контрольная сумма: snapshot прохода против таблиц.
+
+    Если snapshot источника уже удалён (или снят не для перенесённого
+    прохода), сравниваются живые файлы ("against": "files"): изменения,
+    сделанные приложением после прохода, дают ожидаемое расхождение.
+    """
+    snapshots = _snapshots_dir(db_path)
+    conn = database.connect(db_path)
+    report = []
+
+    try:
+        for source in sources():
+            state = _load_state(conn, source.name)
+            snapshot_dir = snapshots / source.name
+            snapshot = _load_snapshot(snapshot_dir)
+
+            if snapshot and state and state["layout"] == snapshot["id"]:
+                against = "snapshot"
+                paths = [snapshot_dir / name for name in snapshot["files"]]
+            else:
+                against = "files"
+                paths = source.paths()
+
+            file_count, file_sum = 0, 0
+            for record in _iter_records(paths):
+                file_count += 1
+                file_sum = (file_sum + _digest(source.normalize(record))) % CHECKSUM_MOD
+
+            db_count, db_sum = 0, 0
+            cursor = conn.execute(f"SELECT {', '.join(source.columns)} FROM {source.table}")
+            for row in cursor:
+                db_count += 1
+                db_sum = (db_sum + _digest(source.from_row(row))) % CHECKSUM_MOD
+
+            report.append({
+                "source": source.name,
+                "against": against,
+                "file_count": file_count,
+                "db_count": db_count,
+                "checksum_ok": file_sum == db_sum,
+                "ok": file_count == db_count and file_sum == db_sum,
+            })
+    finally:
+        conn.close()
+
+    return report
+
+
+def remove_snapshots(db_path: Path) -> None:
+    shutil.rmtree(_snapshots_dir(db_path), ignore_errors=True)
+
+
+def main() -> None:
+    from valutatrade_hub.infra.settings import SettingsLoader
+
+    settings = SettingsLoader()
+
+    parser = argparse.ArgumentParser(description="Migrate JSON storage to SQLite")
+    parser.add_argument("--db", type=Path, default=settings.get("DATABASE_FILE"))
+    parser.add_argument("--batch-size", type=int, default=settings.get("MIGRATION_BATCH_SIZE"))
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="перенести всё заново (в т.ч. изменения после прошлого прохода)",
+    )
+    parser.add_argument("--verify-only", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verify_only:
+        started = time.perf_counter()
+
+        def progress(name: str, position: int) -> None:
+            print(f"... {name}: {position} ({time.perf_counter() - started:.1f} с)")
+
+        for r in migrate(args.db, args.batch_size, args.restart, progress):
+            if r["status"] == "done":
+                print(f"{r['source']}: уже перенесено ({r['records']}), пропуск")
+            elif r["status"] == "resumed":
+                print(f"{r['source']}: {r['records']} записей (продолжено с {r['resumed_from']})")
+            else:
+                print(f"{r['source']}: {r['records']} записей")
+
+    failed = False
+    for r in verify(args.db):
+        status = "OK" if r["ok"] else "РАСХОЖДЕНИЕ"
+        against = "snapshot прохода" if r["against"] == "snapshot" else "живые файлы"
+        print(
+            f"verify {r['source']} ({against}): файлы {r['file_count']}, база {r['db_count']}, "
+            f"контрольная сумма {'совпадает' if r['checksum_ok'] else 'не совпадает'} — {status}"
+        )
+        if not r["ok"] and r["against"] == "files":
+            print(
+                "  сравнение с живыми файлами: записи, сделанные приложением "
+                "после переноса, дают расхождение; перенести их — --restart"
+            )
+        failed = failed or not r["ok"]
+
+    if failed:
+        raise SystemExit(1)
+    # проверено — snapshot больше не нужен
+    remove_snapshots(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -53,3 +53,15 @@ class ApiRequestError(ValutaTradeError):
         self.reason = reason
         super().__init__(f"Ошибка при обращении к внешнему API: {reason}")
 
+
+
+class StorageCorruptedError(ValutaTradeError):
+    """
+    Файл хранилища повреждён (обрезан, битый JSON, неверная структура).
+    Выбрасывается вместо молчаливой подмены данных на "пусто".
+    """
+
+    def __init__(self, path: str, reason: str):
+        self.path = path
+        self.reason = reason
+        super().__init__(f"Файл хранилища '{path}' повреждён: {reason}")
@@ -0,0 +1,336 @@
+"""
+Исполнитель сделок на пуле процессов, разбитый по user_id.
+
+Обычный путь buy / sell / convert исполняет сделку в потоке вызывающего
+процесса; при множестве писателей сделки одного шарда ждут его lock-файл,
+а все сделки процесса делят одно ядро.
+Здесь пользователи распределяются по N процессам-исполнителям:
+- партиция пользователя — номер его шарда портфелей % N (infra.shards):
+  шард целиком принадлежит одному воркеру, и сделки разных воркеров
+  не спорят за lock шарда;
+- сделки доставляются владельцу через его локальную очередь и
+  исполняются им по одной — сделки одного пользователя упорядочены;
+- воркер вызывает те же use cases (buy_currency / sell_currency /
+  convert_currency): запись идёт в настоящие шарды через
+  ShardedPortfolios.writing, ledger, P&L и ключи идемпотентности
+  обновляются так же, как при прямом вызове. Отдельной копии портфелей
+  у исполнителя нет.
+
+Воркер, завершившийся аварийно, перезапускается: его неисполненные
+сделки завершаются BrokenProcessPool, а не оставляют вызывающих ждать;
+так же завершается всё, что не исполнено к close().
+
+Пропускная способность растёт с числом ядер; замер —
+valutatrade_hub.benchmarks.executor. HTTP API направляет сделки сюда,
+если EXECUTOR_WORKERS > 0.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from valutatrade_hub.core import exceptions
+from valutatrade_hub.core.exceptions import ValutaTradeError
+from valutatrade_hub.infra.shards import shard_of
+
+
+OPERATIONS = ("buy", "sell", "convert")
+
+# как часто сборщик результатов проверяет, живы ли воркеры
+LIVENESS_INTERVAL_SECONDS = 0.5
+
+
+def partition_of(user_id: int, partitions: int, shards: int) -> int:
+    # партиция — по шарду: все пользователи шарда у одного воркера
+    return shard_of(user_id, shards) % partitions
+
+
+def _dump_error(error: Exception) -> tuple[str, str, dict]:
+    if not isinstance(error, ValutaTradeError):
+        return "", f"{type(error).__name__}: {error}", {}
+    return type(error).__name__, str(error), dict(vars(error))
+
+
+def _load_error(name: str, message: str, attrs: dict) -> Exception:
+    """
+    Исключение воркера → то же исключение в вызывающем процессе
+    (конструкторы с аргументами не переживают pickle). Не доменные
+    ошибки приходят как RuntimeError.
+    """
+    cls = getattr(exceptions, name, None) if name else None
+    if not (isinstance(cls, type) and issubclass(cls, ValutaTradeError)):
+        return RuntimeError(message)
+    error = cls.__new__(cls)
+    Exception.__init__(error, message)
+    error.__dict__.update(attrs)
+    return error
+
+
+def _fail(futures: list[Future], message: str) -> None:
+    # вне _pending_lock: обратные вызовы future могут ставить новые сделки
+    for future in futures:
+        future.set_exception(BrokenProcessPool(message))
+
+
+# =========================
+# worker
+# =========================
+
+def _execute(operation: str, user: dict, args: tuple, idempotency_key: str | None) -> dict:
+    from valutatrade_hub.core import usecases
+
+    trade = {
+        "buy": usecases.buy_currency,
+        "sell": usecases.sell_currency,
+        "convert": usecases.convert_currency,
+    }[operation]
+    return trade(*args, user=user, idempotency_key=idempotency_key)
+
+
+def _worker_main(inbox: multiprocessing.Queue, outbox: multiprocessing.Queue) -> None:
+    while True:
+        request = inbox.get()
+        if request is None:
+            return
+
+        request_id, payload = request
+        try:
+            outbox.put((request_id, True, _execute(**payload)))
+        except Exception as e:
+            # любая ошибка — ответом: упавший воркер оставил бы
+            # вызывающих ждать вечно
+            outbox.put((request_id, False, _dump_error(e)))
+
+
+# =========================
+# executor (вызывающий процесс)
+# =========================
+
+class TradeExecutor:
+    """
+    Маршрутизатор сделок по воркерам-владельцам партиций.
+
+        with TradeExecutor(4) as ex:
+            ex.execute("buy", user, "BTC", 0.01)
+    """
+
+    def __init__(self, workers: int) -> None:
+        if workers < 1:
+            raise ValutaTradeError("Число воркеров должно быть не меньше 1")
+
+        self.workers = workers
+
+        self._inboxes: list[multiprocessing.Queue] = []
+        self._processes: list[multiprocessing.Process] = []
+        self._outbox: multiprocessing.Queue | None = None
+        self._collector: threading.Thread | None = None
+
+        # request_id → (future, индекс воркера)
+        self._pending: dict[int, tuple[Future, int]] = {}
+        # очереди, воркеры и _pending меняются под одним lock: сделка
+        # не попадает в очередь воркера, которого уже заменили
+        self._pending_lock = threading.Lock()
+        self._next_id = 0
+        self._closing = False
+
+    # =========================
+    # lifecycle
+    # =========================
+
+    def start(self) -> None:
+        if self._processes:
+            return
+
+        self._outbox = multiprocessing.Queue()
+        self._closing = False
+
+        for index in range(self.workers):
+            inbox, process = self._spawn(index)
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+
+        self._collector = threading.Thread(
+            target=self._collect, name="trade-executor-results", daemon=True
+        )
+        self._collector.start()
+
+    def close(self) -> None:
+        """
+        Останавливает воркеров после исполнения уже поставленных сделок;
+        сделки, которые некому исполнить (воркер упал), завершаются
+        BrokenProcessPool.
+        """
+        if not self._processes:
+            return
+
+        with self._pending_lock:
+            self._closing = True
+            for inbox in self._inboxes:
+                inbox.put(None)
+        for process in self._processes:
+            process.join()
+
+        self._outbox.put(None)
+        self._collector.join()
+
+        with self._pending_lock:
+            orphans = self._take_pending(None)
+            self._inboxes, self._processes = [], []
+        _fail(orphans, "Исполнитель остановлен до исполнения сделки")
+
+    def __enter__(self) -> "TradeExecutor":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # =========================
+    # public API
+    # =========================
+
+    def submit(
+        self,
+        operation: str,
+        user: dict,
+        *args,
+        idempotency_key: str | None = None,
+    ) -> Future:
+        """
+        Ставит сделку в очередь воркера-владельца. args — как у
+        buy_currency / sell_currency (currency, amount[, base]) или
+        convert_currency (from, to, amount). Future завершается
+        результатом use case или его ошибкой.
+        """
+        if operation not in OPERATIONS:
+            raise ValutaTradeError(f"Операция должна быть одной из {OPERATIONS}")
+
+        from valutatrade_hub.core import usecases
+
+        shards = usecases._portfolios.layout()["shards"]
+        index = partition_of(user["user_id"], self.workers, shards)
+
+        payload = {
+            "operation": operation,
+            "user": user,
+            "args": args,
+            "idempotency_key": idempotency_key,
+        }
+
+        future: Future = Future()
+        with self._pending_lock:
+            if not self._processes or self._closing:
+                raise ValutaTradeError("Исполнитель не запущен")
+
+            self._next_id += 1
+            request_id = self._next_id
+            self._pending[request_id] = (future, index)
+            self._inboxes[index].put((request_id, payload))
+        return future
+
+    def execute(self, operation: str, user: dict, *args, idempotency_key: str | None = None) -> dict:
+        return self.submit(operation, user, *args, idempotency_key=idempotency_key).result()
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _spawn(self, index: int) -> tuple[multiprocessing.Queue, multiprocessing.Process]:
+        inbox = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_worker_main,
+            args=(inbox, self._outbox),
+            name=f"trade-executor-{index:02d}",
+            daemon=True,
+        )
+        process.start()
+        return inbox, process
+
+    def _collect(self) -> None:
+        next_check = time.monotonic() + LIVENESS_INTERVAL_SECONDS
+        while True:
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + LIVENESS_INTERVAL_SECONDS
+
+            try:
+                reply = self._outbox.get(timeout=LIVENESS_INTERVAL_SECONDS)
+            except queue.Empty:
+                continue
+            if reply is None:
+                return
+            self._resolve(reply)
+
+    def _resolve(self, reply: tuple) -> None:
+        request_id, ok, value = reply
+        with self._pending_lock:
+            entry = self._pending.pop(request_id, None)
+        # сделка уже завершена ошибкой при перезапуске воркера
+        if entry is None:
+            return
+
+        future, _ = entry
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(_load_error(*value))
+
+    def _check_workers(self) -> None:
+        """
+        Упавший воркер (kill, OOM, segfault) → его неисполненные сделки
+        завершаются BrokenProcessPool, на его место запускается новый
+        с новой очередью.
+        """
+        dead = [
+            index for index, process in enumerate(self._processes)
+            if not process.is_alive()
+        ]
+        if not dead or self._closing:
+            return
+
+        # ответы, отправленные воркером до падения, ещё в очереди
+        while True:
+            try:
+                reply = self._outbox.get_nowait()
+            except queue.Empty:
+                break
+            if reply is None:
+                self._outbox.put(None)
+                break
+            self._resolve(reply)
+
+        for index in dead:
+            with self._pending_lock:
+                if self._closing:
+                    return
+                process = self._processes[index]
+                orphans = self._take_pending(index)
+                self._inboxes[index], self._processes[index] = self._spawn(index)
+            _fail(
+                orphans,
+                f"Воркер {process.name} завершился аварийно "
+                f"(код {process.exitcode}) до исполнения сделки",
+            )
+
+    def _take_pending(self, index: int | None) -> list[Future]:
+        """
+        Изымает ожидающие сделки воркера index (None — все); под _pending_lock.
+        """
+        taken = [
+            request_id for request_id, (_, owner) in self._pending.items()
+            if index is None or owner == index
+        ]
+        return [self._pending.pop(request_id)[0] for request_id in taken]
+
+
+def from_settings() -> TradeExecutor | None:
+    """
+    Исполнитель с EXECUTOR_WORKERS воркерами; None, если он выключен (0).
+    """
+    from valutatrade_hub.infra.settings import SettingsLoader
+
+    workers = SettingsLoader().get("EXECUTOR_WORKERS")
+    return TradeExecutor(workers) if workers > 0 else None
@@ -0,0 +1,385 @@
+"""
+Выгрузка портфелей, курсов и истории курсов для аналитики.
+
+Наборы данных (по файлу на набор и формат):
+- portfolios — плоские строки user_id, currency, balance, cost, realized_pnl;
+- deleted    — user_id портфелей, удалённых с прошлой выгрузки (архивация);
+               в полной выгрузке пуст;
+- rates      — текущий snapshot rates.json: pair, rate, updated_at, source;
+- history    — exchange_rates.json и архив (data/archive):
+               pair, timestamp (epoch seconds), rate, source.
+
+Форматы: CSV и колоночный (infra.columnar). Каждый набор читается
+один раз и потоково пишется во все выбранные форматы сразу; в памяти —
+одна группа строк (EXPORT_CHUNK_ROWS), а не весь набор.
+
+Инкрементальный режим ("с прошлой выгрузки") хранит в state.json:
+- позиции в журнале сделок и в portfolio_changes.jsonl (регистрация,
+  импорт, архивация, возврат из архива): выгружаются текущие строки
+  только изменённых пользователей (перезапись по user_id), а
+  архивированные — в deleted;
+- последнюю выгруженную точку истории по каждой паре — (timestamp, id):
+  точка с тем же timestamp, записанная после выгрузки, не теряется.
+Snapshot курсов выгружается целиком всегда.
+
+Прогон пишется в data/exports/<run>.tmp и переименовывается
+в data/exports/<run> после manifest.json; state.json обновляется
+последним — прерванный прогон повторяется следующим запуском.
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+
+from valutatrade_hub.core import usecases
+from valutatrade_hub.core.exceptions import ValutaTradeError
+from valutatrade_hub.infra.columnar import ColumnarWriter
+from valutatrade_hub.infra.json_stream import iter_json_array
+from valutatrade_hub.infra.locks import FileLock
+from valutatrade_hub.parser_service.archive import RateSegment, _to_epoch
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import RatesStorage
+
+
+FORMATS = ("csv", "columnar", "both")
+COLUMNAR_SUFFIX = ".vtcf"
+
+SCHEMAS: dict[str, list[tuple[str, str]]] = {
+    "portfolios": [
+        ("user_id", "int"),
+        ("currency", "str"),
+        ("balance", "float"),
+        ("cost", "float"),
+        ("realized_pnl", "float"),
+    ],
+    "deleted": [
+        ("user_id", "int"),
+    ],
+    "rates": [
+        ("pair", "str"),
+        ("rate", "float"),
+        ("updated_at", "str"),
+        ("source", "str"),
+    ],
+    "history": [
+        ("pair", "str"),
+        ("timestamp", "int"),
+        ("rate", "float"),
+        ("source", "str"),
+    ],
+}
+
+
+# =========================
+# writers
+# =========================
+
+class _DatasetWriter:
+    """
+    Одна строка — во все форматы набора.
+    """
+
+    def __init__(self, directory: Path, name: str, fmt: str, chunk_rows: int) -> None:
+        schema = SCHEMAS[name]
+        self.rows = 0
+        self.files: list[str] = []
+
+        self._csv_file = None
+        self._csv = None
+        self._columnar = None
+
+        if fmt in ("csv", "both"):
+            path = directory / f"{name}.csv"
+            self._csv_file = open(path, "w", encoding="utf-8", newline="")
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow([column for column, _ in schema])
+            self.files.append(path.name)
+
+        if fmt in ("columnar", "both"):
+            path = directory / f"{name}{COLUMNAR_SUFFIX}"
+            self._columnar = ColumnarWriter(path, schema, chunk_rows)
+            self.files.append(path.name)
+
+    def write(self, row: tuple) -> None:
+        if self._csv is not None:
+            self._csv.writerow(row)
+        if self._columnar is not None:
+            self._columnar.write(row)
+        self.rows += 1
+
+    def close(self) -> None:
+        if self._csv_file is not None:
+            self._csv_file.close()
+        if self._columnar is not None:
+            self._columnar.close()
+
+
+# =========================
+# datasets
+# =========================
+
+def _portfolio_rows(portfolio: dict) -> Iterator[tuple]:
+    user_id = portfolio["user_id"]
+    for code, wallet in sorted(portfolio.get("wallets", {}).items()):
+        yield (
+            user_id,
+            code,
+            wallet.get("balance", 0.0),
+            wallet.get("cost"),
+            wallet.get("realized_pnl"),
+        )
+
+
+def _iter_portfolios(touched: set[int] | None) -> Iterator[tuple]:
+    """
+    Все портфели либо только touched — читаются лишь их шарды.
+    """
+    if touched is None:
+        for portfolio in usecases.iter_portfolios():
+            yield from _portfolio_rows(portfolio)
+        return
+
+    store = usecases._portfolios
+    shards: dict[Path, set[int]] = {}
+    for user_id in touched:
+        shards.setdefault(store.path_for(user_id), set()).add(user_id)
+
+    for path in sorted(shards):
+        user_ids = shards[path]
+        for portfolio in iter_json_array(path):
+            if portfolio["user_id"] in user_ids:
+                yield from _portfolio_rows(portfolio)
+
+
+def _iter_rates() -> Iterator[tuple]:
+    pairs = RatesStorage().load_snapshot().get("pairs", {})
+    for pair, entry in sorted(pairs.items()):
+        yield pair, entry["rate"], entry.get("updated_at"), entry.get("source")
+
+
+def _iter_history(
+    since: dict[str, tuple[int, str]],
+    last: dict[str, tuple[int, str]],
+) -> Iterator[tuple]:
+    """
+    Точки истории новее отметки since[pair] = (timestamp, id); last
+    обновляется максимальной выгруженной отметкой по паре.
+
+    Архивные точки выгружаются с исходными id и source (блок записей
+    сегмента), поэтому точка, выгруженная из горячего файла до переноса,
+    не выгружается повторно. Архивные сегменты (<first_ts>-<last_ts>.seg)
+    целиком не новее отметки пропускаются без чтения.
+    """
+    config = ParserConfig()
+    start = (-1, "")
+
+    def emit(pair: str, mark: tuple[int, str], rate: float, source: str | None) -> tuple | None:
+        if mark <= since.get(pair, start):
+            return None
+        if mark > last.get(pair, start):
+            last[pair] = mark
+        return pair, mark[0], rate, source
+
+    archive = RatesStorage(config).archive
+    for pair in archive.pairs():
+        for path in archive.segments(pair):
+            if int(path.stem.split("-")[-1]) <= since.get(pair, start)[0]:
+                continue
+            with RateSegment(path) as segment:
+                for ts, record in zip(segment.timestamps, segment.records(pair)):
+                    row = emit(pair, (ts, record["id"]), record["rate"], record["source"])
+                    if row:
+                        yield row
+
+    for record in iter_json_array(Path(config.HISTORY_FILE_PATH)):
+        pair = f"{record['from_currency']}_{record['to_currency']}"
+        mark = (_to_epoch(record["timestamp"]), record.get("id") or "")
+        row = emit(pair, mark, float(record["rate"]), record.get("source"))
+        if row:
+            yield row
+
+
+# =========================
+# export
+# =========================
+
+def _load_state(path: Path) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+
+    # отметки истории: [timestamp, id]; прежний формат — только
+    # timestamp, все точки с ним уже выгружены
+    state["history"] = {
+        pair: tuple(mark) if isinstance(mark, list) else (mark, "\uffff")
+        for pair, mark in state.get("history", {}).items()
+    }
+    return state
+
+
+def _save_state(path: Path, state: dict) -> None:
+    with tempfile.NamedTemporaryFile(
+        mode="w",
+        encoding="utf-8",
+        delete=False,
+        dir=path.parent,
+    ) as tmp:
+        json.dump(state, tmp, ensure_ascii=False, indent=4)
+        temp_name = tmp.name
+    os.replace(temp_name, path)
+
+
+def export(
+    directory: Path,
+    full: bool = False,
+    fmt: str = "both",
+    chunk_rows: int = 100_000,
+    progress: Callable[[str, int], None] | None = None,
+) -> dict:
+    """
+    Выгружает наборы в новый каталог прогона. Первый запуск (нет
+    state.json) и full=True — полная выгрузка, иначе инкрементальная.
+    Возвращает manifest прогона.
+    """
+    if fmt not in FORMATS:
+        raise ValutaTradeError(f"Неизвестный формат выгрузки '{fmt}'")
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    state_path = directory / "state.json"
+
+    with FileLock(usecases.LOCKS_DIR / "export.lock"):
+        previous = {} if full else _load_state(state_path)
+        mode = "incremental" if previous else "full"
+
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        run = f"{now:%Y%m%dT%H%M%S%fZ}-{mode}"
+        tmp_dir = directory / f"{run}.tmp"
+        tmp_dir.mkdir()
+
+        # позиция журнала — до чтения портфелей: сделка, записанная
+        # во время прогона, попадёт и в следующий
+        ledger = usecases.get_ledger()
+        ledger_position = len(ledger)
+        changes, changes_position = usecases._portfolio_changes(
+            previous.get("changes_position", 0) if mode == "incremental" else 0
+        )
+        history_since = previous.get("history", {})
+        history_last = dict(history_since)
+
+        touched: set[int] | None = None
+        deleted: list[int] = []
+        if mode == "incremental":
+            touched = set()
+            for trade in ledger.iter_from(previous.get("ledger_position", 0)):
+                if trade["trade_id"] > ledger_position:
+                    break
+                touched.add(trade["user_id"])
+
+            # последняя операция решает: архивированный и возвращённый
+            # пользователь выгружается заново, не возвращённый — в deleted
+            for user_id, op in changes.items():
+                if op == "delete":
+                    touched.discard(user_id)
+                    deleted.append(user_id)
+                else:
+                    touched.add(user_id)
+
+        datasets = {
+            "portfolios": _iter_portfolios(touched),
+            "deleted": ((user_id,) for user_id in sorted(deleted)),
+            "rates": _iter_rates(),
+            "history": _iter_history(history_since, history_last),
+        }
+
+        manifest = {
+            "run": run,
+            "mode": mode,
+            "since": previous.get("last_run"),
+            "created_at": now.isoformat(),
+            "format": fmt,
+            "ledger_position": ledger_position,
+            "changes_position": changes_position,
+            "datasets": {},
+        }
+
+        try:
+            for name, rows in datasets.items():
+                writer = _DatasetWriter(tmp_dir, name, fmt, chunk_rows)
+                try:
+                    for row in rows:
+                        writer.write(row)
+                        if progress and writer.rows % chunk_rows == 0:
+                            progress(name, writer.rows)
+                finally:
+                    writer.close()
+
+                manifest["datasets"][name] = {
+                    "rows": writer.rows,
+                    "files": writer.files,
+                    "columns": [column for column, _ in SCHEMAS[name]],
+                }
+                if name == "portfolios" and touched is not None:
+                    manifest["datasets"][name]["users"] = len(touched)
+
+            manifest["elapsed_s"] = round(time.perf_counter() - started, 3)
+            with open(tmp_dir / "manifest.json", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=4)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        os.replace(tmp_dir, directory / run)
+        _save_state(state_path, {
+            "last_run": run,
+            "ledger_position": ledger_position,
+            "changes_position": changes_position,
+            "history": history_last,
+        })
+
+    manifest["path"] = str(directory / run)
+    return manifest
+
+
+def main() -> None:
+    from valutatrade_hub.infra.settings import SettingsLoader
+
+    settings = SettingsLoader()
+
+    parser = argparse.ArgumentParser(description="Export portfolios, rates and history")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="полная выгрузка (по умолчанию — изменения с прошлой выгрузки)",
+    )
+    parser.add_argument("--format", choices=FORMATS, default="both")
+    parser.add_argument("--dir", type=Path, default=settings.get("EXPORT_DIR"))
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=settings.get("EXPORT_CHUNK_ROWS"),
+        help="строк в группе колоночного файла",
+    )
+    args = parser.parse_args()
+
+    def progress(name: str, rows: int) -> None:
+        print(f"... {name}: {rows}")
+
+    m = export(args.dir, args.full, args.format, args.chunk_rows, progress)
+    print(f"Выгрузка {m['mode']}: {m['path']} за {m['elapsed_s']} с")
+    for name, d in m["datasets"].items():
+        print(f"{name}: {d['rows']} строк ({', '.join(d['files'])})")
+
+
+if __name__ == "__main__":
+    main()
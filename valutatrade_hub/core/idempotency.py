@@ -0,0 +1,154 @@
+"""
+Индекс ключей идемпотентности для сделок.
+
+Повтор запроса с тем же ключом (например, ретрай после таймаута)
+возвращает сохранённый результат первой попытки, не выполняя сделку
+второй раз.
+
+Хранение — журнал idempotency.jsonl (infra.journal), только дозапись:
+- запись ключа — одна строка в конец файла, O(1);
+- в памяти — dict в порядке вставки: поиск O(1), истёкшие и лишние
+  (сверх max_keys) ключи снимаются с головы;
+- другие процессы дочитывают только новые строки; файл периодически
+  уплотняется (живые ключи → rename).
+
+Блокировки:
+- scope_lock(user_id, key) — на всё "проверка → сделка → запись ключа":
+  параллельный ретрай того же ключа ждёт и получает сохранённый
+  результат. Lock-файлов LOCK_STRIPES, ключ попадает в свой по crc32,
+  так что сделки с разными ключами почти никогда не ждут друг друга;
+- lock — общий, только на дозапись и уплотнение журнала.
+"""
+
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from valutatrade_hub.core.exceptions import ValutaTradeError
+from valutatrade_hub.infra.journal import Journal
+from valutatrade_hub.infra.locks import FileLock
+
+
+# уплотнять, когда строк в файле больше, чем живых ключей * COMPACT_FACTOR
+COMPACT_FACTOR = 2
+# lock-файлов для областей user_id:key
+LOCK_STRIPES = 64
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        path: Path,
+        ttl_seconds: int,
+        max_keys: int,
+        lock_path: Path | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        lock_path = Path(lock_path or self.path.with_suffix(".lock"))
+        # запись журнала (коротко)
+        self.lock = FileLock(lock_path)
+        self._scope_locks = [
+            FileLock(lock_path.with_name(f"{lock_path.stem}-{n:02d}.lock"))
+            for n in range(LOCK_STRIPES)
+        ]
+
+        self.journal = Journal(self.path)
+        # "user_id:key" → {"fingerprint", "result", "expires_at"}
+        self._entries: dict[str, dict] = {}
+        # состояние в памяти — общее для потоков процесса
+        self._state_lock = threading.RLock()
+
+    # =========================
+    # public API
+    # =========================
+
+    def scope_lock(self, user_id: int, key: str) -> FileLock:
+        """
+        Lock области ключа: держится на время сделки с этим ключом.
+        """
+        scope = self._scope(user_id, key)
+        return self._scope_locks[zlib.crc32(scope.encode("utf-8")) % LOCK_STRIPES]
+
+    def get(self, user_id: int, key: str, fingerprint: str) -> dict | None:
+        """
+        Результат ранее выполненного запроса или None.
+        Ключ, использованный для другой операции, — ошибка.
+        """
+        with self._state_lock:
+            self._sync()
+            entry = self._entries.get(self._scope(user_id, key))
+
+        if entry is None or entry["expires_at"] <= time.time():
+            return None
+
+        if entry["fingerprint"] != fingerprint:
+            raise ValutaTradeError(
+                f"Ключ идемпотентности '{key}' уже использован для другой операции"
+            )
+        return entry["result"]
+
+    def put(self, user_id: int, key: str, fingerprint: str, result: dict) -> None:
+        record = {
+            "scope": self._scope(user_id, key),
+            "fingerprint": fingerprint,
+            "result": result,
+            "expires_at": time.time() + self.ttl_seconds,
+        }
+
+        with self.lock, self._state_lock:
+            # дочитать перед дозаписью: хвост дальше прочитанного — прерванная запись
+            self._sync()
+            self.journal.append([record])
+            self._apply(record)
+
+            if self.journal.lines > COMPACT_FACTOR * max(len(self._entries), 1) + 1000:
+                self._evict()
+                self.journal.rewrite(
+                    {"scope": scope, **entry} for scope, entry in self._entries.items()
+                )
+
+    def __len__(self) -> int:
+        with self._state_lock:
+            self._sync()
+            return len(self._entries)
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    @staticmethod
+    def _scope(user_id: int, key: str) -> str:
+        return f"{user_id}:{key}"
+
+    def _apply(self, record: dict) -> None:
+        scope = record["scope"]
+        # повторная вставка — в конец порядка
+        self._entries.pop(scope, None)
+        self._entries[scope] = {
+            "fingerprint": record["fingerprint"],
+            "result": record["result"],
+            "expires_at": record["expires_at"],
+        }
+        self._evict()
+
+    def _evict(self) -> None:
+        now = time.time()
+        while self._entries:
+            scope, entry = next(iter(self._entries.items()))
+            if entry["expires_at"] > now and len(self._entries) <= self.max_keys:
+                break
+            del self._entries[scope]
+
+    def _sync(self) -> None:
+        """
+        Дочитывает строки, добавленные с прошлого раза (в т.ч. другими процессами).
+        """
+        reset, records = self.journal.read_new()
+        if reset:
+            # файл уплотнён / пересоздан — читаем заново
+            self._entries = {}
+        for record in records:
+            self._apply(record)
@@ -0,0 +1,377 @@
+"""
+Рейтинг портфелей по стоимости, поддерживаемый инкрементально.
+
+Хранится агрегат по пользователю (балансы кошельков) и последняя
+цена каждой валюты в учётной валюте. Пересчитываются только
+затронутые оценки:
+- сделки → оценки их пользователей;
+- snapshot курсов → держатели изменившихся валют (индекс code → users).
+
+Рейтинг — список (-score, user_id), отсортированный bisect'ом:
+top-N за O(N), место пользователя за O(log n). Порядок не зависит
+от базовой валюты (пересчёт — умножение на положительный курс),
+поэтому рейтинг один, а base применяется при выдаче.
+
+Сделки рейтинг не трогают (его lock не на пути сделки): перед чтением
+рейтинг догоняет ledger пачкой — catch_up() читает сделки после своей
+позиции и применяет балансы кошельков из них под одним lock.
+
+Хранение — журнал leaderboard.jsonl (infra.journal): пачка сделок
+дописывает строки с новыми балансами кошельков и позицию ledger,
+snapshot — строку с новыми ценами; журнал периодически уплотняется
+до текущего агрегата.
+"""
+
+import json
+import threading
+from bisect import bisect_left, insort
+from pathlib import Path
+from typing import Callable, Iterable
+
+from valutatrade_hub.core.ledger import TradeLedger
+from valutatrade_hub.infra.journal import Journal
+from valutatrade_hub.infra.locks import FileLock
+
+
+# при изменении большей доли оценок дешевле пересортировать целиком
+_RESORT_FRACTION = 0.125
+
+# уплотнять, когда строк в журнале больше, чем пользователей * COMPACT_FACTOR
+COMPACT_FACTOR = 2
+
+
+class Leaderboard:
+    """
+    Рейтинг всех пользователей; подключается к RatesStorage:
+    storage.subscribe(board.on_snapshot).
+
+    Строки журнала:
+        {"op": "prices", "prices": {code: price}}
+        {"op": "user", "user_id", "username", "holdings": {code: balance}}
+        {"op": "wallet", "user_id", "username", "code", "balance", "price"}
+        {"op": "ledger", "position": trade_id}
+    Старый leaderboard.json (legacy_path) переносится в журнал при
+    первом обращении и переименовывается в *.migrated.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        currency: str,
+        lock_path: Path | None = None,
+        legacy_path: Path | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.currency = currency
+        self.lock = FileLock(lock_path or self.path.with_suffix(".lock"))
+        self.legacy_path = Path(legacy_path) if legacy_path is not None else None
+        self.journal = Journal(self.path)
+        # состояние в памяти и позиция в журнале — общие для потоков
+        # процесса; читатели без lock-файла берут только его
+        self._state_lock = threading.RLock()
+
+        self._holdings: dict[int, dict[str, float]] = {}
+        self._names: dict[int, str | None] = {}
+        self._prices: dict[str, float] = {}
+        self._holders: dict[str, set[int]] = {}
+        self._scores: dict[int, float] = {}
+        self._ranking: list[tuple[float, int]] = []
+        # последняя применённая сделка ledger; None — журнал от версий,
+        # писавших сделки в рейтинг напрямую
+        self._ledger_position: int | None = None
+
+        self._migrate_legacy()
+        self._reload_if_changed()
+
+    # =========================
+    # public API
+    # =========================
+
+    def rebuild(
+        self,
+        portfolios: Iterable[dict],
+        usernames: dict[int, str],
+        prices: dict[str, float],
+        ledger_position: int = 0,
+    ) -> None:
+        """
+        Полное построение (первый запуск / восстановление);
+        ledger_position — число сделок ledger до чтения портфелей.
+        """
+        with self.lock, self._state_lock:
+            self._ledger_position = ledger_position
+            self._prices = dict(prices)
+            self._holdings = {
+                p["user_id"]: {
+                    code: info.get("balance", 0.0)
+                    for code, info in p.get("wallets", {}).items()
+                }
+                for p in portfolios
+            }
+            self._names = {uid: usernames.get(uid) for uid in self._holdings}
+            self._index_all()
+            self.journal.rewrite(self._state_records())
+
+    def catch_up(
+        self,
+        ledger: TradeLedger,
+        usernames: Callable[[], dict[int, str]],
+    ) -> int:
+        """
+        Применяет сделки ledger после своей позиции одной дозаписью
+        журнала. usernames — имена пользователей (вызывается, только
+        если в сделках есть новые для рейтинга). Возвращает число сделок.
+        """
+        with self._state_lock:
+            self._reload_if_changed()
+            position = self._ledger_position
+            if position is not None and position >= len(ledger):
+                return 0
+
+        with self.lock, self._state_lock:
+            self._reload_if_changed()
+            position = self._ledger_position
+            if position is None:
+                # сделки до этой версии уже в журнале рейтинга
+                records = []
+                position = len(ledger)
+            else:
+                records = self._trade_records(ledger.iter_from(position))
+                if not records:
+                    return 0
+                position = records[-1]["trade_id"]
+
+            wallets = [
+                {key: value for key, value in r.items() if key != "trade_id"}
+                for r in records
+            ]
+            unknown = {r["user_id"] for r in wallets} - self._names.keys()
+            names = usernames() if unknown else {}
+            for record in wallets:
+                if record["user_id"] in unknown:
+                    record["username"] = names.get(record["user_id"])
+
+            affected: set[int] = set()
+            marker = {"op": "ledger", "position": position}
+            for record in [*wallets, marker]:
+                affected |= self._apply(record)
+            self.journal.append([*wallets, marker])
+            if affected:
+                self._rescore(affected)
+            self._maybe_compact()
+
+        return len({r["trade_id"] for r in records})
+
+    def on_snapshot(self, changed: dict[str, float], updated_at: str) -> int:
+        """
+        Подписчик RatesStorage: пересчитывает держателей изменившихся валют.
+        Возвращает число пересчитанных оценок.
+        """
+        prices = {}
+        for pair, rate in changed.items():
+            code, _, quote = pair.partition("_")
+            if quote == self.currency:
+                prices[code] = rate
+        if not prices:
+            return 0
+
+        record = {"op": "prices", "prices": prices}
+        with self.lock, self._state_lock:
+            self._reload_if_changed()
+            affected = self._apply(record)
+            self.journal.append([record])
+            self._maybe_compact()
+            if affected:
+                self._rescore(affected)
+
+        return len(affected)
+
+    def top(self, n: int) -> list[dict]:
+        """
+        Первые n мест: {"rank", "user_id", "username", "value"} в учётной валюте.
+        """
+        with self._state_lock:
+            self._reload_if_changed()
+            ranking = self._ranking[:n]
+        return [
+            {
+                "rank": rank,
+                "user_id": user_id,
+                "username": self._names.get(user_id),
+                "value": -neg_score,
+            }
+            for rank, (neg_score, user_id) in enumerate(ranking, start=1)
+        ]
+
+    def rank_of(self, user_id: int) -> int | None:
+        with self._state_lock:
+            self._reload_if_changed()
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            return bisect_left(self._ranking, (-score, user_id)) + 1
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _score(self, user_id: int) -> float:
+        total = 0.0
+        for code, balance in self._holdings.get(user_id, {}).items():
+            price = 1.0 if code == self.currency else self._prices.get(code)
+            if price is not None:
+                total += balance * price
+        return total
+
+    def _rescore(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+
+        if len(user_ids) > _RESORT_FRACTION * max(len(self._scores), 1):
+            for user_id in user_ids:
+                self._scores[user_id] = self._score(user_id)
+            self._ranking = sorted((-s, uid) for uid, s in self._scores.items())
+            return
+
+        for user_id in user_ids:
+            old = self._scores.get(user_id)
+            if old is not None:
+                i = bisect_left(self._ranking, (-old, user_id))
+                if i < len(self._ranking) and self._ranking[i] == (-old, user_id):
+                    del self._ranking[i]
+
+            score = self._score(user_id)
+            self._scores[user_id] = score
+            insort(self._ranking, (-score, user_id))
+
+    def _index_all(self) -> None:
+        self._holders = {}
+        for user_id, holdings in self._holdings.items():
+            for code in holdings:
+                self._holders.setdefault(code, set()).add(user_id)
+
+        self._scores = {uid: self._score(uid) for uid in self._holdings}
+        self._ranking = sorted((-s, uid) for uid, s in self._scores.items())
+
+    def _apply(self, record: dict) -> set[int]:
+        """
+        Строка журнала → состояние; возвращает пользователей, чьи
+        оценки нужно пересчитать.
+        """
+        op = record["op"]
+        if op == "wallet":
+            user_id, code = record["user_id"], record["code"]
+            self._holdings.setdefault(user_id, {})[code] = record["balance"]
+            self._holders.setdefault(code, set()).add(user_id)
+            if record["username"] or user_id not in self._names:
+                self._names[user_id] = record["username"]
+            # известная цена из snapshot не заменяется ценой сделки
+            if code not in self._prices and record["price"] is not None:
+                self._prices[code] = record["price"]
+                return {user_id} | self._holders[code]
+            return {user_id}
+
+        if op == "prices":
+            self._prices.update(record["prices"])
+            affected: set[int] = set()
+            for code in record["prices"]:
+                affected |= self._holders.get(code, set())
+            return affected
+
+        if op == "user":
+            user_id = record["user_id"]
+            self._holdings[user_id] = dict(record["holdings"])
+            self._names[user_id] = record.get("username")
+            for code in record["holdings"]:
+                self._holders.setdefault(code, set()).add(user_id)
+            return {user_id}
+
+        if op == "ledger":
+            self._ledger_position = record["position"]
+
+        return set()
+
+    def _trade_records(self, trades: Iterable[dict]) -> list[dict]:
+        """
+        Сделки ledger → строки "wallet" (с trade_id сделки): балансы
+        затронутых кошельков после сделки.
+        """
+        records = []
+        for trade in trades:
+            prices = trade.get("prices", {})
+            wallets = [(trade["currency"], trade["after"])]
+            if "target_after" in trade:
+                wallets.append((trade["base"], trade["target_after"]))
+
+            for code, balance in wallets:
+                price = prices.get(code)
+                # сделки, записанные без цен: курс к учётной валюте
+                if price is None and code == trade["currency"] and trade["base"] == self.currency:
+                    price = trade["rate"]
+                records.append({
+                    "trade_id": trade["trade_id"],
+                    "op": "wallet",
+                    "user_id": trade["user_id"],
+                    "username": None,
+                    "code": code,
+                    "balance": balance,
+                    "price": price,
+                })
+        return records
+
+    def _reload_if_changed(self) -> None:
+        reset, records = self.journal.read_new()
+        if not reset:
+            affected: set[int] = set()
+            for record in records:
+                affected |= self._apply(record)
+            if affected:
+                self._rescore(affected)
+            return
+
+        self._holdings, self._names, self._prices, self._holders = {}, {}, {}, {}
+        self._ledger_position = None
+        for record in records:
+            self._apply(record)
+        self._index_all()
+
+    def _state_records(self) -> Iterable[dict]:
+        yield {"op": "prices", "prices": self._prices}
+        for user_id, holdings in self._holdings.items():
+            yield {
+                "op": "user",
+                "user_id": user_id,
+                "username": self._names.get(user_id),
+                "holdings": holdings,
+            }
+        if self._ledger_position is not None:
+            yield {"op": "ledger", "position": self._ledger_position}
+
+    def _maybe_compact(self) -> None:
+        if self.journal.lines > COMPACT_FACTOR * len(self._holdings) + 1000:
+            self.journal.rewrite(self._state_records())
+
+    def _migrate_legacy(self) -> None:
+        legacy = self.legacy_path
+        if legacy is None or legacy == self.path or not legacy.exists():
+            return
+
+        with self.lock, self._state_lock:
+            if self.journal.exists() or not legacy.exists():
+                return
+
+            data = {}
+            if legacy.stat().st_size:
+                with open(legacy, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+
+            users = data.get("users", {})
+            self._prices = data.get("prices", {})
+            self._holdings = {int(uid): u["holdings"] for uid, u in users.items()}
+            self._names = {int(uid): u.get("username") for uid, u in users.items()}
+            self._index_all()
+
+            self.journal.rewrite(self._state_records())
+            legacy.rename(legacy.with_name(legacy.name + ".migrated"))
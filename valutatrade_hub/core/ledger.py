@@ -0,0 +1,271 @@
+"""
+Журнал сделок (ledger) с индексами по пользователю и времени.
+
+Файлы в data/ledger/:
+- trades.jsonl      — записи сделок, только дозапись (JSON Lines);
+- trades.idx        — смещение записи в trades.jsonl, 8 байт на сделку:
+                      trade_id = номер записи + 1, поиск сделки за O(1);
+- users/<id>.idx    — (trade_id, epoch) сделок пользователя, 16 байт
+                      на запись, в порядке записи (id и время возрастают).
+
+Запросы пользователя идут по его индексу через mmap: граница курсора
+и диапазона времени — бинарный поиск, страница — O(limit) чтений
+с конца. "Последние 50 сделок" не зависят от длины истории.
+"""
+
+import json
+import mmap
+import struct
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+from valutatrade_hub.core.exceptions import ValutaTradeError
+from valutatrade_hub.infra.locks import FileLock
+
+
+_OFFSET = struct.Struct("<Q")
+_USER_ENTRY = struct.Struct("<qd")
+
+MAX_PAGE_SIZE = 1000
+
+
+def _to_epoch(timestamp: str) -> float:
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _append_entry(path: Path, entry: bytes) -> None:
+    """
+    Дозапись записи фиксированного размера в индекс (под lock журнала).
+    Неполная запись, оставленная прерванной дозаписью, сначала
+    обрезается: иначе все следующие записи сдвинутся.
+    """
+    with open(path, "ab") as f:
+        size = f.seek(0, 2)
+        torn = size % len(entry)
+        if torn:
+            f.truncate(size - torn)
+        f.write(entry)
+
+
+class _UserIndex:
+    """
+    Индекс сделок пользователя, открытый через mmap (только чтение).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.count = 0
+        self._mmap = None
+
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return
+
+        # хвост от прерванной записи не учитывается
+        self.count = size // _USER_ENTRY.size
+        if self.count:
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def entry(self, i: int) -> tuple[int, float]:
+        return _USER_ENTRY.unpack_from(self._mmap, i * _USER_ENTRY.size)
+
+    def bisect(self, value: float, field: int) -> int:
+        """
+        Первая позиция, где entry[field] >= value.
+        """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.entry(mid)[field] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self) -> "_UserIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class TradeLedger:
+    def __init__(self, directory: Path, lock_path: Path | None = None) -> None:
+        self.directory = Path(directory)
+        self.records_path = self.directory / "trades.jsonl"
+        self.index_path = self.directory / "trades.idx"
+        self.users_dir = self.directory / "users"
+        self.lock = FileLock(lock_path or self.directory / "ledger.lock")
+
+    # =========================
+    # write
+    # =========================
+
+    def append(self, trade: dict) -> dict:
+        """
+        Записывает сделку; присваивает trade_id и timestamp (UTC).
+
+        lock журнала — единственная общая для всех сделок точка
+        (порядок trade_id), поэтому под ним только выдача id и три
+        дозаписи: запись кодируется заранее, id подставляется в начало.
+        """
+        self.users_dir.mkdir(parents=True, exist_ok=True)
+
+        timestamp = trade.get("timestamp") or datetime.now(timezone.utc).isoformat()
+        trade = {key: value for key, value in trade.items() if key != "trade_id"}
+        # '{...}' → '..., "timestamp": ...}' без открывающей скобки
+        body = json.dumps({**trade, "timestamp": timestamp}, ensure_ascii=False)[1:]
+        epoch = _to_epoch(timestamp)
+
+        with self.lock:
+            trade_id = self._count() + 1
+
+            with open(self.records_path, "ab") as f:
+                offset = f.tell()
+                f.write(f'{{"trade_id": {trade_id}, {body}\n'.encode("utf-8"))
+
+            # индексы — после записи: сделка без индекса не видна,
+            # индекс без записи невозможен
+            _append_entry(self.index_path, _OFFSET.pack(offset))
+            _append_entry(
+                self._user_index_path(trade["user_id"]),
+                _USER_ENTRY.pack(trade_id, epoch),
+            )
+
+        return {"trade_id": trade_id, **trade, "timestamp": timestamp}
+
+    # =========================
+    # read
+    # =========================
+
+    def get(self, trade_id: int) -> dict | None:
+        if not isinstance(trade_id, int) or not 0 < trade_id <= self._count():
+            return None
+
+        with open(self.index_path, "rb") as offsets, open(self.records_path, "rb") as records:
+            return self._read(trade_id, offsets, records)
+
+    def query(
+        self,
+        user_id: int,
+        limit: int = 50,
+        cursor: int | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        currency: str | None = None,
+    ) -> dict:
+        """
+        Сделки пользователя от новых к старым.
+
+        cursor — next_cursor предыдущей страницы (trade_id, не включая);
+        since / until — ISO-время, включительно; currency — фильтр
+        по валюте сделки. Возвращает {"trades": [...], "next_cursor": id | None}.
+        """
+        if not isinstance(limit, int) or not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValutaTradeError(f"'limit' должен быть от 1 до {MAX_PAGE_SIZE}")
+
+        since_ts = _to_epoch(since) if since else None
+        until_ts = _to_epoch(until) if until else None
+
+        trades: list[dict] = []
+        next_cursor = None
+
+        with _UserIndex(self._user_index_path(user_id)) as index:
+            if not index.count:
+                return {"trades": trades, "next_cursor": None}
+
+            hi = index.count
+            if cursor is not None:
+                hi = min(hi, index.bisect(cursor, field=0))
+            if until_ts is not None:
+                # первая позиция строго позже until
+                hi = min(hi, index.bisect(until_ts + 1e-6, field=1))
+            lo = index.bisect(since_ts, field=1) if since_ts is not None else 0
+
+            with open(self.index_path, "rb") as offsets, \
+                    open(self.records_path, "rb") as records:
+                i = hi - 1
+                while i >= lo:
+                    trade_id, _ = index.entry(i)
+                    i -= 1
+
+                    record = self._read(trade_id, offsets, records)
+                    if currency and record.get("currency") != currency:
+                        continue
+
+                    trades.append(record)
+                    if len(trades) == limit:
+                        break
+
+            if trades and i >= lo:
+                next_cursor = trades[-1]["trade_id"]
+
+        return {"trades": trades, "next_cursor": next_cursor}
+
+    def iter_user(self, user_id: int) -> Iterator[dict]:
+        """
+        Все сделки пользователя в хронологическом порядке.
+        """
+        with _UserIndex(self._user_index_path(user_id)) as index:
+            ids = [index.entry(i)[0] for i in range(index.count)]
+        if not ids:
+            return
+
+        with open(self.index_path, "rb") as offsets, open(self.records_path, "rb") as records:
+            for trade_id in ids:
+                yield self._read(trade_id, offsets, records)
+
+    def __iter__(self) -> Iterator[dict]:
+        """
+        Все сделки в порядке записи (потоково).
+        """
+        return self.iter_from(0)
+
+    def iter_from(self, after: int) -> Iterator[dict]:
+        """
+        Сделки с trade_id > after в порядке записи (потоково);
+        начало — переход по trades.idx, без чтения предшествующих записей.
+        """
+        if after >= self._count():
+            return
+
+        with open(self.index_path, "rb") as idx, open(self.records_path, "rb") as f:
+            idx.seek(max(0, after) * _OFFSET.size)
+            while chunk := idx.read(_OFFSET.size * 4096):
+                for (offset,) in _OFFSET.iter_unpack(chunk[:len(chunk) // 8 * 8]):
+                    # строки прерванных записей без индекса пропускаются
+                    if f.tell() != offset:
+                        f.seek(offset)
+                    yield json.loads(f.readline())
+
+    def __len__(self) -> int:
+        return self._count()
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _count(self) -> int:
+        try:
+            return self.index_path.stat().st_size // _OFFSET.size
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _read(trade_id: int, offsets, records) -> dict:
+        offsets.seek((trade_id - 1) * _OFFSET.size)
+        (offset,) = _OFFSET.unpack(offsets.read(_OFFSET.size))
+        records.seek(offset)
+        return json.loads(records.readline())
+
+    def _user_index_path(self, user_id: int) -> Path:
+        return self.users_dir / f"{int(user_id)}.idx"
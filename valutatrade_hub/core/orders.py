@@ -0,0 +1,408 @@
+"""
+Лимитные и стоп-ордера, исполняемые по новым snapshot курсов.
+
+Условия срабатывания по цене пары <currency>_<base>:
+- buy limit:  цена <= trigger    (купить, когда подешевеет)
+- sell stop:  цена <= trigger    (продать при падении)
+- sell limit: цена >= trigger    (продать, когда подорожает)
+- buy stop:   цена >= trigger    (купить при пробое вверх)
+
+Для каждой пары держатся два отсортированных индекса по trigger:
+"below" (срабатывают при падении) и "above" (при росте). Все ордера
+в индексе ещё не сработали на последней цене, поэтому при новой цене
+сработавшие образуют непрерывный хвост/голову списка: bisect даёт
+O(log n) на поиск границы + O(k) на k исполненных ордеров.
+
+Ордер принимается только по паре, которую публикует Parser Service
+(<код>_<BASE_CURRENCY>): по другим парам snapshot не приходят, и ордер
+остался бы в книге навсегда.
+
+Хранение — журнал orders.jsonl (infra.journal): выставление, отмена
+и исполнение ордера — одна дописанная строка, а не перезапись всех
+ордеров; журнал периодически уплотняется до активных ордеров.
+"""
+
+import json
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable
+
+from valutatrade_hub.core.currencies import get_currency
+from valutatrade_hub.core.exceptions import ValutaTradeError
+from valutatrade_hub.infra.journal import Journal
+from valutatrade_hub.infra.locks import FileLock
+from valutatrade_hub.parser_service.config import ParserConfig
+
+
+logger = logging.getLogger("valutatrade")
+
+ORDER_TYPES = ("limit", "stop")
+ORDER_SIDES = ("buy", "sell")
+
+# (order, price) → результат исполнения (dict use case)
+OrderExecutor = Callable[[dict, float], dict]
+
+# уплотнять, когда строк в журнале больше, чем активных ордеров * COMPACT_FACTOR
+COMPACT_FACTOR = 2
+
+# события журнала, снимающие ордер из книги
+_CLOSING_OPS = ("cancel", "filled", "rejected")
+
+
+def published_pairs(config: ParserConfig | None = None) -> frozenset[str]:
+    """
+    Пары, по которым Parser Service публикует курсы.
+    """
+    config = config or ParserConfig()
+    return frozenset(
+        f"{code}_{config.BASE_CURRENCY}"
+        for code in (*config.FIAT_CURRENCIES, *config.CRYPTO_CURRENCIES)
+    )
+
+
+def _fires_below(order: dict) -> bool:
+    return (order["side"], order["type"]) in (("buy", "limit"), ("sell", "stop"))
+
+
+class _PairIndex:
+    """
+    Индексы одной пары: списки (trigger, order_id), отсортированные по trigger.
+    """
+
+    __slots__ = ("below", "above")
+
+    def __init__(self) -> None:
+        self.below: list[tuple[float, int]] = []
+        self.above: list[tuple[float, int]] = []
+
+    def add(self, order: dict, keep_sorted: bool = True) -> None:
+        target = self.below if _fires_below(order) else self.above
+        key = (order["trigger_price"], order["order_id"])
+        if keep_sorted:
+            insort(target, key)
+        else:
+            target.append(key)
+
+    def sort(self) -> None:
+        self.below.sort()
+        self.above.sort()
+
+    def remove(self, order: dict) -> None:
+        target = self.below if _fires_below(order) else self.above
+        key = (order["trigger_price"], order["order_id"])
+        i = bisect_left(target, key)
+        if i < len(target) and target[i] == key:
+            del target[i]
+
+    def pop_crossed(self, price: float) -> list[int]:
+        # below: срабатывают все trigger >= price
+        i = bisect_left(self.below, (price, -1))
+        crossed = [order_id for _, order_id in self.below[i:]]
+        del self.below[i:]
+
+        # above: срабатывают все trigger <= price
+        j = bisect_right(self.above, (price, float("inf")))
+        crossed.extend(order_id for _, order_id in self.above[:j])
+        del self.above[:j]
+
+        return crossed
+
+    def __len__(self) -> int:
+        return len(self.below) + len(self.above)
+
+
+class OrderBook:
+    """
+    Книга отложенных ордеров всех пользователей.
+
+    Хранение — журнал событий (JSON Lines):
+        {"op": "next_id", "next_id": n}     — заголовок уплотнённого журнала
+        {"op": "place", "order": {...}}
+        {"op": "cancel" | "filled" | "rejected", "order_id": n}
+    Изменения выполняются под межпроцессным lock-файлом после
+    дочитывания строк других процессов (CLI / API / планировщик).
+    Старый orders.json (legacy_path) переносится в журнал при первом
+    обращении и переименовывается в *.migrated.
+
+    pairs — пары, по которым принимаются ордера (по умолчанию
+    published_pairs()).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        executor: OrderExecutor | None = None,
+        lock_path: Path | None = None,
+        legacy_path: Path | None = None,
+        pairs: Iterable[str] | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.executor = executor or _execute_with_usecases
+        self.pairs = frozenset(pairs) if pairs is not None else published_pairs()
+        self.lock = FileLock(lock_path or self.path.with_suffix(".lock"))
+        self.legacy_path = Path(legacy_path) if legacy_path is not None else None
+        self.journal = Journal(self.path)
+        # состояние в памяти и позиция в журнале — общие для потоков
+        # процесса; читатели без lock-файла берут только его
+        self._state_lock = threading.RLock()
+
+        self._orders: dict[int, dict] = {}
+        self._indexes: dict[str, _PairIndex] = {}
+        self._next_id = 1
+
+        self._migrate_legacy()
+        self._reload_if_changed()
+
+    # =========================
+    # public API
+    # =========================
+
+    def place(
+        self,
+        user_id: int,
+        side: str,
+        order_type: str,
+        currency: str,
+        base: str,
+        amount: float,
+        trigger_price: float,
+    ) -> dict:
+        if side not in ORDER_SIDES:
+            raise ValutaTradeError(f"Неизвестная сторона ордера '{side}'")
+        if order_type not in ORDER_TYPES:
+            raise ValutaTradeError(f"Неизвестный тип ордера '{order_type}'")
+        if not isinstance(amount, (int, float)) or amount <= 0:
+            raise ValutaTradeError("'amount' должен быть положительным числом")
+        if not isinstance(trigger_price, (int, float)) or trigger_price <= 0:
+            raise ValutaTradeError("'trigger_price' должен быть положительным числом")
+
+        cur = get_currency(currency)
+        base_cur = get_currency(base)
+        if cur.code == base_cur.code:
+            raise ValutaTradeError("Валюта ордера и базовая валюта совпадают")
+
+        pair = f"{cur.code}_{base_cur.code}"
+        if pair not in self.pairs:
+            raise ValutaTradeError(
+                f"Курс пары {pair} не публикуется, ордер не сработает; "
+                f"доступные пары: {', '.join(sorted(self.pairs))}"
+            )
+
+        with self.lock, self._state_lock:
+            self._reload_if_changed()
+
+            order = {
+                "order_id": self._next_id,
+                "user_id": user_id,
+                "side": side,
+                "type": order_type,
+                "currency": cur.code,
+                "base": base_cur.code,
+                "amount": amount,
+                "trigger_price": float(trigger_price),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._add(order)
+            self.journal.append([{"op": "place", "order": order}])
+            self._maybe_compact()
+
+        return dict(order)
+
+    def cancel(self, order_id: int, user_id: int) -> dict:
+        with self.lock, self._state_lock:
+            self._reload_if_changed()
+
+            order = self._orders.get(order_id)
+            if order is None or order["user_id"] != user_id:
+                raise ValutaTradeError(f"Ордер #{order_id} не найден")
+
+            self._remove(order_id)
+            self.journal.append([{"op": "cancel", "order_id": order_id}])
+            self._maybe_compact()
+
+        return order
+
+    def list_orders(self, user_id: int) -> list[dict]:
+        with self._state_lock:
+            self._reload_if_changed()
+            return [dict(o) for o in self._orders.values() if o["user_id"] == user_id]
+
+    def user_ids(self) -> set[int]:
+        """
+        Пользователи с активными ордерами.
+        """
+        with self._state_lock:
+            self._reload_if_changed()
+            return {o["user_id"] for o in self._orders.values()}
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def on_snapshot(self, changed: dict[str, float], updated_at: str) -> list[dict]:
+        """
+        Подписчик RatesStorage: исполняет ордера, пересечённые новыми ценами.
+
+        Возвращает список исполнений:
+        {"order": ..., "price": ..., "status": "filled"/"rejected"/"error", ...}
+        """
+        with self.lock, self._state_lock:
+            self._reload_if_changed()
+
+            crossed: list[tuple[dict, float]] = []
+            for pair, price in changed.items():
+                index = self._indexes.get(pair)
+                if not index:
+                    continue
+                for order_id in index.pop_crossed(price):
+                    crossed.append((self._orders.pop(order_id), price))
+
+            fills: list[dict] = []
+            done = 0
+            try:
+                for order, price in crossed:
+                    fill = self._fill(order, price, updated_at)
+                    if fill["status"] == "error":
+                        # исход неизвестен: ордер остаётся в книге, повтор
+                        # исполнения защищён ключом идемпотентности ордера
+                        self._add(order)
+                    else:
+                        # исход — в журнал сразу: сбой на следующем ордере
+                        # не приведёт к повторному исполнению этого
+                        self.journal.append([{"op": fill["status"], "order_id": order["order_id"]}])
+                    fills.append(fill)
+                    done += 1
+            finally:
+                # прерванный проход: неисполненные ордера возвращаются в книгу
+                for order, _ in crossed[done:]:
+                    self._add(order)
+                self._maybe_compact()
+
+        return fills
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    @staticmethod
+    def _pair(order: dict) -> str:
+        return f"{order['currency']}_{order['base']}"
+
+    def _add(self, order: dict, keep_sorted: bool = True) -> None:
+        self._orders[order["order_id"]] = order
+        self._indexes.setdefault(self._pair(order), _PairIndex()).add(order, keep_sorted)
+        self._next_id = max(self._next_id, order["order_id"] + 1)
+
+    def _remove(self, order_id: int) -> dict | None:
+        order = self._orders.pop(order_id, None)
+        if order is not None:
+            self._indexes[self._pair(order)].remove(order)
+        return order
+
+    def _fill(self, order: dict, price: float, updated_at: str) -> dict:
+        fill = {"order": order, "price": price, "snapshot_at": updated_at}
+        try:
+            fill["result"] = self.executor(order, price)
+            fill["status"] = "filled"
+        except ValutaTradeError as e:
+            # например, на момент срабатывания не хватает средств
+            fill["status"] = "rejected"
+            fill["reason"] = str(e)
+            logger.warning(f"Order #{order['order_id']} rejected: {e}")
+        except Exception as e:
+            fill["status"] = "error"
+            fill["reason"] = str(e)
+            logger.exception(f"Order #{order['order_id']} failed: {e}")
+        return fill
+
+    def _apply(self, record: dict) -> None:
+        op = record["op"]
+        if op == "place":
+            if record["order"]["order_id"] not in self._orders:
+                self._add(record["order"])
+        elif op in _CLOSING_OPS:
+            self._remove(record["order_id"])
+        elif op == "next_id":
+            self._next_id = max(self._next_id, record["next_id"])
+
+    def _reload_if_changed(self) -> None:
+        reset, records = self.journal.read_new()
+        if not reset:
+            for record in records:
+                self._apply(record)
+            return
+
+        # журнал заменён — сначала итоговый набор ордеров, затем индексы
+        orders: dict[int, dict] = {}
+        next_id = 1
+        for record in records:
+            op = record["op"]
+            if op == "place":
+                order = record["order"]
+                orders[order["order_id"]] = order
+                # id снятых ордеров тоже заняты (ключи идемпотентности)
+                next_id = max(next_id, order["order_id"] + 1)
+            elif op in _CLOSING_OPS:
+                orders.pop(record["order_id"], None)
+            elif op == "next_id":
+                next_id = max(next_id, record["next_id"])
+
+        self._orders = {}
+        self._indexes = {}
+        self._next_id = next_id
+        # массовая загрузка: append + одна сортировка вместо insort на каждый
+        for order in orders.values():
+            self._add(order, keep_sorted=False)
+        for index in self._indexes.values():
+            index.sort()
+
+    def _state_records(self) -> list[dict]:
+        return [{"op": "next_id", "next_id": self._next_id}] + [
+            {"op": "place", "order": order} for order in self._orders.values()
+        ]
+
+    def _maybe_compact(self) -> None:
+        if self.journal.lines > COMPACT_FACTOR * len(self._orders) + 1000:
+            self.journal.rewrite(self._state_records())
+
+    def _migrate_legacy(self) -> None:
+        legacy = self.legacy_path
+        if legacy is None or legacy == self.path or not legacy.exists():
+            return
+
+        with self.lock:
+            if self.journal.exists() or not legacy.exists():
+                return
+
+            data = {}
+            if legacy.stat().st_size:
+                with open(legacy, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+
+            self._orders, self._indexes = {}, {}
+            self._next_id = data.get("next_id", 1)
+            for order in data.get("orders", []):
+                self._add(order, keep_sorted=False)
+            for index in self._indexes.values():
+                index.sort()
+
+            self.journal.rewrite(self._state_records())
+            legacy.rename(legacy.with_name(legacy.name + ".migrated"))
+
+
+def _execute_with_usecases(order: dict, price: float) -> dict:
+    # импорт здесь: usecases сам использует OrderBook
+    from valutatrade_hub.core import usecases
+
+    trade = usecases.buy_currency if order["side"] == "buy" else usecases.sell_currency
+    # ключ ордера: повторное срабатывание после сбоя (исполнено, но
+    # не записано в журнал) вернёт результат первого исполнения
+    return trade(
+        order["currency"],
+        order["amount"],
+        order["base"],
+        user={"user_id": order["user_id"]},
+        idempotency_key=f"order-{order['order_id']}",
+    )
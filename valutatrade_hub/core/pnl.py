@@ -0,0 +1,84 @@
+"""
+Себестоимость позиций и P&L по кошелькам.
+
+Состояние хранится прямо в кошельке портфеля и обновляется
+инкрементально на каждой сделке (без перепроигрывания истории):
+
+    "BTC": {
+        "balance": 0.5,
+        "lots": [[0.3, 59000.0], [0.2, 61000.0]],   # FIFO: [кол-во, цена]
+        "cost": 29900.0,                             # себестоимость остатка
+        "realized_pnl": 120.0
+    }
+
+Все суммы — в учётной валюте (DEFAULT_BASE_CURRENCY).
+Метод "average" хранит один лот со средней ценой.
+Нереализованный P&L = balance * текущая цена - cost, O(1) на кошелёк
+(считается в show_portfolio по текущему snapshot).
+"""
+
+COST_METHODS = ("fifo", "average")
+
+# остаток меньше этого считается нулевым (балансы округляются до 4 знаков)
+_DUST = 1e-9
+
+
+def _ensure_basis(wallet: dict, price: float) -> None:
+    """
+    Кошельки, созданные до учёта себестоимости: остаток принимается
+    одним лотом по текущей цене (открывающий лот).
+    """
+    if "cost" in wallet:
+        return
+
+    balance = wallet.get("balance", 0.0)
+    wallet["lots"] = [[balance, price]] if balance > _DUST else []
+    wallet["cost"] = balance * price
+    wallet["realized_pnl"] = 0.0
+
+
+def apply_buy(wallet: dict, amount: float, price: float, method: str) -> None:
+    """
+    Учитывает покупку amount по цене price. Вызывается до изменения balance.
+    """
+    _ensure_basis(wallet, price)
+
+    wallet["cost"] += amount * price
+
+    if method == "average":
+        quantity = sum(q for q, _ in wallet["lots"]) + amount
+        wallet["lots"] = [[quantity, wallet["cost"] / quantity]]
+    else:
+        wallet["lots"].append([amount, price])
+
+
+def apply_sell(wallet: dict, amount: float, price: float, method: str) -> float:
+    """
+    Учитывает продажу amount по цене price. Вызывается до изменения balance.
+    Возвращает реализованный P&L сделки.
+    """
+    _ensure_basis(wallet, price)
+
+    lots = wallet["lots"]
+    remaining = amount
+    released_cost = 0.0
+
+    # average — единственный лот, FIFO — с самого старого
+    while remaining > _DUST and lots:
+        quantity, lot_price = lots[0]
+        taken = min(quantity, remaining)
+        released_cost += taken * lot_price
+        remaining -= taken
+
+        if quantity - taken > _DUST:
+            lots[0][0] = quantity - taken
+        else:
+            lots.pop(0)
+
+    realized = amount * price - released_cost
+
+    wallet["cost"] = max(0.0, wallet["cost"] - released_cost) if lots else 0.0
+    wallet["realized_pnl"] = round(wallet["realized_pnl"] + realized, 8)
+
+    return realized
+
@@ -0,0 +1,67 @@
+"""
+Политики свежести курсов (TTL) по парам и классам валют.
+
+Источник — секция [tool.valutatrade.RATES_TTL] в pyproject.toml:
+
+    [tool.valutatrade.RATES_TTL]
+    crypto = 30        # пары, где одна из валют — CryptoCurrency
+    fiat = 3600        # пары, где одна из валют — FiatCurrency
+    SOL = 15           # пары с SOL (в любом направлении)
+    BTC_USD = 10       # конкретная пара
+
+Приоритет: пара → (для каждой из двух валют) код валюты → класс
+валюты → RATES_TTL_SECONDS. Из двух валют берётся меньший TTL:
+BTC_USD и USD_BTC живут по правилу crypto, а не fiat.
+"""
+
+from valutatrade_hub.core.currencies import CryptoCurrency, FiatCurrency, get_currency
+from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+
+
+class RatesPolicy:
+    def __init__(self, policies: dict[str, int], default_ttl: int) -> None:
+        self.default_ttl = default_ttl
+        self._policies = {
+            key if "_" in key or key.upper() == key else key.lower(): int(ttl)
+            for key, ttl in policies.items()
+        }
+        self._cache: dict[str, int] = {}
+
+    def ttl_for(self, pair: str) -> int:
+        """
+        TTL пары в секундах (результат кешируется).
+        """
+        ttl = self._cache.get(pair)
+        if ttl is None:
+            ttl = self._cache[pair] = self._resolve(pair)
+        return ttl
+
+    def _resolve(self, pair: str) -> int:
+        if pair in self._policies:
+            return self._policies[pair]
+
+        from_code, _, to_code = pair.partition("_")
+        return min(self._resolve_code(from_code), self._resolve_code(to_code))
+
+    def _resolve_code(self, code: str) -> int:
+        if code in self._policies:
+            return self._policies[code]
+
+        currency_class = self._currency_class(code)
+        if currency_class in self._policies:
+            return self._policies[currency_class]
+
+        return self.default_ttl
+
+    @staticmethod
+    def _currency_class(code: str) -> str | None:
+        try:
+            currency = get_currency(code)
+        except CurrencyNotFoundError:
+            return None
+
+        if isinstance(currency, CryptoCurrency):
+            return "crypto"
+        if isinstance(currency, FiatCurrency):
+            return "fiat"
+        return None
@@ -1,16 +1,35 @@
 import json
+import logging
 import os
-from datetime import datetime, timedelta
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 
 from valutatrade_hub.core.models import User
 from valutatrade_hub.core.currencies import get_currency
+from valutatrade_hub.core.alerts import AlertBook
+from valutatrade_hub.core.cold_storage import ColdStore
+from valutatrade_hub.core.leaderboard import Leaderboard
+from valutatrade_hub.core.ledger import TradeLedger
+from valutatrade_hub.core.idempotency import IdempotencyStore
+from valutatrade_hub.core.orders import OrderBook
+from valutatrade_hub.core import pnl, valuation
+from valutatrade_hub.core.rate_policy import RatesPolicy
 from valutatrade_hub.core.exceptions import (
     ValutaTradeError,
     InsufficientFundsError,
     ApiRequestError,
+    StorageCorruptedError,
 )
 from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.infra.json_stream import iter_json_array
+from valutatrade_hub.infra.locks import FileLock
+from valutatrade_hub.infra.shards import ShardedPortfolios
 from valutatrade_hub.decorators import log_action
+from valutatrade_hub.parser_service.snapshot import RatesSnapshotReader
 
 
 # =========================
@@ -21,11 +40,45 @@ settings = SettingsLoader()
 
 USERS_FILE = settings.get("USERS_FILE")
 PORTFOLIOS_FILE = settings.get("PORTFOLIOS_FILE")
+PORTFOLIOS_DIR = settings.get("PORTFOLIOS_DIR")
+PORTFOLIO_SHARDS = settings.get("PORTFOLIO_SHARDS")
 CURRENT_USER_FILE = settings.get("CURRENT_USER_FILE")
 RATES_FILE = settings.get("RATES_FILE")
+RATES_BINARY_FILE = settings.get("RATES_BINARY_FILE")
+RISK_FILE = settings.get("RISK_FILE")
 
 RATES_TTL_SECONDS = settings.get("RATES_TTL_SECONDS")
+RATES_POLICY = RatesPolicy(
+    settings.get("RATES_TTL_POLICIES", {}),
+    default_ttl=RATES_TTL_SECONDS,
+)
+RATES_STALE_GRACE_SECONDS = settings.get("RATES_STALE_GRACE_SECONDS")
+RATES_REFRESH_TIMEOUT_SECONDS = settings.get("RATES_REFRESH_TIMEOUT_SECONDS")
+LOCKS_DIR = settings.get("LOCKS_DIR")
+ORDERS_FILE = settings.get("ORDERS_FILE")
+ALERTS_FILE = settings.get("ALERTS_FILE")
+ALERTS_OUTBOX_FILE = settings.get("ALERTS_OUTBOX_FILE")
+LEADERBOARD_FILE = settings.get("LEADERBOARD_FILE")
+LEDGER_DIR = settings.get("LEDGER_DIR")
+IDEMPOTENCY_FILE = settings.get("IDEMPOTENCY_FILE")
+COLD_STORAGE_DIR = settings.get("COLD_STORAGE_DIR")
+ACTIVITY_FILE = settings.get("ACTIVITY_FILE")
+PORTFOLIO_CHANGES_FILE = settings.get("PORTFOLIO_CHANGES_FILE")
+ARCHIVE_INACTIVE_DAYS = settings.get("ARCHIVE_INACTIVE_DAYS")
+IDEMPOTENCY_TTL_SECONDS = settings.get("IDEMPOTENCY_TTL_SECONDS")
+IDEMPOTENCY_MAX_KEYS = settings.get("IDEMPOTENCY_MAX_KEYS")
 DEFAULT_BASE_CURRENCY = settings.get("DEFAULT_BASE_CURRENCY")
+LOG_DIR = settings.get("LOG_DIR")
+
+# VaR портфеля в show_portfolio: 95%, горизонт — сутки
+VAR_Z_95 = 1.645
+VAR_HORIZON_SECONDS = 86400
+COST_BASIS_METHOD = settings.get("COST_BASIS_METHOD")
+
+if COST_BASIS_METHOD not in pnl.COST_METHODS:
+    raise ValutaTradeError(
+        f"COST_BASIS_METHOD должен быть одним из {pnl.COST_METHODS}"
+    )
 
 
 # =========================
@@ -43,25 +96,57 @@ def _load_json(path):
     try:
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
-    except json.JSONDecodeError:
-        return None
+    except json.JSONDecodeError as e:
+        # битый файл — это ошибка, а не "нет данных"
+        raise StorageCorruptedError(str(path), str(e)) from e
 
 
 def _save_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
-
+    # временный файл → rename: параллельные читатели
+    # никогда не видят наполовину записанный файл
+    with tempfile.NamedTemporaryFile(
+        mode="w",
+        encoding="utf-8",
+        delete=False,
+        dir=path.parent,
+    ) as tmp:
+        json.dump(data, tmp, indent=4, ensure_ascii=False)
+        temp_name = tmp.name
+
+    os.replace(temp_name, path)
+
+
+def _get_current_user(user: dict = None):
+    """
+    Пользователь операции: явно переданная сессия (HTTP API)
+    или глобальная сессия CLI (current_user.json).
+    """
+    if user:
+        return user
 
-def _get_current_user():
     data = _load_json(CURRENT_USER_FILE)
     if not data:
         raise ValutaTradeError("Сначала выполните login")
     return data
 
 
-def _is_fresh(ts: str) -> bool:
+def _is_fresh(ts: str, max_age: int) -> bool:
     updated = datetime.fromisoformat(ts)
-    return datetime.now() - updated <= timedelta(seconds=RATES_TTL_SECONDS)
+    # метки Parser Service — UTC с "Z", метки stub — локальные naive
+    now = datetime.now(timezone.utc) if updated.tzinfo else datetime.now()
+    return now - updated <= timedelta(seconds=max_age)
+
+
+def _checked_at(entry: dict) -> str:
+    """
+    Время последнего подтверждения курса: heartbeat Parser Service
+    (checked_at), а без него — время изменения.
+    """
+    return entry.get("checked_at") or entry["updated_at"]
+
+
+def _rates_lock() -> FileLock:
+    return FileLock(RATES_FILE.with_suffix(".lock"))
 
 
 def _load_rates() -> dict:
@@ -69,6 +154,51 @@ def _load_rates() -> dict:
     return data or {}
 
 
+# mmap-читатель бинарного snapshot Parser Service (rates.bin):
+# один на процесс, переоткрывается только при публикации нового snapshot
+_rates_reader = RatesSnapshotReader(RATES_BINARY_FILE)
+
+
+def _get_snapshot_rate(from_code: str, to_code: str) -> dict | None:
+    """
+    Быстрый путь get_rate: курс из rates.bin без разбора JSON.
+
+    Та же политика, что и в get_rate: в пределах TTL — свежий курс,
+    в пределах TTL + RATES_STALE_GRACE_SECONDS — stale=True и фоновое
+    обновление пары, старше — None (синхронное обновление).
+    """
+    key = f"{from_code}_{to_code}"
+    hit = _rates_reader.get(key)
+    if hit is None:
+        return None
+
+    rate, updated_ts, checked_ts = hit
+    age = time.time() - checked_ts
+    ttl = RATES_POLICY.ttl_for(key)
+    if age > ttl + RATES_STALE_GRACE_SECONDS:
+        return None
+
+    stale = age > ttl
+    if stale:
+        _schedule_refresh(from_code, to_code)
+
+    reverse = _rates_reader.get(f"{to_code}_{from_code}")
+
+    return {
+        "from": from_code,
+        "to": to_code,
+        "rate": rate,
+        "reverse_rate": reverse[0] if reverse else None,
+        "updated_at": datetime.fromtimestamp(updated_ts, timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        ),
+        "checked_at": datetime.fromtimestamp(checked_ts, timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        ),
+        "stale": stale,
+    }
+
+
 # =========================
 # Parser Service STUB
 # =========================
@@ -90,57 +220,137 @@ def _parser_stub(from_currency: str, to_currency: str):
     }
 
 
+# =========================
+# streaming access (users / portfolios)
+# =========================
+
+def iter_users():
+    """
+    Потоково перебирает записи users.json по одной.
+    """
+    return iter_json_array(USERS_FILE)
+
+
+# портфели разложены по шардам (infra.shards); portfolios.json
+# переносится в шарды при первом обращении
+_portfolios = ShardedPortfolios(
+    PORTFOLIOS_DIR,
+    PORTFOLIO_SHARDS,
+    legacy_path=PORTFOLIOS_FILE,
+    locks_dir=LOCKS_DIR,
+)
+
+
+def iter_portfolios():
+    """
+    Потоково перебирает портфели по одному (шард за шардом).
+    """
+    return _portfolios.iter_all()
+
+
+def find_user(user_id: int = None, username: str = None) -> dict | None:
+    """
+    Поиск пользователя с остановкой на первом совпадении.
+    """
+    for u in iter_users():
+        if user_id is not None and u["user_id"] == user_id:
+            return u
+        if username is not None and u["username"] == username:
+            return u
+    return None
+
+
+def find_portfolio(user_id: int) -> dict | None:
+    """
+    Поиск портфеля в шарде пользователя (только чтение).
+    """
+    return _portfolios.get(user_id)
+
+
 # =========================
 # portfolio helpers
 # =========================
 
-def _get_user_portfolio(user_id: int):
-    portfolios = _load_json(PORTFOLIOS_FILE) or []
-    for p in portfolios:
-        if p["user_id"] == user_id:
-            return p, portfolios
-    raise ValutaTradeError("Портфель пользователя не найден")
+@contextmanager
+def _user_portfolio(user_id: int):
+    """
+    Портфель для изменения: шард пользователя читается и записывается
+    под lock шарда. Исключение внутри блока — шард не записывается.
+    """
+    with _portfolios.writing(user_id) as path:
+        portfolios = _load_json(path) or []
+        for p in portfolios:
+            if p["user_id"] == user_id:
+                break
+        else:
+            raise ValutaTradeError("Портфель пользователя не найден")
+
+        yield p
+        _save_json(path, portfolios)
 
 
 # =========================
 # register / login
 # =========================
 
+def _users_lock() -> FileLock:
+    # запись users.json: регистрация, архивация, возврат из архива
+    return FileLock(LOCKS_DIR / "users.lock")
+
+
 def register_user(username: str, password: str) -> dict:
     if not username or not username.strip():
         raise ValutaTradeError("Имя пользователя не может быть пустым")
     if not isinstance(password, str) or len(password) < 4:
         raise ValutaTradeError("Пароль должен быть не короче 4 символов")
 
-    users = _load_json(USERS_FILE) or []
-
-    if any(u["username"] == username for u in users):
-        raise ValutaTradeError(f"Имя пользователя '{username}' уже занято")
-
-    user_id = max((u["user_id"] for u in users), default=0) + 1
     salt = User.generate_salt()
     hashed_password = User.hash_password(password, salt)
+    cold = get_cold_store()
+
+    with _users_lock():
+        users = _load_json(USERS_FILE) or []
+
+        if username in cold or any(u["username"] == username for u in users):
+            raise ValutaTradeError(f"Имя пользователя '{username}' уже занято")
+
+        # id архивных пользователей не выдаются повторно
+        user_id = max(
+            max((u["user_id"] for u in users), default=0),
+            cold.max_user_id,
+        ) + 1
+
+        users.append({
+            "user_id": user_id,
+            "username": username,
+            "hashed_password": hashed_password,
+            "salt": salt,
+            "registration_date": datetime.now().isoformat(),
+        })
 
-    users.append({
-        "user_id": user_id,
-        "username": username,
-        "hashed_password": hashed_password,
-        "salt": salt,
-        "registration_date": datetime.now().isoformat(),
-    })
-
-    _save_json(USERS_FILE, users)
+        _save_json(USERS_FILE, users)
 
-    portfolios = _load_json(PORTFOLIOS_FILE) or []
-    portfolios.append({"user_id": user_id, "wallets": {}})
-    _save_json(PORTFOLIOS_FILE, portfolios)
+    with _portfolios.writing(user_id) as path:
+        portfolios = _load_json(path) or []
+        portfolios.append({"user_id": user_id, "wallets": {}})
+        _save_json(path, portfolios)
 
+    _record_portfolio_changes([user_id], "upsert")
     return {"user_id": user_id, "username": username}
 
 
-def login_user(username: str, password: str) -> dict:
-    users = _load_json(USERS_FILE) or []
-    user_data = next((u for u in users if u["username"] == username), None)
+def authenticate_user(username: str, password: str) -> dict:
+    """
+    Проверка логина/пароля без записи глобальной сессии CLI.
+    """
+    user_data = find_user(username=username)
+    cold = get_cold_store()
+
+    archived = None
+    if username in cold:
+        # аккаунт в холодном хранилище (или возврат из него был прерван)
+        archived = cold.get(username)
+        user_data = user_data or archived["user"]
 
     if not user_data:
         raise ValutaTradeError(f"Пользователь '{username}' не найден")
@@ -156,7 +366,16 @@ def login_user(username: str, password: str) -> dict:
     if not user.verify_password(password):
         raise ValutaTradeError("Неверный пароль")
 
-    current_user = {"user_id": user.user_id, "username": user.username}
+    # возврат из архива — только после проверки пароля
+    if archived is not None:
+        _rehydrate(archived)
+    _record_activity(user.user_id, "login")
+
+    return {"user_id": user.user_id, "username": user.username}
+
+
+def login_user(username: str, password: str) -> dict:
+    current_user = authenticate_user(username, password)
     _save_json(CURRENT_USER_FILE, current_user)
     return current_user
 
@@ -165,65 +384,169 @@ def login_user(username: str, password: str) -> dict:
 # get-rate (3.5)
 # =========================
 
-def get_rate(from_currency: str, to_currency: str) -> dict:
-    from_cur = get_currency(from_currency)
-    to_cur = get_currency(to_currency)
-
-    rates = _load_rates()
-    direct_key = f"{from_cur.code}_{to_cur.code}"
-    reverse_key = f"{to_cur.code}_{from_cur.code}"
-
-    if direct_key in rates and _is_fresh(rates[direct_key]["updated_at"]):
-        rate = rates[direct_key]["rate"]
-        updated = rates[direct_key]["updated_at"]
-
-    else:
-        stub = _parser_stub(from_cur.code, to_cur.code)
+def _refresh_pair(from_code: str, to_code: str) -> dict:
+    """
+    Синхронное обновление курса пары через Parser Service (stub)
+    с записью в rates.json. Возвращает {"rate", "updated_at"}.
+
+    Чтение-изменение-запись rates.json — под тем же lock-файлом, что
+    и RatesStorage.save_snapshot: иначе каждый из писателей может
+    потерять пары, только что записанные другим.
+    """
+    with _rates_lock():
+        rates = _load_rates()
+        direct_key = f"{from_code}_{to_code}"
+        reverse_key = f"{to_code}_{from_code}"
+
+        stub = _parser_stub(from_code, to_code)
         if stub:
             rates[direct_key] = stub
             rates["last_refresh"] = stub["updated_at"]
             _save_json(RATES_FILE, rates)
-            rate = stub["rate"]
-            updated = stub["updated_at"]
+            return stub
 
-        elif reverse_key in rates and _is_fresh(rates[reverse_key]["updated_at"]):
+        if reverse_key in rates and _is_fresh(
+            _checked_at(rates[reverse_key]), RATES_POLICY.ttl_for(reverse_key)
+        ):
             reverse_rate = rates[reverse_key]["rate"]
-            rate = round(1 / reverse_rate, 8)
-            updated = rates[reverse_key]["updated_at"]
-
-            rates[direct_key] = {
-                "rate": rate,
-                "updated_at": updated,
+            entry = {
+                "rate": round(1 / reverse_rate, 8),
+                "updated_at": rates[reverse_key]["updated_at"],
             }
+            rates[direct_key] = entry
             _save_json(RATES_FILE, rates)
+            return entry
+
+        reverse_stub = _parser_stub(to_code, from_code)
+        if not reverse_stub:
+            raise ApiRequestError(f"курс {from_code}→{to_code} недоступен")
+
+        entry = {
+            "rate": round(1 / reverse_stub["rate"], 8),
+            "updated_at": reverse_stub["updated_at"],
+        }
+        rates[reverse_key] = reverse_stub
+        rates[direct_key] = entry
+        rates["last_refresh"] = entry["updated_at"]
+        _save_json(RATES_FILE, rates)
+        return entry
+
+
+# обновления "в полёте": pair → Event (схлопывание между потоками)
+_inflight: dict[str, threading.Event] = {}
+_inflight_lock = threading.Lock()
+
+
+def _refresh_coalesced(from_code: str, to_code: str) -> dict:
+    """
+    Обновление пары, схлопнутое между потоками и процессами:
+    одновременно пару обновляет только один вызов, остальные
+    дожидаются его результата и читают rates.json.
+    """
+    key = f"{from_code}_{to_code}"
+
+    with _inflight_lock:
+        event = _inflight.get(key)
+        leader = event is None
+        if leader:
+            event = _inflight[key] = threading.Event()
+
+    if not leader:
+        event.wait(RATES_REFRESH_TIMEOUT_SECONDS)
+        entry = _load_rates().get(key)
+        if entry and _is_fresh(_checked_at(entry), RATES_POLICY.ttl_for(key)):
+            return entry
+        return _refresh_pair(from_code, to_code)
 
-        else:
-            reverse_stub = _parser_stub(to_cur.code, from_cur.code)
-            if not reverse_stub:
-                raise ApiRequestError(
-                    f"курс {from_cur.code}→{to_cur.code} недоступен"
-                )
+    try:
+        lock = FileLock(
+            LOCKS_DIR / f"rate-{key}.lock",
+            timeout=RATES_REFRESH_TIMEOUT_SECONDS,
+        )
+        if lock.try_acquire():
+            try:
+                return _refresh_pair(from_code, to_code)
+            finally:
+                lock.release()
+
+        # пару уже обновляет другой процесс — ждём его результата
+        lock.wait_released(RATES_REFRESH_TIMEOUT_SECONDS)
+        entry = _load_rates().get(key)
+        if entry and _is_fresh(_checked_at(entry), RATES_POLICY.ttl_for(key)):
+            return entry
+        return _refresh_pair(from_code, to_code)
+
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        event.set()
+
+
+def _schedule_refresh(from_code: str, to_code: str) -> None:
+    """
+    Фоновое обновление пары (stale-while-revalidate).
+    Если пара уже обновляется в этом процессе — ничего не делает.
+    """
+    if f"{from_code}_{to_code}" in _inflight:
+        return
+
+    def worker():
+        try:
+            _refresh_coalesced(from_code, to_code)
+        except Exception as e:
+            logging.getLogger("valutatrade").warning(
+                f"Background refresh {from_code}_{to_code} failed: {e}"
+            )
+
+    threading.Thread(target=worker, daemon=True).start()
 
-            reverse_rate = reverse_stub["rate"]
-            rate = round(1 / reverse_rate, 8)
-            updated = reverse_stub["updated_at"]
 
-            rates[reverse_key] = reverse_stub
-            rates[direct_key] = {
-                "rate": rate,
-                "updated_at": updated,
-            }
-            rates["last_refresh"] = updated
-            _save_json(RATES_FILE, rates)
+def get_rate(from_currency: str, to_currency: str) -> dict:
+    """
+    Курс from → to.
+
+    - свежий курс (в пределах TTL пары, см. RATES_POLICY) — из кеша;
+      возраст считается от последнего подтверждения (checked_at);
+    - устаревший, но в пределах RATES_STALE_GRACE_SECONDS — отдаётся
+      сразу с флагом stale=True, а обновление пары идёт в фоне;
+    - ещё старше или отсутствует — синхронное (схлопнутое) обновление.
+    """
+    from_cur = get_currency(from_currency)
+    to_cur = get_currency(to_currency)
+
+    cached = _get_snapshot_rate(from_cur.code, to_cur.code)
+    if cached:
+        return cached
+
+    rates = _load_rates()
+    direct_key = f"{from_cur.code}_{to_cur.code}"
+    reverse_key = f"{to_cur.code}_{from_cur.code}"
+
+    entry = rates.get(direct_key)
+    ttl = RATES_POLICY.ttl_for(direct_key)
+    stale = False
+
+    if entry and _is_fresh(_checked_at(entry), ttl):
+        pass
+
+    elif entry and _is_fresh(_checked_at(entry), ttl + RATES_STALE_GRACE_SECONDS):
+        stale = True
+        _schedule_refresh(from_cur.code, to_cur.code)
+
+    else:
+        entry = _refresh_coalesced(from_cur.code, to_cur.code)
+        rates = _load_rates()
 
     reverse_rate = rates.get(reverse_key, {}).get("rate")
 
     return {
         "from": from_cur.code,
         "to": to_cur.code,
-        "rate": rate,
+        "rate": entry["rate"],
         "reverse_rate": reverse_rate,
-        "updated_at": updated,
+        "updated_at": entry["updated_at"],
+        "checked_at": _checked_at(entry),
+        "stale": stale,
     }
 
 
@@ -231,9 +554,99 @@ def get_rate(from_currency: str, to_currency: str) -> dict:
 # buy / sell (3.5)
 # =========================
 
+_ledger = None
+
+
+def get_ledger() -> TradeLedger:
+    global _ledger
+    if _ledger is None:
+        _ledger = TradeLedger(LEDGER_DIR, lock_path=LOCKS_DIR / "ledger.lock")
+    return _ledger
+
+
+def _record_trade(side: str, value: float, result: dict, **extra) -> int:
+    """
+    Запись сделки в ledger; возвращает trade_id.
+    extra["prices"] — цены затронутых валют в учётной валюте: по ним
+    рейтинг догоняет ledger (Leaderboard.catch_up), не участвуя в сделке.
+    """
+    record = get_ledger().append({
+        "user_id": result["user_id"],
+        "side": side,
+        "currency": result["currency"],
+        "base": result["base"],
+        "pair": f"{result['currency']}_{result['base']}",
+        "amount": result["amount"],
+        "rate": result["rate"],
+        "before": result["before"],
+        "after": result["after"],
+        "value": value,
+        **extra,
+    })
+    return record["trade_id"]
+
+
+def _accounting_price(code: str, base_code: str = None, rate: float = None) -> float:
+    """
+    Цена единицы code в учётной валюте (себестоимость и P&L ведутся в ней).
+    rate — уже известный курс code → base_code, если он есть.
+    """
+    if code == DEFAULT_BASE_CURRENCY:
+        return 1.0
+    if base_code == DEFAULT_BASE_CURRENCY and rate is not None:
+        return rate
+    return get_rate(code, DEFAULT_BASE_CURRENCY)["rate"]
+
+
+def _cross_rate(src_code: str, dst_code: str) -> tuple[float, float, float]:
+    """
+    (курс src → dst, цена src, цена dst в учётной валюте).
+
+    Parser Service публикует только пары *_USD, прямого курса src → dst
+    обычно нет: кросс-курс выводится из двух ног к учётной валюте (они
+    нужны и для себестоимости). Обе ноги читаются из одного
+    опубликованного snapshot (rates.bin, одно отображение) — курс
+    согласован. Если свежей ноги в snapshot нет, обе запрашиваются
+    через get_rate с обновлением и могут прийти из разных обновлений.
+    """
+    legs = {
+        code: f"{code}_{DEFAULT_BASE_CURRENCY}"
+        for code in (src_code, dst_code)
+        if code != DEFAULT_BASE_CURRENCY
+    }
+    hits = _rates_reader.get_many(legs.values())
+    now = time.time()
+
+    prices = {DEFAULT_BASE_CURRENCY: 1.0}
+    for code, key in legs.items():
+        hit = hits.get(key)
+        if hit is None:
+            break
+        rate, _, checked_ts = hit
+        age = now - checked_ts
+        ttl = RATES_POLICY.ttl_for(key)
+        if age > ttl + RATES_STALE_GRACE_SECONDS:
+            break
+        if age > ttl:
+            _schedule_refresh(code, DEFAULT_BASE_CURRENCY)
+        prices[code] = rate
+    else:
+        return prices[src_code] / prices[dst_code], prices[src_code], prices[dst_code]
+
+    src_price = _accounting_price(src_code)
+    dst_price = _accounting_price(dst_code)
+    return src_price / dst_price, src_price, dst_price
+
+
 @log_action("BUY", verbose=True)
-def buy_currency(currency: str, amount: float, base_currency: str = None) -> dict:
-    user_id = _get_current_user()["user_id"]
+def _buy_currency(
+    currency: str,
+    amount: float,
+    base_currency: str = None,
+    user: dict = None,
+) -> dict:
+    user = _get_current_user(user)
+    user_id = user["user_id"]
 
     if not isinstance(amount, (int, float)) or amount <= 0:
         raise ValutaTradeError("'amount' должен быть положительным числом")
@@ -244,18 +657,19 @@ def buy_currency(currency: str, amount: float, base_currency: str = None) -> dic
     base = get_currency(base_currency)
 
     rate = get_rate(cur.code, base.code)["rate"]
+    price = _accounting_price(cur.code, base.code, rate)
 
-    portfolio, portfolios = _get_user_portfolio(user_id)
-    wallets = portfolio.setdefault("wallets", {})
+    # курсы получены до захвата шарда: lock не ждёт сети
+    with _user_portfolio(user_id) as portfolio:
+        wallets = portfolio.setdefault("wallets", {})
+        wallet = wallets.setdefault(cur.code, {"balance": 0.0})
 
-    wallet = wallets.setdefault(cur.code, {"balance": 0.0})
+        pnl.apply_buy(wallet, amount, price, COST_BASIS_METHOD)
 
-    before = wallet["balance"]
-    wallet["balance"] = round(before + amount, 4)
+        before = wallet["balance"]
+        wallet["balance"] = round(before + amount, 4)
 
-    _save_json(PORTFOLIOS_FILE, portfolios)
-
-    return {
+    result = {
         "user_id": user_id,
         "currency": cur.code,
         "amount": amount,
@@ -265,11 +679,21 @@ def buy_currency(currency: str, amount: float, base_currency: str = None) -> dic
         "after": wallet["balance"],
         "cost": round(amount * rate, 2),
     }
+    result["trade_id"] = _record_trade(
+        "buy", result["cost"], result, prices={cur.code: price}
+    )
+    return result
 
 
 @log_action("SELL", verbose=True)
-def sell_currency(currency: str, amount: float, base_currency: str = None) -> dict:
-    user_id = _get_current_user()["user_id"]
+def _sell_currency(
+    currency: str,
+    amount: float,
+    base_currency: str = None,
+    user: dict = None,
+) -> dict:
+    user = _get_current_user(user)
+    user_id = user["user_id"]
 
     if not isinstance(amount, (int, float)) or amount <= 0:
         raise ValutaTradeError("'amount' должен быть положительным числом")
@@ -279,28 +703,30 @@ def sell_currency(currency: str, amount: float, base_currency: str = None) -> di
     cur = get_currency(currency)
     base = get_currency(base_currency)
 
-    portfolio, portfolios = _get_user_portfolio(user_id)
-    wallets = portfolio.get("wallets", {})
+    rate = get_rate(cur.code, base.code)["rate"]
+    price = _accounting_price(cur.code, base.code, rate)
 
-    if cur.code not in wallets:
-        raise ValutaTradeError(f"У вас нет кошелька '{cur.code}'")
+    # курсы получены до захвата шарда: lock не ждёт сети
+    with _user_portfolio(user_id) as portfolio:
+        wallets = portfolio.get("wallets", {})
 
-    wallet = wallets[cur.code]
-    before = wallet["balance"]
+        if cur.code not in wallets:
+            raise ValutaTradeError(f"У вас нет кошелька '{cur.code}'")
 
-    if amount > before:
-        raise InsufficientFundsError(
-            available=round(before, 4),
-            required=round(amount, 4),
-            code=cur.code,
-        )
+        wallet = wallets[cur.code]
+        before = wallet["balance"]
 
-    rate = get_rate(cur.code, base.code)["rate"]
-    wallet["balance"] = round(before - amount, 4)
+        if amount > before:
+            raise InsufficientFundsError(
+                available=round(before, 4),
+                required=round(amount, 4),
+                code=cur.code,
+            )
 
-    _save_json(PORTFOLIOS_FILE, portfolios)
+        realized = pnl.apply_sell(wallet, amount, price, COST_BASIS_METHOD)
+        wallet["balance"] = round(before - amount, 4)
 
-    return {
+    result = {
         "user_id": user_id,
         "currency": cur.code,
         "amount": amount,
@@ -309,39 +735,877 @@ def sell_currency(currency: str, amount: float, base_currency: str = None) -> di
         "before": before,
         "after": wallet["balance"],
         "proceeds": round(amount * rate, 2),
+        "realized_pnl": round(realized, 2),
+        "pnl_currency": DEFAULT_BASE_CURRENCY,
     }
+    result["trade_id"] = _record_trade(
+        "sell", result["proceeds"], result, prices={cur.code: price}
+    )
+    return result
+
+
+def buy_currency(
+    currency: str,
+    amount: float,
+    base_currency: str = None,
+    user: dict = None,
+    idempotency_key: str = None,
+) -> dict:
+    """
+    Покупка валюты. С idempotency_key повтор запроса возвращает
+    результат первого выполнения (с "replayed": True), не меняя портфель.
+    """
+    return _idempotent(
+        "buy", currency, amount, base_currency, user, idempotency_key, _buy_currency
+    )
+
+
+def sell_currency(
+    currency: str,
+    amount: float,
+    base_currency: str = None,
+    user: dict = None,
+    idempotency_key: str = None,
+) -> dict:
+    """
+    Продажа валюты; idempotency_key — как в buy_currency.
+    """
+    return _idempotent(
+        "sell", currency, amount, base_currency, user, idempotency_key, _sell_currency
+    )
+
+
+@log_action("CONVERT", verbose=True)
+def _convert_currency(
+    from_currency: str,
+    amount: float,
+    to_currency: str,
+    user: dict = None,
+) -> dict:
+    user = _get_current_user(user)
+    user_id = user["user_id"]
+
+    if not isinstance(amount, (int, float)) or amount <= 0:
+        raise ValutaTradeError("'amount' должен быть положительным числом")
+
+    src = get_currency(from_currency)
+    dst = get_currency(to_currency)
+    if src.code == dst.code:
+        raise ValutaTradeError("Исходная и целевая валюты совпадают")
+
+    # кросс-курс — один раз, из одного snapshot (см. _cross_rate)
+    rate, src_price, dst_price = _cross_rate(src.code, dst.code)
+    received = round(amount * rate, 8)
+
+    # обе стороны — одной записью шарда пользователя
+    with _user_portfolio(user_id) as portfolio:
+        wallets = portfolio.setdefault("wallets", {})
+
+        if src.code not in wallets:
+            raise ValutaTradeError(f"У вас нет кошелька '{src.code}'")
+
+        source = wallets[src.code]
+        before = source["balance"]
+        if amount > before:
+            raise InsufficientFundsError(
+                available=round(before, 4),
+                required=round(amount, 4),
+                code=src.code,
+            )
+
+        target = wallets.setdefault(dst.code, {"balance": 0.0})
+        target_before = target["balance"]
+
+        realized = pnl.apply_sell(source, amount, src_price, COST_BASIS_METHOD)
+        pnl.apply_buy(target, received, dst_price, COST_BASIS_METHOD)
+
+        source["balance"] = round(before - amount, 4)
+        target["balance"] = round(target_before + received, 4)
+
+    result = {
+        "user_id": user_id,
+        "currency": src.code,
+        "amount": amount,
+        "rate": rate,
+        "base": dst.code,
+        "before": before,
+        "after": source["balance"],
+        "received": received,
+        "target_before": target_before,
+        "target_after": target["balance"],
+        "realized_pnl": round(realized, 2),
+        "pnl_currency": DEFAULT_BASE_CURRENCY,
+    }
+    result["trade_id"] = _record_trade(
+        "convert",
+        received,
+        result,
+        target_before=target_before,
+        target_after=target["balance"],
+        prices={src.code: src_price, dst.code: dst_price},
+    )
+    return result
+
+
+def convert_currency(
+    from_currency: str,
+    to_currency: str,
+    amount: float,
+    user: dict = None,
+    idempotency_key: str = None,
+) -> dict:
+    """
+    Обмен amount from_currency на to_currency одной операцией:
+    один кросс-курс (из ног к учётной валюте одного snapshot), одна
+    запись портфеля, одно событие CONVERT в логе.
+    """
+    return _idempotent(
+        "convert",
+        from_currency,
+        amount,
+        to_currency,
+        user,
+        idempotency_key,
+        lambda cur, amt, to, user: _convert_currency(cur, amt, to, user=user),
+    )
+
+
+# =========================
+# idempotency
+# =========================
+
+_idempotency_store = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _idempotency_store
+    if _idempotency_store is None:
+        _idempotency_store = IdempotencyStore(
+            IDEMPOTENCY_FILE,
+            ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+            max_keys=IDEMPOTENCY_MAX_KEYS,
+            lock_path=LOCKS_DIR / "idempotency.lock",
+        )
+    return _idempotency_store
+
+
+def _idempotent(
+    side: str,
+    currency: str,
+    amount: float,
+    base_currency: str | None,
+    user: dict | None,
+    key: str | None,
+    trade,
+) -> dict:
+    if not key:
+        return trade(currency, amount, base_currency, user=user)
+
+    user = _get_current_user(user)
+    # ключ привязан к параметрам: тот же ключ с другой сделкой — ошибка
+    fingerprint = json.dumps(
+        [side, str(currency).upper(), amount, base_currency or DEFAULT_BASE_CURRENCY]
+    )
+
+    store = get_idempotency_store()
+    # проверка, сделка и запись ключа — под lock области ключа:
+    # параллельный ретрай ждёт и получает сохранённый результат,
+    # сделки с другими ключами не ждут
+    with store.scope_lock(user["user_id"], key):
+        previous = store.get(user["user_id"], key, fingerprint)
+        if previous is not None:
+            return {**previous, "replayed": True}
+
+        result = trade(currency, amount, base_currency, user=user)
+        store.put(user["user_id"], key, fingerprint, result)
+
+    return result
+
+
+# =========================
+# trade history
+# =========================
+
+def list_trades(
+    limit: int = 50,
+    cursor: int = None,
+    since: str = None,
+    until: str = None,
+    currency: str = None,
+    user: dict = None,
+) -> dict:
+    """
+    Сделки пользователя от новых к старым, постранично:
+    следующую страницу даёт cursor=next_cursor.
+    """
+    user_id = _get_current_user(user)["user_id"]
+    if currency:
+        currency = get_currency(currency).code
+
+    try:
+        return get_ledger().query(
+            user_id,
+            limit=limit,
+            cursor=cursor,
+            since=since,
+            until=until,
+            currency=currency,
+        )
+    except ValueError as e:
+        # некорректные since / until
+        raise ValutaTradeError(f"Некорректная дата: {e}") from e
 
 
 # =========================
 # show portfolio
 # =========================
 
-def show_portfolio(base_currency: str = None) -> dict:
-    user = _get_current_user()
+def _daily_volatility(stats: dict | None) -> float | None:
+    """
+    Волатильность пары за VAR_HORIZON_SECONDS из EWMA-оценки Parser Service.
+    """
+    if not stats:
+        return None
+    sigma = stats.get("ewma_volatility") or stats.get("volatility")
+    if sigma is None:
+        return None
+    return round(sigma * (VAR_HORIZON_SECONDS / stats["sample_seconds"]) ** 0.5, 6)
+
+
+def show_portfolio(base_currency: str = None, user: dict = None) -> dict:
+    user = _get_current_user(user)
     base_currency = base_currency or DEFAULT_BASE_CURRENCY
     base = get_currency(base_currency)
 
-    portfolio, _ = _get_user_portfolio(user["user_id"])
+    portfolio = find_portfolio(user["user_id"])
+    if portfolio is None:
+        raise ValutaTradeError("Портфель пользователя не найден")
     wallets = portfolio.get("wallets", {})
 
+    # себестоимость хранится в учётной валюте — один курс для пересчёта в base
+    acct_to_base = 1.0
+    if wallets and base.code != DEFAULT_BASE_CURRENCY:
+        acct_to_base = get_rate(DEFAULT_BASE_CURRENCY, base.code)["rate"]
+
+    # риск-метрики пар, посчитанные Parser Service (risk.json)
+    risk = (_load_json(RISK_FILE) or {}) if wallets else {}
+
     result = []
     total = 0.0
+    total_unrealized = 0.0
+    total_realized = 0.0
+    var_95 = 0.0
 
     for code, info in wallets.items():
-        rate = get_rate(code, base.code)["rate"]
+        rate = 1.0 if code == base.code else get_rate(code, base.code)["rate"]
         value = round(info["balance"] * rate, 2)
         total += value
 
-        result.append({
+        entry = {
             "currency": code,
             "balance": info["balance"],
             "value_in_base": value,
-        })
+            "cost_basis": None,
+            "unrealized_pnl": None,
+            "realized_pnl": round(info.get("realized_pnl", 0.0) * acct_to_base, 2),
+        }
+
+        # стоимость в base минус себестоимость в base: O(1) на кошелёк
+        if "cost" in info:
+            cost = info["cost"] * acct_to_base
+            entry["cost_basis"] = round(cost, 2)
+            entry["unrealized_pnl"] = round(info["balance"] * rate - cost, 2)
+            total_unrealized += entry["unrealized_pnl"]
+
+        total_realized += entry["realized_pnl"]
+
+        entry["volatility"] = _daily_volatility(risk.get(f"{code}_{DEFAULT_BASE_CURRENCY}"))
+        if entry["volatility"] is not None:
+            # без корреляций — консервативная (недиверсифицированная) оценка
+            var_95 += abs(value) * entry["volatility"] * VAR_Z_95
+
+        result.append(entry)
 
     return {
         "username": user["username"],
         "base": base.code,
         "wallets": result,
         "total": round(total, 2),
+        "unrealized_pnl": round(total_unrealized, 2),
+        "realized_pnl": round(total_realized, 2),
+        "var_95": round(var_95, 2),
     }
 
+
+
+# =========================
+# portfolio history
+# =========================
+
+def _history_builder(days: int, resolution: str, base_currency: str | None):
+    if not isinstance(days, int) or days <= 0:
+        raise ValutaTradeError("'days' должен быть положительным целым числом")
+
+    base = get_currency(base_currency or DEFAULT_BASE_CURRENCY)
+    step = valuation.parse_resolution(resolution)
+
+    # сетка выровнена по шагу + последняя точка — текущий момент
+    now = time.time()
+    end = now // step * step
+    grid = valuation.make_grid(end - days * 86400, end, step)
+    if grid[-1] < now:
+        grid.append(now)
+
+    builder = valuation.ValueCurveBuilder(
+        valuation.load_rate_history(), grid, base.code, cross=DEFAULT_BASE_CURRENCY
+    )
+    return builder, grid, base
+
+
+def _history_points(grid: list[float], values: list[float | None]) -> list[dict]:
+    return [
+        {
+            "timestamp": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+            "value": value,
+        }
+        for ts, value in zip(grid, values)
+    ]
+
+
+def portfolio_history(
+    days: int = 30,
+    resolution: str = "1d",
+    base_currency: str = None,
+    user: dict = None,
+) -> dict:
+    """
+    Стоимость портфеля пользователя за последние `days` дней
+    с шагом `resolution` ("15m", "1h", "1d") в base_currency.
+    """
+    user_id = _get_current_user(user)["user_id"]
+    builder, grid, base = _history_builder(days, resolution, base_currency)
+
+    portfolio = find_portfolio(user_id)
+    if portfolio is None:
+        raise ValutaTradeError("Портфель пользователя не найден")
+
+    if len(get_ledger()):
+        trades = [
+            trade
+            for record in get_ledger().iter_user(user_id)
+            for trade in valuation.ledger_trades(record)
+        ]
+    else:
+        trades = [
+            trade
+            for uid, trade in valuation.iter_logged_trades(LOG_DIR)
+            if uid == user_id
+        ]
+    trades.sort()
+    opening = valuation.opening_balances(portfolio.get("wallets", {}), trades)
+
+    return {
+        "user_id": user_id,
+        "base": base.code,
+        "resolution": resolution,
+        "points": _history_points(grid, builder.curve(opening, trades)),
+    }
+
+
+def portfolio_history_all(
+    days: int = 30,
+    resolution: str = "1d",
+    base_currency: str = None,
+) -> dict:
+    """
+    Пакетный прогон по всем портфелям: журнал сделок и история курсов
+    читаются один раз, курсы на сетке общие для всех пользователей.
+    """
+    builder, grid, base = _history_builder(days, resolution, base_currency)
+    ledger = get_ledger()
+    trades_by_user = valuation.load_trades(
+        valuation.iter_ledger_trades(ledger)
+        if len(ledger)
+        else valuation.iter_logged_trades(LOG_DIR)
+    )
+
+    timestamps = [
+        datetime.fromtimestamp(ts, timezone.utc).isoformat() for ts in grid
+    ]
+    users = {}
+    for portfolio in iter_portfolios():
+        trades = trades_by_user.get(portfolio["user_id"], [])
+        opening = valuation.opening_balances(portfolio.get("wallets", {}), trades)
+        users[str(portfolio["user_id"])] = builder.curve(opening, trades)
+
+    return {
+        "base": base.code,
+        "resolution": resolution,
+        "timestamps": timestamps,
+        "users": users,
+    }
+
+
+# =========================
+# limit / stop orders
+# =========================
+
+_order_book = None
+
+
+def get_order_book() -> OrderBook:
+    """
+    Книга ордеров процесса (создаётся при первом обращении).
+    Подписывается на RatesStorage через storage.subscribe(book.on_snapshot).
+    """
+    global _order_book
+    if _order_book is None:
+        _order_book = OrderBook(
+            ORDERS_FILE,
+            lock_path=LOCKS_DIR / "orders.lock",
+            legacy_path=ORDERS_FILE.with_suffix(".json"),
+        )
+    return _order_book
+
+
+def place_order(
+    side: str,
+    order_type: str,
+    currency: str,
+    amount: float,
+    trigger_price: float,
+    base_currency: str = None,
+    user: dict = None,
+) -> dict:
+    user_id = _get_current_user(user)["user_id"]
+    base_currency = base_currency or DEFAULT_BASE_CURRENCY
+
+    return get_order_book().place(
+        user_id=user_id,
+        side=side,
+        order_type=order_type,
+        currency=currency,
+        base=base_currency,
+        amount=amount,
+        trigger_price=trigger_price,
+    )
+
+
+def cancel_order(order_id: int, user: dict = None) -> dict:
+    user_id = _get_current_user(user)["user_id"]
+    return get_order_book().cancel(order_id, user_id)
+
+
+def list_orders(user: dict = None) -> list[dict]:
+    user_id = _get_current_user(user)["user_id"]
+    return get_order_book().list_orders(user_id)
+
+
+# =========================
+# rate alerts
+# =========================
+
+_alert_book = None
+
+
+def get_alert_book() -> AlertBook:
+    """
+    Подписки на оповещения процесса (создаются при первом обращении).
+    Подписывается на RatesStorage через storage.subscribe(book.on_snapshot).
+    """
+    global _alert_book
+    if _alert_book is None:
+        _alert_book = AlertBook(
+            ALERTS_FILE,
+            ALERTS_OUTBOX_FILE,
+            lock_path=LOCKS_DIR / "alerts.lock",
+        )
+    return _alert_book
+
+
+def subscribe_alert(
+    currency: str,
+    kind: str,
+    threshold: float,
+    window_minutes: int = None,
+    base_currency: str = None,
+    user: dict = None,
+) -> dict:
+    user_id = _get_current_user(user)["user_id"]
+
+    cur = get_currency(currency)
+    base = get_currency(base_currency or DEFAULT_BASE_CURRENCY)
+
+    return get_alert_book().subscribe(
+        user_id=user_id,
+        pair=f"{cur.code}_{base.code}",
+        kind=kind,
+        threshold=threshold,
+        window_minutes=window_minutes,
+    )
+
+
+def cancel_alert(alert_id: int, user: dict = None) -> dict:
+    user_id = _get_current_user(user)["user_id"]
+    return get_alert_book().cancel(alert_id, user_id)
+
+
+def list_alerts(user: dict = None) -> list[dict]:
+    user_id = _get_current_user(user)["user_id"]
+    return get_alert_book().list_alerts(user_id)
+
+
+def list_notifications(user: dict = None) -> list[dict]:
+    user_id = _get_current_user(user)["user_id"]
+    return get_alert_book().notifications(user_id)
+
+
+# =========================
+# leaderboard
+# =========================
+
+_leaderboard = None
+
+
+def get_leaderboard() -> Leaderboard:
+    """
+    Рейтинг портфелей процесса (создаётся при первом обращении).
+    Подписывается на RatesStorage через storage.subscribe(board.on_snapshot).
+    """
+    global _leaderboard
+    if _leaderboard is None:
+        _leaderboard = Leaderboard(
+            LEADERBOARD_FILE,
+            DEFAULT_BASE_CURRENCY,
+            lock_path=LOCKS_DIR / "leaderboard.lock",
+            legacy_path=LEADERBOARD_FILE.with_suffix(".json"),
+        )
+    return _leaderboard
+
+
+def _leaderboard_ready() -> Leaderboard:
+    # первое обращение: рейтинг строится по всем портфелям; дальше —
+    # догоняет ledger пачкой перед чтением (сделки рейтинг не трогают)
+    board = get_leaderboard()
+    if not board.path.exists():
+        rebuild_leaderboard()
+    else:
+        board.catch_up(
+            get_ledger(),
+            lambda: {u["user_id"]: u["username"] for u in iter_users()},
+        )
+    return board
+
+
+def rebuild_leaderboard() -> int:
+    """
+    Полное построение рейтинга по всем портфелям: один курс на валюту,
+    а не на каждый кошелёк. Возвращает число пользователей.
+    """
+    # позиция ledger — до чтения портфелей: сделки после неё рейтинг
+    # применит повторно (балансы в них абсолютные)
+    ledger_position = len(get_ledger())
+    portfolios = list(iter_portfolios())
+    usernames = {u["user_id"]: u["username"] for u in iter_users()}
+
+    codes = {
+        code
+        for p in portfolios
+        for code in p.get("wallets", {})
+        if code != DEFAULT_BASE_CURRENCY
+    }
+    prices = {code: get_rate(code, DEFAULT_BASE_CURRENCY)["rate"] for code in codes}
+
+    board = get_leaderboard()
+    board.rebuild(portfolios, usernames, prices, ledger_position)
+    return len(board)
+
+
+def top_portfolios(n: int = 10, base_currency: str = None) -> dict:
+    if not isinstance(n, int) or n <= 0:
+        raise ValutaTradeError("'n' должен быть положительным целым числом")
+
+    base = get_currency(base_currency or DEFAULT_BASE_CURRENCY)
+
+    board = _leaderboard_ready()
+
+    factor = 1.0
+    if base.code != DEFAULT_BASE_CURRENCY:
+        factor = get_rate(DEFAULT_BASE_CURRENCY, base.code)["rate"]
+
+    entries = board.top(n)
+    for entry in entries:
+        entry["value"] = round(entry["value"] * factor, 2)
+
+    return {"base": base.code, "total_users": len(board), "top": entries}
+
+
+def my_rank(user: dict = None) -> int | None:
+    user_id = _get_current_user(user)["user_id"]
+    return get_leaderboard().rank_of(user_id)
+
+
+# =========================
+# cold storage (dormant accounts)
+# =========================
+
+_cold_store = None
+
+
+def get_cold_store() -> ColdStore:
+    global _cold_store
+    if _cold_store is None:
+        _cold_store = ColdStore(COLD_STORAGE_DIR, lock_path=LOCKS_DIR / "cold.lock")
+    return _cold_store
+
+
+def _record_activity(user_id: int, event: str) -> None:
+    """
+    Отметка активности (вход) для архиватора: одна строка в activity.jsonl.
+    """
+    record = {
+        "user_id": user_id,
+        "event": event,
+        "at": datetime.now(timezone.utc).isoformat(),
+    }
+    with _users_lock():
+        with open(ACTIVITY_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def _last_activity(offset: int = 0) -> tuple[dict[int, float], int]:
+    """
+    Время последней отметки по пользователям (epoch), начиная
+    с байта offset файла; вторым значением — позиция конца прочитанного
+    (для дочитывания новых отметок).
+    """
+    last: dict[int, float] = {}
+    if not ACTIVITY_FILE.exists():
+        return last, offset
+
+    with open(ACTIVITY_FILE, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # строка ещё дописывается — дочитается в следующий раз
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            at = datetime.fromisoformat(record["at"]).timestamp()
+            last[record["user_id"]] = max(last.get(record["user_id"], 0.0), at)
+    return last, offset
+
+
+def _record_portfolio_changes(user_ids: list[int], op: str) -> None:
+    """
+    Портфели, изменённые в обход журнала сделок (регистрация, импорт,
+    архивация, возврат из архива), — строки portfolio_changes.jsonl
+    для инкрементальной выгрузки. op: "upsert" или "delete".
+    Вызывается после записи шарда.
+    """
+    if not user_ids:
+        return
+    at = datetime.now(timezone.utc).isoformat()
+    data = "".join(
+        json.dumps({"user_id": user_id, "op": op, "at": at}) + "\n"
+        for user_id in user_ids
+    )
+    with FileLock(LOCKS_DIR / "portfolio_changes.lock"):
+        with open(PORTFOLIO_CHANGES_FILE, "a", encoding="utf-8") as f:
+            f.write(data)
+
+
+def _portfolio_changes(offset: int = 0) -> tuple[dict[int, str], int]:
+    """
+    Последняя операция по пользователям, начиная с байта offset
+    portfolio_changes.jsonl; вторым значением — позиция конца прочитанного.
+    """
+    last: dict[int, str] = {}
+    if not PORTFOLIO_CHANGES_FILE.exists():
+        return last, offset
+
+    with open(PORTFOLIO_CHANGES_FILE, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # строка ещё дописывается — дочитается в следующий раз
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            last[record["user_id"]] = record["op"]
+    return last, offset
+
+
+def _rehydrate(record: dict) -> None:
+    """
+    Возвращает архивный аккаунт в users.json и шард портфеля.
+    Запись из архива удаляется последней: прерванный возврат повторится
+    при следующем входе.
+    """
+    user, portfolio = record["user"], record["portfolio"]
+    user_id = user["user_id"]
+
+    with _users_lock():
+        users = _load_json(USERS_FILE) or []
+        if not any(u["user_id"] == user_id for u in users):
+            users.append(user)
+            _save_json(USERS_FILE, users)
+
+    with _portfolios.writing(user_id) as path:
+        portfolios = _load_json(path) or []
+        if not any(p["user_id"] == user_id for p in portfolios):
+            portfolios.append(portfolio)
+            _save_json(path, portfolios)
+
+    _record_portfolio_changes([user_id], "upsert")
+    get_cold_store().remove(user["username"])
+
+
+def archive_dormant_users(
+    inactive_days: int = None,
+    empty_only: bool = False,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Переносит аккаунты без активности (регистрация, вход, сделка)
+    дольше inactive_days в холодное хранилище.
+
+    Не переносятся: пользователь текущей сессии CLI и владельцы
+    активных ордеров; при empty_only — аккаунты с ненулевыми кошельками.
+
+    Блокировки короткие:
+    - поиск неактивных — без блокировок (потоковое чтение users.json);
+    - портфели переносятся в архив шард за шардом под lock шарда;
+      перед этим кандидаты шарда перепроверяются (новые входы, сделки,
+      ордера, сессия);
+    - под lock users.json — только удаление перенесённых из users.json
+      и activity.jsonl. Пользователь, вошедший в промежутке, уже
+      возвращён из архива (_rehydrate) и не удаляется.
+    """
+    inactive_days = inactive_days or ARCHIVE_INACTIVE_DAYS
+    if not isinstance(inactive_days, int) or inactive_days <= 0:
+        raise ValutaTradeError("'inactive_days' должен быть положительным целым числом")
+
+    cutoff = time.time() - inactive_days * 86400
+    ledger = get_ledger()
+    cold = get_cold_store()
+    orders = get_order_book()
+
+    def busy_users() -> set[int]:
+        session = _load_json(CURRENT_USER_FILE) or {}
+        return orders.user_ids() | {session.get("user_id")}
+
+    def is_dormant(user_id: int, last: float, busy: set[int]) -> bool:
+        if last >= cutoff or user_id in busy:
+            return False
+        trades = ledger.query(user_id, limit=1)["trades"]
+        return not (
+            trades and datetime.fromisoformat(trades[0]["timestamp"]).timestamp() >= cutoff
+        )
+
+    # 1. кандидаты — без блокировок
+    activity, offset = _last_activity()
+    busy = busy_users()
+    active = 0
+    dormant: dict[int, dict] = {}
+    for u in iter_users():
+        active += 1
+        last = max(
+            datetime.fromisoformat(u["registration_date"]).timestamp(),
+            activity.get(u["user_id"], 0.0),
+        )
+        if is_dormant(u["user_id"], last, busy):
+            dormant[u["user_id"]] = u
+    del activity
+
+    result = {
+        "inactive_days": inactive_days,
+        "dormant": len(dormant),
+        "archived": 0,
+        "active": active,
+    }
+    if dry_run or not dormant:
+        return result
+
+    # 2. по шардам: портфели изымаются под lock шарда, в архив пишутся
+    # до перезаписи шарда
+    run = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    groups: dict[Path, list[int]] = {}
+    for user_id in dormant:
+        groups.setdefault(_portfolios.path_for(user_id), []).append(user_id)
+
+    archived: set[int] = set()
+    recent: dict[int, float] = {}
+    for n, user_ids in enumerate(groups.values()):
+        with _portfolios.writing(user_ids[0]) as path:
+            # отметки, появившиеся после поиска, и свежие сделки / ордера
+            new, offset = _last_activity(offset)
+            recent.update(new)
+            busy = busy_users()
+            for user_id in user_ids:
+                if not is_dormant(user_id, recent.get(user_id, 0.0), busy):
+                    dormant.pop(user_id)
+
+            portfolios = _load_json(path) or []
+            keep, records = [], []
+
+            for p in portfolios:
+                user = dormant.get(p["user_id"])
+                has_funds = any(
+                    w.get("balance", 0.0) for w in p.get("wallets", {}).values()
+                )
+                if user is None or (empty_only and has_funds):
+                    keep.append(p)
+                else:
+                    records.append({"user": user, "portfolio": p})
+
+            if not records:
+                continue
+
+            cold.put(records, f"{run}-{n:02d}")
+            _save_json(path, keep)
+            # под lock шарда: возврат из архива (upsert) запишется позже
+            _record_portfolio_changes([r["user"]["user_id"] for r in records], "delete")
+            archived.update(r["user"]["user_id"] for r in records)
+
+    # 3. users.json и activity.jsonl — под lock, только те, кто всё ещё
+    # в архиве (вошедшие за время прогона уже возвращены)
+    with _users_lock():
+        archived = {
+            user_id for user_id in archived
+            if dormant[user_id]["username"] in cold
+        }
+
+        users = [u for u in iter_users() if u["user_id"] not in archived]
+        _save_json(USERS_FILE, users)
+
+        # отметки активности архивных пользователей больше не нужны
+        activity, _ = _last_activity()
+        lines = []
+        for user_id, at in activity.items():
+            if user_id in archived:
+                continue
+            at_iso = datetime.fromtimestamp(at, timezone.utc).isoformat()
+            lines.append(json.dumps({"user_id": user_id, "event": "login", "at": at_iso}))
+        _save_lines(ACTIVITY_FILE, lines)
+
+    result["archived"] = len(archived)
+    result["active"] = len(users)
+    return result
+
+
+def _save_lines(path: Path, lines: list[str]) -> None:
+    with tempfile.NamedTemporaryFile(
+        mode="w",
+        encoding="utf-8",
+        delete=False,
+        dir=path.parent,
+    ) as tmp:
+        tmp.writelines(line + "\n" for line in lines)
+        temp_name = tmp.name
+
+    os.replace(temp_name, path)
@@ -0,0 +1,315 @@
+"""
+Историческая стоимость портфелей (кривая стоимости по времени).
+
+Источники:
+- сделки — ledger сделок (core.ledger); пока он пуст — журнал
+  доменных операций logs/actions.log (+ ротации), строки BUY / SELL;
+- курсы — история exchange_rates.json и архивные сегменты data/archive.
+
+Кривая строится на равномерной сетке времени через as-of join:
+для каждой точки сетки берётся последний известный баланс и последний
+известный курс не позже этой точки. С NumPy — searchsorted по целым
+колонкам, без NumPy — линейное слияние отсортированных рядов.
+
+Курсы валюты к base на сетке кешируются в ValueCurveBuilder и
+переиспользуются для всех пользователей пакетного прогона.
+"""
+
+import math
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from valutatrade_hub.core.exceptions import ValutaTradeError
+from valutatrade_hub.infra.json_stream import iter_json_array
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import RatesStorage
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен
+    np = None
+
+
+# (epoch seconds, код валюты, изменение баланса)
+Trade = tuple[float, str, float]
+
+_RESOLUTION_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+_TRADE_LINE = re.compile(
+    r"\s(?P<ts>\d{4}-\d\d-\d\dT[\d:.]+)\s(?P<action>BUY|SELL)"
+    r"\suser=(?P<user>\d+)\scurrency=(?P<currency>[A-Z]+)"
+    r"\samount=(?P<amount>[-\d.eE+]+)\s.*result=OK"
+)
+
+
+def _to_epoch(timestamp: str) -> float:
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def parse_resolution(resolution: str) -> int:
+    """
+    "15m" / "1h" / "1d" → шаг сетки в секундах.
+    """
+    match = re.fullmatch(r"(\d+)([mhd])", resolution.strip().lower())
+    if not match or int(match.group(1)) <= 0:
+        raise ValutaTradeError(
+            f"Некорректное разрешение '{resolution}' (примеры: 15m, 1h, 1d)"
+        )
+    return int(match.group(1)) * _RESOLUTION_UNITS[match.group(2)]
+
+
+def make_grid(start: float, end: float, step: int) -> list[float]:
+    count = int((end - start) // step) + 1
+    return [start + i * step for i in range(max(count, 0))]
+
+
+# =========================
+# sources
+# =========================
+
+def iter_logged_trades(log_dir: Path) -> Iterator[tuple[int, Trade]]:
+    """
+    Сделки из журнала операций: (user_id, (epoch, currency, delta)).
+
+    Время в журнале локальное (datetime.now() в log_action).
+    """
+    log_file = Path(log_dir) / "actions.log"
+    rotated = sorted(
+        log_file.parent.glob("actions.log.*"),
+        key=lambda p: int(p.suffix[1:]) if p.suffix[1:].isdigit() else 0,
+        reverse=True,
+    )
+
+    for path in [*rotated, log_file]:
+        if not path.exists():
+            continue
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = _TRADE_LINE.search(line)
+                if not match:
+                    continue
+                amount = float(match.group("amount"))
+                if match.group("action") == "SELL":
+                    amount = -amount
+                ts = datetime.fromisoformat(match.group("ts")).timestamp()
+                yield int(match.group("user")), (ts, match.group("currency"), amount)
+
+
+def ledger_trades(record: dict) -> list[Trade]:
+    """
+    Запись ledger (core.ledger) → изменения балансов для кривой стоимости.
+    """
+    ts = _to_epoch(record["timestamp"])
+    if record["side"] == "buy":
+        return [(ts, record["currency"], record["amount"])]
+    if record["side"] == "sell":
+        return [(ts, record["currency"], -record["amount"])]
+    # convert: списание исходной валюты и зачисление целевой
+    return [
+        (ts, record["currency"], -record["amount"]),
+        (ts, record["base"], record["value"]),
+    ]
+
+
+def iter_ledger_trades(ledger: Iterable[dict]) -> Iterator[tuple[int, Trade]]:
+    for record in ledger:
+        for trade in ledger_trades(record):
+            yield record["user_id"], trade
+
+
+def load_trades(source: Iterable[tuple[int, Trade]]) -> dict[int, list[Trade]]:
+    """
+    Один проход по источнику сделок → сделки по пользователям (по времени).
+    """
+    by_user: dict[int, list[Trade]] = {}
+    for user_id, trade in source:
+        by_user.setdefault(user_id, []).append(trade)
+    for trades in by_user.values():
+        trades.sort()
+    return by_user
+
+
+def load_rate_history(
+    config: ParserConfig | None = None,
+) -> dict[str, tuple[list[float], list[float]]]:
+    """
+    История курсов по парам: pair → (timestamps, rates), по возрастанию.
+    """
+    config = config or ParserConfig()
+    series: dict[str, list[tuple[float, float]]] = {}
+
+    archive = RatesStorage(config).archive
+    for pair in archive.pairs():
+        series.setdefault(pair, []).extend(archive.iter_pair(pair))
+
+    history_path = Path(config.HISTORY_FILE_PATH)
+    if history_path.exists() and history_path.stat().st_size:
+        for record in iter_json_array(history_path):
+            pair = f"{record['from_currency']}_{record['to_currency']}"
+            series.setdefault(pair, []).append(
+                (_to_epoch(record["timestamp"]), float(record["rate"]))
+            )
+
+    result = {}
+    for pair, points in series.items():
+        points.sort()
+        result[pair] = ([float(t) for t, _ in points], [r for _, r in points])
+    return result
+
+
+# =========================
+# as-of join
+# =========================
+
+def _asof_python(
+    times: list[float],
+    values: list[float],
+    grid: list[float],
+    default: float,
+) -> list[float]:
+    # обе последовательности отсортированы — одно линейное слияние
+    out = []
+    i = -1
+    n = len(times)
+    for t in grid:
+        while i + 1 < n and times[i + 1] <= t:
+            i += 1
+        out.append(values[i] if i >= 0 else default)
+    return out
+
+
+def _asof_numpy(times, values, grid, default: float):
+    idx = np.searchsorted(times, grid, side="right") - 1
+    if not len(values):
+        return np.full(len(grid), default)
+    return np.where(idx >= 0, np.asarray(values)[np.maximum(idx, 0)], default)
+
+
+class ValueCurveBuilder:
+    """
+    Кривые стоимости портфелей на общей сетке в одной базовой валюте.
+    """
+
+    def __init__(
+        self,
+        rate_history: dict[str, tuple[list[float], list[float]]],
+        grid: list[float],
+        base: str,
+        cross: str = "USD",
+    ) -> None:
+        self.history = rate_history
+        self.base = base
+        self.cross = cross
+        self.grid = np.asarray(grid, dtype=float) if np is not None else list(grid)
+        self._rates: dict[str, object] = {}
+
+    def rates_for(self, code: str):
+        """
+        Курс code → base в каждой точке сетки (NaN — курс ещё не известен).
+        Прямая пара, обратная, либо кросс-курс через `cross`.
+        """
+        if code not in self._rates:
+            self._rates[code] = self._resolve(code, self.base)
+        return self._rates[code]
+
+    def curve(self, opening: dict[str, float], trades: Iterable[Trade]) -> list[float | None]:
+        """
+        Стоимость портфеля в каждой точке сетки.
+
+        opening — балансы до первой сделки журнала; None в точке —
+        для какой-то из удерживаемых валют курс ещё неизвестен.
+        """
+        by_currency: dict[str, tuple[list[float], list[float]]] = {}
+        for ts, code, delta in trades:
+            times, balances = by_currency.setdefault(code, ([], []))
+            previous = balances[-1] if balances else opening.get(code, 0.0)
+            times.append(ts)
+            balances.append(previous + delta)
+
+        codes = set(opening) | set(by_currency)
+
+        if np is not None:
+            total = np.zeros(len(self.grid))
+            for code in codes:
+                times, balances = by_currency.get(code, ([], []))
+                held = _asof_numpy(
+                    np.asarray(times, dtype=float), balances, self.grid,
+                    opening.get(code, 0.0),
+                )
+                # нулевой баланс не требует курса
+                total += np.where(held != 0, held * self.rates_for(code), 0.0)
+            return [None if math.isnan(v) else round(float(v), 2) for v in total]
+
+        total = [0.0] * len(self.grid)
+        for code in codes:
+            times, balances = by_currency.get(code, ([], []))
+            held = _asof_python(times, balances, self.grid, opening.get(code, 0.0))
+            rates = self.rates_for(code)
+            for i, amount in enumerate(held):
+                if amount:
+                    total[i] += amount * rates[i]
+        return [None if math.isnan(v) else round(v, 2) for v in total]
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _on_grid(self, pair: str, invert: bool = False):
+        times, rates = self.history[pair]
+        if invert:
+            rates = [1 / r for r in rates]
+        if np is not None:
+            return _asof_numpy(np.asarray(times), rates, self.grid, math.nan)
+        return _asof_python(times, rates, self.grid, math.nan)
+
+    def _resolve(self, code: str, base: str):
+        if code == base:
+            return np.ones(len(self.grid)) if np is not None else [1.0] * len(self.grid)
+        if f"{code}_{base}" in self.history:
+            return self._on_grid(f"{code}_{base}")
+        if f"{base}_{code}" in self.history:
+            return self._on_grid(f"{base}_{code}", invert=True)
+
+        if self.cross not in (code, base):
+            to_cross = self._resolve(code, self.cross)
+            from_cross = self._resolve(base, self.cross)
+            if np is not None:
+                return to_cross / from_cross
+            return [a / b for a, b in zip(to_cross, from_cross)]
+
+        nan = [math.nan] * len(self.grid)
+        return np.asarray(nan) if np is not None else nan
+
+
+def opening_balances(current: dict[str, dict], trades: list[Trade]) -> dict[str, float]:
+    """
+    Балансы до первой сделки журнала: текущие минус сумма сделок.
+
+    Кривая заканчивается на фактическом портфеле, даже если часть
+    старых сделок уже ушла из ротации журнала.
+    """
+    opening = {code: info.get("balance", 0.0) for code, info in current.items()}
+    for _, code, delta in trades:
+        opening[code] = opening.get(code, 0.0) - delta
+    return {code: amount for code, amount in opening.items() if abs(amount) > 1e-9}
+
+
+def main() -> None:
+    """
+    Пакетный прогон: кривые всех пользователей → data/portfolio_history.json.
+    """
+    from valutatrade_hub.core import usecases
+
+    result = usecases.portfolio_history_all()
+    path = usecases.settings.get("DATA_DIR") / "portfolio_history.json"
+    usecases._save_json(path, result)
+    print(f"{len(result['users'])} portfolio curves → {path}")
+
+
+if __name__ == "__main__":
+    main()
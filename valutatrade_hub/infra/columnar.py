@@ -0,0 +1,158 @@
+"""
+Компактный колоночный формат для выгрузок (по мотивам Parquet).
+
+Файл пишется потоково, группами строк фиксированного размера:
+в памяти — только текущая группа.
+
+    magic       4s   b"VTCF"
+    version     H
+    schema_len  I
+    schema      JSON [{"name": ..., "type": "int" | "float" | "str"}, ...]
+    row groups:
+        rows    I
+        на колонку: length I + zlib(данные колонки)
+            int   — int64[rows]
+            float — float64[rows] (None → NaN)
+            str   — uint32[rows] длины + UTF-8 байты подряд
+    footer:
+        offsets Q[groups]  — смещения групп
+        groups  I
+        rows    Q          — всего строк
+        magic   4s         b"VTCF"
+
+Footer позволяет читателю узнать число строк и перейти к любой
+группе без чтения файла целиком.
+"""
+
+import json
+import math
+import struct
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Iterator
+
+from valutatrade_hub.core.exceptions import StorageCorruptedError
+
+
+COLUMNAR_MAGIC = b"VTCF"
+COLUMNAR_VERSION = 1
+
+COLUMN_TYPES = ("int", "float", "str")
+
+_HEADER = struct.Struct("<4sHI")
+_LENGTH = struct.Struct("<I")
+_FOOTER = struct.Struct("<IQ4s")
+_OFFSET = struct.Struct("<Q")
+
+
+def _encode(kind: str, values: list[Any]) -> bytes:
+    if kind == "int":
+        data = array("q", values).tobytes()
+    elif kind == "float":
+        data = array("d", (math.nan if v is None else v for v in values)).tobytes()
+    else:
+        encoded = [("" if v is None else str(v)).encode("utf-8") for v in values]
+        data = array("I", (len(b) for b in encoded)).tobytes() + b"".join(encoded)
+    return zlib.compress(data, 6)
+
+
+def _decode(kind: str, data: bytes, rows: int) -> list[Any]:
+    data = zlib.decompress(data)
+    if kind == "int":
+        return array("q", data).tolist()
+    if kind == "float":
+        return array("d", data).tolist()
+
+    lengths = array("I", data[:rows * 4])
+    out, pos = [], rows * 4
+    for n in lengths:
+        out.append(data[pos:pos + n].decode("utf-8"))
+        pos += n
+    return out
+
+
+class ColumnarWriter:
+    def __init__(self, path: Path, schema: list[tuple[str, str]], group_rows: int) -> None:
+        for name, kind in schema:
+            if kind not in COLUMN_TYPES:
+                raise ValueError(f"Неизвестный тип колонки {name}: {kind}")
+
+        self.path = Path(path)
+        self.schema = schema
+        self.group_rows = group_rows
+        self.rows = 0
+
+        self._columns: list[list[Any]] = [[] for _ in schema]
+        self._offsets: list[int] = []
+
+        schema_json = json.dumps([{"name": n, "type": t} for n, t in schema]).encode("utf-8")
+        self._f = open(self.path, "wb")
+        self._f.write(_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, len(schema_json)))
+        self._f.write(schema_json)
+
+    def write(self, row: tuple) -> None:
+        for column, value in zip(self._columns, row):
+            column.append(value)
+        if len(self._columns[0]) >= self.group_rows:
+            self._flush()
+
+    def close(self) -> None:
+        self._flush()
+        for offset in self._offsets:
+            self._f.write(_OFFSET.pack(offset))
+        self._f.write(_FOOTER.pack(len(self._offsets), self.rows, COLUMNAR_MAGIC))
+        self._f.close()
+
+    def _flush(self) -> None:
+        count = len(self._columns[0])
+        if not count:
+            return
+
+        self._offsets.append(self._f.tell())
+        self._f.write(_LENGTH.pack(count))
+        for (_, kind), values in zip(self.schema, self._columns):
+            block = _encode(kind, values)
+            self._f.write(_LENGTH.pack(len(block)))
+            self._f.write(block)
+            values.clear()
+
+        self.rows += count
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_columnar(path: Path) -> tuple[list[tuple[str, str]], Iterator[dict[str, list]]]:
+    """
+    (схема, итератор групп {колонка: значения}).
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        magic, version, schema_len = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+            raise StorageCorruptedError(str(path), "неизвестный колоночный формат")
+        schema = [(c["name"], c["type"]) for c in json.loads(f.read(schema_len))]
+
+        f.seek(-_FOOTER.size, 2)
+        groups, _, tail = _FOOTER.unpack(f.read(_FOOTER.size))
+        if tail != COLUMNAR_MAGIC:
+            raise StorageCorruptedError(str(path), "файл не дописан (нет footer)")
+        f.seek(-_FOOTER.size - groups * _OFFSET.size, 2)
+        offsets = [o for (o,) in _OFFSET.iter_unpack(f.read(groups * _OFFSET.size))]
+
+    def groups_iter() -> Iterator[dict[str, list]]:
+        with open(path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                (rows,) = _LENGTH.unpack(f.read(_LENGTH.size))
+                group = {}
+                for name, kind in schema:
+                    (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+                    group[name] = _decode(kind, f.read(length), rows)
+                yield group
+
+    return schema, groups_iter()
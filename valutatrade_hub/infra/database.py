@@ -0,0 +1,66 @@
+"""
+SQLite-бэкенд хранилища (стандартная библиотека, sqlite3).
+
+Схема повторяет JSON-файлы:
+- users         — users.json;
+- portfolios    — портфели (кошельки — JSON-текст, как в файле);
+- rate_history  — архив истории курсов (data/archive) и exchange_rates.json;
+- migration_state — позиция (число перенесённых записей) и контрольная
+  сумма по каждому источнику миграции (core.db_migration).
+
+WAL: читатели не блокируются писателем на время пачек миграции.
+"""
+
+import sqlite3
+from pathlib import Path
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id           INTEGER PRIMARY KEY,
+    username          TEXT NOT NULL,
+    hashed_password   TEXT NOT NULL,
+    salt              TEXT NOT NULL,
+    registration_date TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users (username);
+
+CREATE TABLE IF NOT EXISTS portfolios (
+    user_id INTEGER PRIMARY KEY,
+    wallets TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS rate_history (
+    id            TEXT PRIMARY KEY,
+    from_currency TEXT NOT NULL,
+    to_currency   TEXT NOT NULL,
+    rate          REAL NOT NULL,
+    timestamp     TEXT NOT NULL,
+    source        TEXT,
+    meta          TEXT
+);
+CREATE INDEX IF NOT EXISTS rate_history_pair
+    ON rate_history (from_currency, to_currency, timestamp);
+
+CREATE TABLE IF NOT EXISTS migration_state (
+    source       TEXT PRIMARY KEY,
+    position     INTEGER NOT NULL,
+    checksum     INTEGER NOT NULL,
+    layout       TEXT,
+    completed_at TEXT
+);
+"""
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """
+    Соединение с созданной схемой.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
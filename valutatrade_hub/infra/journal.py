@@ -0,0 +1,139 @@
+"""
+Журнал изменений в JSON Lines: дозапись + периодическое уплотнение.
+
+Изменение состояния — одна строка в конец файла (O(1) вместо
+перезаписи всего состояния). Владелец журнала (OrderBook, Leaderboard):
+- держит состояние в памяти и применяет к нему строки read_new();
+- пишет под своим lock-файлом, предварительно дочитав журнал;
+- время от времени уплотняет файл: текущее состояние → новый файл
+  (rename). Читатели узнают замену по inode и перечитывают файл
+  целиком. Журнал держит прочитанный файл открытым: пока inode занят,
+  новый файл не может получить тот же номер, и замена не остаётся
+  незамеченной.
+
+Строка без завершающего \\n (запись ещё идёт или прервана сбоем)
+не применяется; прерванный хвост обрезается следующей записью.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable
+
+
+class Journal:
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        # строк в текущем файле (для решения об уплотнении)
+        self.lines = 0
+
+        self._file = None
+        self._file_id: tuple[int, int] | None = None
+        self._offset = 0
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def read_new(self) -> tuple[bool, list[dict]]:
+        """
+        Строки, добавленные с прошлого вызова (в т.ч. другими процессами).
+
+        Возвращает (reset, records): reset=True — файл заменён
+        (уплотнён / создан / удалён), состояние нужно собрать заново
+        из records.
+        """
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            reset = self._file is not None
+            self.close()
+            return reset, []
+
+        reset = (stat.st_ino, stat.st_dev) != self._file_id
+        if reset:
+            try:
+                self._open(open(self.path, "rb"), 0, 0)
+            except FileNotFoundError:
+                self.close()
+                return True, []
+
+        records: list[dict] = []
+        self._file.seek(self._offset)
+        for line in self._file:
+            if not line.endswith(b"\n"):
+                # строка ещё дописывается — дочитаем в следующий раз
+                break
+            self._offset += len(line)
+            self.lines += 1
+            if line.strip():
+                records.append(json.loads(line))
+
+        return reset, records
+
+    def append(self, records: Iterable[dict]) -> None:
+        """
+        Дозапись строк. Вызывается под lock владельца после read_new():
+        всё, что в файле дальше прочитанного, — прерванный хвост.
+        """
+        data = b"".join(
+            json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+            for record in records
+        )
+        if not data:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as f:
+            stat = os.fstat(f.fileno())
+            if (stat.st_ino, stat.st_dev) != self._file_id:
+                # файл создан этой записью
+                self._open(open(self.path, "rb"), 0, 0)
+            elif f.tell() > self._offset:
+                f.truncate(self._offset)
+                # позиция потока после truncate остаётся в старом конце
+                f.seek(self._offset)
+            f.write(data)
+            self._offset = f.tell()
+
+        self.lines += data.count(b"\n")
+
+    def rewrite(self, records: Iterable[dict]) -> None:
+        """
+        Уплотнение: файл заменяется строками records (текущим
+        состоянием владельца). Вызывается под lock владельца.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        lines = 0
+        with tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding="utf-8",
+            delete=False,
+            dir=self.path.parent,
+        ) as tmp:
+            for record in records:
+                tmp.write(json.dumps(record, ensure_ascii=False) + "\n")
+                lines += 1
+            temp_name = tmp.name
+
+        new = open(temp_name, "rb")
+        os.replace(temp_name, self.path)
+        self._open(new, os.fstat(new.fileno()).st_size, lines)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file, self._file_id, self._offset, self.lines = None, None, 0, 0
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _open(self, f, offset: int, lines: int) -> None:
+        stat = os.fstat(f.fileno())
+        self.close()
+        self._file = f
+        self._file_id = (stat.st_ino, stat.st_dev)
+        self._offset = offset
+        self.lines = lines
@@ -0,0 +1,141 @@
+"""
+Потоковое чтение JSON-массивов (users.json, portfolios.json).
+
+Файл читается кусками фиксированного размера, записи массива
+разбираются по одной — пиковая память не зависит от размера файла.
+Повреждённый файл не превращается молча в "пусто":
+выбрасывается StorageCorruptedError.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Iterator
+
+from valutatrade_hub.core.exceptions import StorageCorruptedError
+
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = ",]" + _WHITESPACE
+
+
+class _ChunkReader:
+    """
+    Буфер поверх файла: хранит только ещё не разобранный хвост.
+    """
+
+    def __init__(self, f, chunk_size: int) -> None:
+        self._f = f
+        self._chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        # отбрасываем уже разобранное, чтобы буфер не рос
+        self.consumed += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str | None:
+        """
+        Следующий непробельный символ (без сдвига) или None в конце файла.
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return None
+
+    @property
+    def offset(self) -> int:
+        return self.consumed + self.pos
+
+
+def iter_json_array(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Итератор по элементам JSON-массива в файле.
+
+    - отсутствующий / пустой файл → пустой итератор;
+    - файл не является массивом, обрезан или битый → StorageCorruptedError.
+    """
+    path = Path(path)
+    if not path.exists() or path.stat().st_size == 0:
+        return
+
+    decoder = json.JSONDecoder()
+
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _ChunkReader(f, chunk_size)
+
+        if reader.peek() != "[":
+            raise StorageCorruptedError(str(path), "ожидался JSON-массив")
+        reader.pos += 1
+
+        expect_value = True
+        first = True
+
+        while True:
+            ch = reader.peek()
+            if ch is None:
+                raise StorageCorruptedError(str(path), "файл обрезан")
+
+            if ch == "]" and (first or not expect_value):
+                reader.pos += 1
+                break
+
+            if not expect_value:
+                if ch != ",":
+                    raise StorageCorruptedError(
+                        str(path), f"ожидалась ',' на позиции {reader.offset}"
+                    )
+                reader.pos += 1
+                expect_value = True
+                continue
+
+            value, end = _decode_value(decoder, reader, path)
+            reader.pos = end
+            expect_value = False
+            first = False
+
+            yield value
+
+        if reader.peek() is not None:
+            raise StorageCorruptedError(
+                str(path), f"лишние данные на позиции {reader.offset}"
+            )
+
+
+def _decode_value(decoder: json.JSONDecoder, reader: _ChunkReader, path: Path):
+    # скаляр (число, true/null) может быть разрезан границей чанка так,
+    # что его начало само по себе валидно ("2." → 2) — дочитываем до разделителя
+    if reader.buf[reader.pos] not in '{["':
+        while not any(c in _DELIMITERS for c in reader.buf[reader.pos:]):
+            if not reader.fill():
+                break
+
+    while True:
+        try:
+            value, end = decoder.raw_decode(reader.buf, reader.pos)
+        except json.JSONDecodeError as e:
+            # возможно, запись разрезана границей чанка — дочитываем
+            if reader.fill():
+                continue
+            raise StorageCorruptedError(
+                str(path), f"ошибка разбора на позиции {reader.consumed + e.pos}"
+            ) from e
+
+        return value, end
@@ -0,0 +1,113 @@
+"""
+Межпроцессные lock-файлы на блокировках ядра (flock; msvcrt на Windows).
+
+Блокировку держит открытый дескриптор, а не существование файла:
+- ядро снимает её, когда владелец завершился или упал, поэтому
+  "протухших" lock-файлов и их взлома (stat → unlink, гонка двух
+  ожидающих) нет;
+- долгий владелец не теряет lock, сколько бы ни длилась операция.
+
+Файл после release не удаляется: удаление открывает гонку, в которой
+двое держат блокировки на разных inode одного пути.
+Каждый захват открывает свой дескриптор, так что потоки одного
+процесса исключают друг друга так же, как процессы.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_fd(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    def __init__(self, path: Path, timeout: float = 30.0) -> None:
+        """
+        timeout — сколько ждать захвата в `with lock:`.
+        """
+        self.path = Path(path)
+        self.timeout = timeout
+        # дескриптор захвата — свой у каждого потока
+        self._local = threading.local()
+
+    def try_acquire(self) -> bool:
+        """
+        Неблокирующая попытка захвата.
+        """
+        if getattr(self._local, "fd", None) is not None:
+            return False
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+
+        if not _lock_fd(fd):
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        self._local.fd = fd
+        return True
+
+    def acquire(self, timeout: float, poll_interval: float = 0.01) -> bool:
+        """
+        Ожидание захвата не дольше timeout секунд.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.try_acquire():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+    def wait_released(self, timeout: float, poll_interval: float = 0.01) -> bool:
+        """
+        Дождаться, пока lock освободит другой владелец (без удержания).
+        """
+        if not self.acquire(timeout, poll_interval):
+            return False
+        self.release()
+        return True
+
+    def release(self) -> None:
+        fd = getattr(self._local, "fd", None)
+        if fd is None:
+            return
+        self._local.fd = None
+        try:
+            _unlock_fd(fd)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> "FileLock":
+        if not self.acquire(self.timeout):
+            raise TimeoutError(f"Не удалось захватить lock {self.path}")
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from typing import Any
 import tomllib
@@ -42,12 +43,59 @@ class SettingsLoader:
             "DATA_DIR": data_dir,
             "USERS_FILE": data_dir / cfg.get("USERS_FILE", "users.json"),
             "PORTFOLIOS_FILE": data_dir / cfg.get("PORTFOLIOS_FILE", "portfolios.json"),
+            "PORTFOLIOS_DIR": data_dir / cfg.get("PORTFOLIOS_DIR", "portfolios"),
             "CURRENT_USER_FILE": data_dir / cfg.get("CURRENT_USER_FILE", "current_user.json"),
             "RATES_FILE": data_dir / cfg.get("RATES_FILE", "rates.json"),
+            "RATES_BINARY_FILE": data_dir / cfg.get("RATES_BINARY_FILE", "rates.bin"),
+            "RISK_FILE": data_dir / cfg.get("RISK_FILE", "risk.json"),
+
+            "ORDERS_FILE": data_dir / cfg.get("ORDERS_FILE", "orders.jsonl"),
+            "ALERTS_FILE": data_dir / cfg.get("ALERTS_FILE", "alerts.json"),
+            "ALERTS_OUTBOX_FILE": data_dir / cfg.get("ALERTS_OUTBOX_FILE", "alerts_outbox.jsonl"),
+            "LEADERBOARD_FILE": data_dir / cfg.get("LEADERBOARD_FILE", "leaderboard.jsonl"),
+            "LEDGER_DIR": data_dir / cfg.get("LEDGER_DIR", "ledger"),
+            "IDEMPOTENCY_FILE": data_dir / cfg.get("IDEMPOTENCY_FILE", "idempotency.jsonl"),
+            "COLD_STORAGE_DIR": data_dir / cfg.get("COLD_STORAGE_DIR", "cold"),
+            "ACTIVITY_FILE": data_dir / cfg.get("ACTIVITY_FILE", "activity.jsonl"),
+            "PORTFOLIO_CHANGES_FILE": data_dir / cfg.get(
+                "PORTFOLIO_CHANGES_FILE", "portfolio_changes.jsonl"
+            ),
+            "DATABASE_FILE": data_dir / cfg.get("DATABASE_FILE", "valutatrade.db"),
+            "EXPORT_DIR": data_dir / cfg.get("EXPORT_DIR", "exports"),
+            "LOCKS_DIR": data_dir / cfg.get("LOCKS_DIR", "locks"),
 
             # business rules
             "RATES_TTL_SECONDS": int(cfg.get("RATES_TTL_SECONDS", 300)),
+            # политики TTL по парам / валютам / классам (core.rate_policy)
+            "RATES_TTL_POLICIES": dict(cfg.get("RATES_TTL", {})),
+            "RATES_STALE_GRACE_SECONDS": int(cfg.get("RATES_STALE_GRACE_SECONDS", 600)),
+            "RATES_REFRESH_TIMEOUT_SECONDS": float(
+                cfg.get("RATES_REFRESH_TIMEOUT_SECONDS", 10)
+            ),
             "DEFAULT_BASE_CURRENCY": cfg.get("DEFAULT_BASE_CURRENCY", "USD"),
+            # ключи идемпотентности сделок: срок жизни и предел числа ключей
+            "IDEMPOTENCY_TTL_SECONDS": int(cfg.get("IDEMPOTENCY_TTL_SECONDS", 86400)),
+            "IDEMPOTENCY_MAX_KEYS": int(cfg.get("IDEMPOTENCY_MAX_KEYS", 100_000)),
+            # себестоимость позиций: "fifo" или "average" (core.pnl)
+            "COST_BASIS_METHOD": cfg.get("COST_BASIS_METHOD", "fifo").lower(),
+
+            # аккаунты без активности дольше порога уходят в холодное хранилище
+            "ARCHIVE_INACTIVE_DAYS": int(cfg.get("ARCHIVE_INACTIVE_DAYS", 180)),
+            # миграция JSON → SQLite: записей на транзакцию
+            "MIGRATION_BATCH_SIZE": int(cfg.get("MIGRATION_BATCH_SIZE", 5000)),
+            # выгрузка для аналитики: строк в группе колоночного файла
+            "EXPORT_CHUNK_ROWS": int(cfg.get("EXPORT_CHUNK_ROWS", 100_000)),
+            # число шардов портфелей для нового хранилища (infra.shards)
+            "PORTFOLIO_SHARDS": int(cfg.get("PORTFOLIO_SHARDS", 16)),
+            # исполнитель сделок HTTP API по партициям user_id (core.executor);
+            # 0 — сделки в потоках сервера
+            "EXECUTOR_WORKERS": int(cfg.get("EXECUTOR_WORKERS", os.cpu_count() or 1)),
+
+            # HTTP API
+            "API_HOST": cfg.get("API_HOST", "127.0.0.1"),
+            "API_PORT": int(cfg.get("API_PORT", 8080)),
+            "API_MAX_WORKERS": int(cfg.get("API_MAX_WORKERS", 8)),
+            "API_SESSION_TTL_SECONDS": int(cfg.get("API_SESSION_TTL_SECONDS", 3600)),
 
             # logging
             "LOG_DIR": Path(cfg.get("LOG_DIR", "logs")),
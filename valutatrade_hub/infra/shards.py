@@ -0,0 +1,274 @@
+"""
+Шардированное хранилище портфелей.
+
+Вместо одного portfolios.json, который каждая сделка переписывает
+целиком, портфели разложены по N файлам по хешу user_id:
+
+    data/portfolios/
+    ├── meta.json                 — {"shards": N, "generation": g}
+    └── layout-<g>/
+        ├── shard-00.json         — JSON-массив портфелей шарда
+        └── ...
+
+- шард пользователя — crc32(user_id) % N (стабильно между процессами);
+- сделка читает и переписывает только свой шард под его lock-файлом:
+  писатели разных шардов не ждут друг друга;
+- при первом обращении monolithic portfolios.json раскладывается
+  по шардам (файл переименовывается в *.migrated);
+- перешардирование (python -m valutatrade_hub.infra.shards --shards M)
+  пишет новое поколение layout-<g+1> рядом со старым и атомарно
+  переключает meta.json. Чтение не останавливается; писатели ждут
+  только на время копирования, затем продолжают в новом поколении.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from valutatrade_hub.core.exceptions import StorageCorruptedError
+from valutatrade_hub.infra.json_stream import iter_json_array
+from valutatrade_hub.infra.locks import FileLock
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    return zlib.crc32(str(int(user_id)).encode("ascii")) % shards
+
+
+def _write_json(path: Path, data) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        mode="w",
+        encoding="utf-8",
+        delete=False,
+        dir=path.parent,
+    ) as tmp:
+        json.dump(data, tmp, indent=4, ensure_ascii=False)
+        temp_name = tmp.name
+
+    os.replace(temp_name, path)
+
+
+class ShardedPortfolios:
+    def __init__(
+        self,
+        directory: Path,
+        shards: int,
+        legacy_path: Path | None = None,
+        locks_dir: Path | None = None,
+    ) -> None:
+        """
+        shards — число шардов для нового хранилища; у существующего
+        хранилища число шардов берётся из meta.json.
+        """
+        if shards < 1:
+            raise ValueError("Число шардов должно быть не меньше 1")
+
+        self.directory = Path(directory)
+        self.shards = shards
+        self.legacy_path = Path(legacy_path) if legacy_path is not None else None
+        self.locks_dir = Path(locks_dir) if locks_dir is not None else self.directory
+        self.meta_path = self.directory / "meta.json"
+
+        self._layout: dict | None = None
+        self._meta_mtime: int | None = None
+
+    # =========================
+    # layout
+    # =========================
+
+    def layout(self) -> dict:
+        """
+        Текущее поколение: {"shards": N, "generation": g}.
+        """
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._create()
+            return self.layout()
+
+        if mtime != self._meta_mtime:
+            try:
+                with open(self.meta_path, "r", encoding="utf-8") as f:
+                    self._layout = json.load(f)
+            except json.JSONDecodeError as e:
+                raise StorageCorruptedError(str(self.meta_path), str(e)) from e
+            self._meta_mtime = mtime
+
+        return self._layout
+
+    def path_for(self, user_id: int) -> Path:
+        layout = self.layout()
+        return self._shard_path(layout, shard_of(user_id, layout["shards"]))
+
+    def shard_paths(self) -> list[Path]:
+        layout = self.layout()
+        return [self._shard_path(layout, i) for i in range(layout["shards"])]
+
+    # =========================
+    # read / write
+    # =========================
+
+    def get(self, user_id: int) -> dict | None:
+        for p in iter_json_array(self.path_for(user_id)):
+            if p["user_id"] == user_id:
+                return p
+        return None
+
+    def iter_all(self) -> Iterator[dict]:
+        """
+        Все портфели, шард за шардом (порядок user_id не гарантируется).
+        """
+        for path in self.shard_paths():
+            yield from iter_json_array(path)
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.iter_all()
+
+    @contextmanager
+    def writing(self, user_id: int) -> Iterator[Path]:
+        """
+        Шард пользователя под его lock: чтение → изменение → запись
+        внутри блока не теряют параллельных изменений того же шарда.
+        """
+        while True:
+            layout = self.layout()
+            index = shard_of(user_id, layout["shards"])
+
+            with FileLock(self._lock_path(layout, index)):
+                # пока ждали lock, хранилище могли перешардировать
+                if self.layout() != layout:
+                    continue
+                yield self._shard_path(layout, index)
+                return
+
+    # =========================
+    # migration / resharding
+    # =========================
+
+    def reshard(self, shards: int) -> dict:
+        """
+        Раскладывает портфели по shards шардам в новом поколении.
+        """
+        if shards < 1:
+            raise ValueError("Число шардов должно быть не меньше 1")
+
+        with FileLock(self._layout_lock_path()):
+            old = self.layout()
+
+            with ExitStack() as stack:
+                # шарды захватываются по возрастанию номера, писатели держат
+                # не больше одного — взаимной блокировки нет
+                for i in range(old["shards"]):
+                    stack.enter_context(FileLock(self._lock_path(old, i)))
+
+                new = {"shards": shards, "generation": old["generation"] + 1}
+                buckets: list[list[dict]] = [[] for _ in range(shards)]
+                for p in self.iter_all():
+                    buckets[shard_of(p["user_id"], shards)].append(p)
+
+                for index, bucket in enumerate(buckets):
+                    _write_json(self._shard_path(new, index), bucket)
+
+                _write_json(self.meta_path, new)
+
+            self._cleanup(keep={old["generation"], new["generation"]})
+
+        return {
+            "users": sum(len(b) for b in buckets),
+            "from_shards": old["shards"],
+            "to_shards": shards,
+            "generation": new["generation"],
+        }
+
+    def _create(self) -> None:
+        """
+        Первое обращение: пустое хранилище или раскладка portfolios.json.
+        """
+        with FileLock(self._layout_lock_path()):
+            if self.meta_path.exists():
+                return
+
+            layout = {"shards": self.shards, "generation": 1}
+            buckets: list[list[dict]] = [[] for _ in range(self.shards)]
+
+            legacy = self.legacy_path
+            if legacy is not None and legacy.exists():
+                for p in iter_json_array(legacy):
+                    buckets[shard_of(p["user_id"], self.shards)].append(p)
+
+            for index, bucket in enumerate(buckets):
+                _write_json(self._shard_path(layout, index), bucket)
+            _write_json(self.meta_path, layout)
+
+            if legacy is not None and legacy.exists():
+                legacy.rename(legacy.with_name(legacy.name + ".migrated"))
+
+    def _cleanup(self, keep: set[int]) -> None:
+        """
+        Удаляет поколения старше предыдущего: предыдущее остаётся
+        для читателей, открывших файл до переключения.
+        """
+        for path in self.directory.glob("layout-*"):
+            generation = int(path.name.partition("-")[2])
+            if generation not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    # =========================
+    # paths
+    # =========================
+
+    def _shard_path(self, layout: dict, index: int) -> Path:
+        return self.directory / f"layout-{layout['generation']}" / f"shard-{index:02d}.json"
+
+    def _lock_path(self, layout: dict, index: int) -> Path:
+        return self.locks_dir / f"portfolios-{layout['generation']}-{index:02d}.lock"
+
+    def _layout_lock_path(self) -> Path:
+        return self.locks_dir / "portfolios-layout.lock"
+
+
+def from_settings() -> ShardedPortfolios:
+    from valutatrade_hub.infra.settings import SettingsLoader
+
+    settings = SettingsLoader()
+    return ShardedPortfolios(
+        settings.get("PORTFOLIOS_DIR"),
+        settings.get("PORTFOLIO_SHARDS"),
+        legacy_path=settings.get("PORTFOLIOS_FILE"),
+        locks_dir=settings.get("LOCKS_DIR"),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reshard portfolio storage")
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="новое число шардов (по умолчанию PORTFOLIO_SHARDS)",
+    )
+    args = parser.parse_args()
+
+    store = from_settings()
+    shards = args.shards or store.shards
+
+    before = store.layout()
+    if before["shards"] == shards:
+        print(f"Хранилище уже разбито на {shards} шардов (поколение {before['generation']})")
+        return
+
+    r = store.reshard(shards)
+    print(
+        f"Перешардировано: {r['users']} портфелей, "
+        f"{r['from_shards']} → {r['to_shards']} шардов (поколение {r['generation']})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from statistics import median
+from typing import Any
+
+from valutatrade_hub.parser_service.config import ParserConfig
+
+
+class RatesAggregator:
+    """
+    Агрегация курсов от нескольких источников.
+
+    Для каждой пары:
+    - считается медиана всех котировок;
+    - котировки, отклонившиеся от медианы больше чем на MAX_DEVIATION,
+      отбрасываются как выбросы;
+    - по оставшимся считается консенсус (медиана или взвешенное среднее);
+    - для каждого источника сохраняется отклонение от консенсуса.
+
+    Работает за O(pairs * sources log sources) без IO.
+    """
+
+    def __init__(self, config: ParserConfig | None = None) -> None:
+        self.config = config or ParserConfig()
+
+    def aggregate(
+        self,
+        quotes: dict[str, dict[str, float]],
+    ) -> tuple[dict[str, float], dict[str, dict[str, Any]]]:
+        """
+        quotes: {"CoinGecko": {"BTC_USD": 59337.21, ...}, ...}
+
+        Возвращает:
+            rates: {"BTC_USD": 59337.21, ...} — консенсус по паре
+            meta:  {"BTC_USD": {"source": ..., "sources": {...}, "spread": ...}}
+        """
+        by_pair: dict[str, list[tuple[str, float]]] = {}
+        for source, rates in quotes.items():
+            for pair, rate in rates.items():
+                by_pair.setdefault(pair, []).append((source, rate))
+
+        rates: dict[str, float] = {}
+        meta: dict[str, dict[str, Any]] = {}
+
+        for pair, pair_quotes in by_pair.items():
+            rate, info = self._aggregate_pair(pair_quotes)
+            rates[pair] = rate
+            meta[pair] = info
+
+        return rates, meta
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _aggregate_pair(
+        self,
+        pair_quotes: list[tuple[str, float]],
+    ) -> tuple[float, dict[str, Any]]:
+        if len(pair_quotes) == 1:
+            source, rate = pair_quotes[0]
+            return rate, {"source": source}
+
+        mid = median(rate for _, rate in pair_quotes)
+        max_dev = self.config.MAX_DEVIATION
+
+        accepted = [
+            (source, rate)
+            for source, rate in pair_quotes
+            if mid and abs(rate - mid) / mid <= max_dev
+        ]
+
+        # если отброшено всё — доверяем медиане, а не одному источнику
+        if not accepted:
+            accepted = pair_quotes
+
+        consensus = self._consensus(accepted)
+        accepted_names = {source for source, _ in accepted}
+
+        sources = {
+            source: {
+                "rate": rate,
+                "deviation": round((rate - consensus) / consensus, 6),
+                "accepted": source in accepted_names,
+            }
+            for source, rate in pair_quotes
+        }
+
+        accepted_rates = [rate for _, rate in accepted]
+        spread = (max(accepted_rates) - min(accepted_rates)) / consensus
+
+        return consensus, {
+            "source": "+".join(sorted(accepted_names)),
+            "sources": sources,
+            "spread": round(spread, 6),
+        }
+
+    def _consensus(self, accepted: list[tuple[str, float]]) -> float:
+        if self.config.AGGREGATION_METHOD == "weighted":
+            weights = self.config.SOURCE_WEIGHTS
+            total_weight = 0.0
+            total = 0.0
+            for source, rate in accepted:
+                weight = weights.get(source, 1.0)
+                total += rate * weight
+                total_weight += weight
+            if total_weight > 0:
+                return total / total_weight
+
+        return median(rate for _, rate in accepted)
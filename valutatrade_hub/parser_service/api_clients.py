@@ -12,6 +12,19 @@ class BaseApiClient(ABC):
     Все конкретные клиенты обязаны реализовать единый интерфейс.
     """
 
+    # имя источника в snapshot (source); по умолчанию — имя класса
+    SOURCE_NAME: str | None = None
+
+    @property
+    def source_name(self) -> str:
+        return self.SOURCE_NAME or self.__class__.__name__
+
+    def pairs(self) -> list[str]:
+        """
+        Пары, которые котирует клиент (для расписания обновлений).
+        """
+        return []
+
     @abstractmethod
     def fetch_rates(self) -> dict[str, float]:
         """
@@ -31,9 +44,17 @@ class CoinGeckoClient(BaseApiClient):
     Возвращает курсы в формате: {"BTC_USD": 59337.21, ...}
     """
 
+    SOURCE_NAME = "CoinGecko"
+
     def __init__(self, config: ParserConfig | None = None) -> None:
         self.config = config or ParserConfig()
 
+    def pairs(self) -> list[str]:
+        return [
+            f"{code}_{self.config.BASE_CURRENCY}"
+            for code in self.config.CRYPTO_CURRENCIES
+        ]
+
     def fetch_rates(self) -> dict[str, float]:
         ids = [
             self.config.CRYPTO_ID_MAP[code]
@@ -98,9 +119,17 @@ class ExchangeRateApiClient(BaseApiClient):
     Возвращает курсы в формате: {"EUR_USD": 0.927, ...}
     """
 
+    SOURCE_NAME = "ExchangeRate-API"
+
     def __init__(self, config: ParserConfig | None = None) -> None:
         self.config = config or ParserConfig()
 
+    def pairs(self) -> list[str]:
+        return [
+            f"{code}_{self.config.BASE_CURRENCY}"
+            for code in self.config.FIAT_CURRENCIES
+        ]
+
     def fetch_rates(self) -> dict[str, float]:
         # 🔒 Проверка ключа ТОЛЬКО в момент запроса (по ТЗ и архитектуре)
         if not self.config.EXCHANGERATE_API_KEY:
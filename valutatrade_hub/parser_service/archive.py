@@ -0,0 +1,353 @@
+"""
+Колоночный архив истории курсов (холодный слой под exchange_rates.json).
+
+Перенос вызывает RatesStorage после записи истории (не чаще
+ARCHIVE_ROLL_INTERVAL_SECONDS); вручную:
+    python -m valutatrade_hub.parser_service.archive [--days N]
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+from valutatrade_hub.parser_service.config import ParserConfig
+
+
+# =========================
+# segment format
+# =========================
+#
+# header (little-endian, 40 байт; в версии 1 — 36, без meta_len):
+#   magic       4s   b"VTRA"
+#   version     H
+#   flags       H    бит 0 — колонка rates сжата zlib
+#   count       I    число точек
+#   first_ts    q    первый timestamp (epoch seconds)
+#   last_ts     q    последний timestamp
+#   ts_len      I    длина сжатого блока timestamps
+#   rates_len   I    длина блока rates
+#   meta_len    I    длина блока записей (версия 2)
+#
+# далее:
+#   [ts block]     zlib(int64 дельт между соседними timestamps)
+#   [padding]      до границы 8 байт
+#   [rates block]  float64[count] (или zlib(float64[count]))
+#   [meta block]   zlib(JSON {"timestamps": [...], "sources": [...],
+#                  "meta": [...]}) — исходные timestamp (ISO), source и
+#                  meta записей истории, по точкам (версия 2)
+#
+# Несжатая колонка rates выровнена и читается через mmap без копирования;
+# блок записей распаковывается, только когда нужны полные записи.
+
+SEGMENT_MAGIC = b"VTRA"
+SEGMENT_VERSION = 2
+FLAG_RATES_COMPRESSED = 1
+
+_HEADER_V1 = struct.Struct("<4sHHIqqII")
+_HEADER = struct.Struct("<4sHHIqqIII")
+
+
+def _to_epoch(timestamp: str) -> int:
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+class RateSegment:
+    """
+    Один архивный сегмент пары, открытый через mmap.
+
+    - timestamps: array("q") — восстановленные из дельт epoch seconds;
+    - rates: memoryview("d") поверх mmap (zero-copy), либо распакованный
+      array("d"), если сегмент записан со сжатой колонкой rates;
+    - records(pair) — полные записи истории (timestamp, source, meta).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = struct.unpack_from("<4sH", self._mmap, 0)
+        if magic != SEGMENT_MAGIC or version not in (1, SEGMENT_VERSION):
+            self._mmap.close()
+            raise ValueError(f"Некорректный архивный сегмент: {path}")
+
+        if version == 1:
+            header = _HEADER_V1
+            fields = header.unpack_from(self._mmap, 0) + (0,)
+        else:
+            header = _HEADER
+            fields = header.unpack_from(self._mmap, 0)
+        _, _, flags, count, first_ts, last_ts, ts_len, rates_len, meta_len = fields
+
+        self.count = count
+        self.first_ts = first_ts
+        self.last_ts = last_ts
+
+        ts_start = header.size
+        deltas = array("q", zlib.decompress(self._mmap[ts_start:ts_start + ts_len]))
+        self.timestamps = array("q", [0]) * count
+        acc = 0
+        for i, delta in enumerate(deltas):
+            acc += delta
+            self.timestamps[i] = acc
+
+        rates_start = _aligned(ts_start + ts_len)
+        self._view = memoryview(self._mmap)
+        self._raw = self._view[rates_start:rates_start + rates_len]
+
+        if flags & FLAG_RATES_COMPRESSED:
+            self.rates = array("d", zlib.decompress(self._raw))
+        else:
+            self.rates = self._raw.cast("d")
+
+        meta_start = rates_start + rates_len
+        self._meta_block = (meta_start, meta_len)
+
+    def __iter__(self) -> Iterator[tuple[int, float]]:
+        return zip(self.timestamps, self.rates)
+
+    def records(self, pair: str) -> Iterator[dict[str, Any]]:
+        """
+        Точки сегмента в формате записей exchange_rates.json.
+        Сегменты версии 1 хранили только timestamp и rate: timestamp
+        восстанавливается из epoch, source — "archive", meta — {}.
+        """
+        from_currency, to_currency = pair.split("_", 1)
+
+        start, length = self._meta_block
+        if length:
+            stored = json.loads(zlib.decompress(self._mmap[start:start + length]))
+            timestamps, sources, metas = stored["timestamps"], stored["sources"], stored["meta"]
+        else:
+            timestamps = [
+                datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+                for ts in self.timestamps
+            ]
+            sources = ["archive"] * self.count
+            metas = [{}] * self.count
+
+        for timestamp, rate, source, meta in zip(timestamps, self.rates, sources, metas):
+            yield {
+                "id": f"{pair}_{timestamp}",
+                "from_currency": from_currency,
+                "to_currency": to_currency,
+                "rate": rate,
+                "timestamp": timestamp,
+                "source": source,
+                "meta": meta,
+            }
+
+    def close(self) -> None:
+        if isinstance(self.rates, memoryview):
+            self.rates.release()
+        self._raw.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "RateSegment":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class RatesArchive:
+    """
+    Архив истории курсов (холодный слой под exchange_rates.json).
+
+    Записи старше ARCHIVE_AFTER_DAYS переносятся из exchange_rates.json
+    в колоночные сегменты по парам:
+        data/archive/<PAIR>/<first_ts>-<last_ts>.seg
+
+    Колонки timestamp и rate читаются без разбора остального; исходные
+    timestamp, source и meta (в т.ч. sources / spread агрегатора)
+    хранятся сжатым блоком того же сегмента (RateSegment.records), id и
+    from/to восстанавливаются из имени пары и timestamp.
+    """
+
+    def __init__(self, storage) -> None:
+        """
+        storage — RatesStorage, чью историю принимает архив
+        (путь, lock истории и конфигурация).
+        """
+        self.storage = storage
+        self.config: ParserConfig = storage.config
+        self.archive_dir = Path(self.config.ARCHIVE_DIR_PATH)
+
+    # =========================
+    # public API
+    # =========================
+
+    def roll(self, before: datetime | None = None) -> int:
+        """
+        Переносит записи истории старше `before`
+        (по умолчанию now - ARCHIVE_AFTER_DAYS) в архивные сегменты.
+
+        Возвращает количество перенесённых записей.
+        """
+        if before is None:
+            before = datetime.now(timezone.utc) - timedelta(
+                days=self.config.ARCHIVE_AFTER_DAYS
+            )
+        cutoff = int(before.timestamp())
+
+        # под lock истории: запись между чтением и перезаписью потерялась бы
+        with self.storage.history_lock:
+            return self._roll(cutoff)
+
+    def pairs(self) -> list[str]:
+        if not self.archive_dir.exists():
+            return []
+        return sorted(p.name for p in self.archive_dir.iterdir() if p.is_dir())
+
+    def segments(self, pair: str) -> list[Path]:
+        """
+        Сегменты пары в хронологическом порядке.
+        """
+        pair_dir = self.archive_dir / pair
+        if not pair_dir.exists():
+            return []
+        return sorted(pair_dir.glob("*.seg"))
+
+    def open_segments(self, pair: str) -> list[RateSegment]:
+        return [RateSegment(path) for path in self.segments(pair)]
+
+    def iter_pair(self, pair: str) -> Iterator[tuple[int, float]]:
+        """
+        Все архивные точки пары: (epoch seconds, rate).
+        """
+        for path in self.segments(pair):
+            with RateSegment(path) as segment:
+                yield from segment
+
+    def iter_records(self, pair: str) -> Iterator[dict[str, Any]]:
+        """
+        Все архивные точки пары — полными записями истории.
+        """
+        for path in self.segments(pair):
+            with RateSegment(path) as segment:
+                yield from segment.records(pair)
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _roll(self, cutoff: int) -> int:
+        history = self.storage._load_history()
+
+        keep: list[dict[str, Any]] = []
+        by_pair: dict[str, list[tuple[int, dict[str, Any]]]] = {}
+
+        for record in history:
+            ts = _to_epoch(record["timestamp"])
+            if ts >= cutoff:
+                keep.append(record)
+                continue
+
+            pair = f"{record['from_currency']}_{record['to_currency']}"
+            by_pair.setdefault(pair, []).append((ts, record))
+
+        if not by_pair:
+            return 0
+
+        # сначала сегменты, затем укороченная история:
+        # при сбое между шагами данные не теряются
+        for pair, points in by_pair.items():
+            points.sort(key=lambda point: point[0])
+            self._write_segment(pair, points)
+
+        self.storage._atomic_write(self.storage.history_path, keep)
+
+        return len(history) - len(keep)
+
+    def _write_segment(self, pair: str, points: list[tuple[int, dict[str, Any]]]) -> Path:
+        """
+        points — (epoch seconds, запись истории), по возрастанию времени.
+        """
+        timestamps = [ts for ts, _ in points]
+        deltas = array("q", [timestamps[0]])
+        deltas.extend(b - a for a, b in zip(timestamps, timestamps[1:]))
+
+        ts_block = zlib.compress(deltas.tobytes(), 9)
+        rates_block = array("d", (float(r["rate"]) for _, r in points)).tobytes()
+        meta_block = zlib.compress(json.dumps({
+            "timestamps": [r["timestamp"] for _, r in points],
+            "sources": [r.get("source") for _, r in points],
+            "meta": [r.get("meta") or {} for _, r in points],
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+
+        flags = 0
+        if self.config.ARCHIVE_COMPRESS_RATES:
+            rates_block = zlib.compress(rates_block, 9)
+            flags |= FLAG_RATES_COMPRESSED
+
+        header = _HEADER.pack(
+            SEGMENT_MAGIC,
+            SEGMENT_VERSION,
+            flags,
+            len(points),
+            timestamps[0],
+            timestamps[-1],
+            len(ts_block),
+            len(rates_block),
+            len(meta_block),
+        )
+
+        body = header + ts_block
+        body += b"\0" * (_aligned(len(body)) - len(body))
+        body += rates_block
+        body += meta_block
+
+        pair_dir = self.archive_dir / pair
+        pair_dir.mkdir(parents=True, exist_ok=True)
+        path = pair_dir / f"{timestamps[0]}-{timestamps[-1]}.seg"
+
+        with tempfile.NamedTemporaryFile(delete=False, dir=pair_dir) as tmp:
+            tmp.write(body)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            temp_name = tmp.name
+
+        os.replace(temp_name, path)
+        return path
+
+
+def main() -> None:
+    from valutatrade_hub.parser_service.storage import RatesStorage
+
+    parser = argparse.ArgumentParser(description="Roll old rate history into the archive")
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=None,
+        help="переносить записи старше N дней (по умолчанию ARCHIVE_AFTER_DAYS)",
+    )
+    args = parser.parse_args()
+
+    archive = RatesStorage().archive
+    before = None
+    if args.days is not None:
+        before = datetime.now(timezone.utc) - timedelta(days=args.days)
+
+    moved = archive.roll(before)
+    print(f"В архив перенесено записей: {moved} ({archive.archive_dir})")
+
+
+if __name__ == "__main__":
+    main()
@@ -55,13 +55,79 @@ class ParserConfig:
         }
     )
 
+    # =========================
+    # Aggregation settings
+    # =========================
+
+    # "median" — медиана принятых котировок,
+    # "weighted" — взвешенное среднее по SOURCE_WEIGHTS
+    AGGREGATION_METHOD: str = "median"
+
+    # допустимое относительное отклонение от медианы (0.02 = 2%)
+    MAX_DEVIATION: float = 0.02
+
+    # вес источника для AGGREGATION_METHOD = "weighted" (по умолчанию 1.0)
+    SOURCE_WEIGHTS: dict[str, float] = field(
+        default_factory=lambda: {
+            "CoinGecko": 1.0,
+            "ExchangeRate-API": 1.0,
+        }
+    )
+
+    # =========================
+    # Snapshot delta settings
+    # =========================
+
+    # относительный порог изменения курса (0.0001 = 0.01%);
+    # изменения не больше порога не пишутся в rates.json и историю
+    RATE_EPSILON: float = 0.0
+
+    # переопределение порога для отдельных пар
+    RATE_EPSILON_BY_PAIR: dict[str, float] = field(
+        default_factory=lambda: {
+            "BTC_USD": 0.0001,
+            "ETH_USD": 0.0001,
+            "SOL_USD": 0.0001,
+        }
+    )
+
     # =========================
     # File paths
     # =========================
 
     # Пути — строками, без SettingsLoader
     RATES_FILE_PATH: str = "data/rates.json"
+    RATES_BINARY_PATH: str = "data/rates.bin"
+    RISK_FILE_PATH: str = "data/risk.json"
     HISTORY_FILE_PATH: str = "data/exchange_rates.json"
+    ARCHIVE_DIR_PATH: str = "data/archive"
+    PROVIDERS_STATE_PATH: str = "data/providers_state.json"
+
+    # =========================
+    # Archive settings
+    # =========================
+
+    # записи истории старше N дней уходят в колоночный архив
+    ARCHIVE_AFTER_DAYS: int = 30
+
+    # как часто RatesStorage переносит старую историю в архив
+    ARCHIVE_ROLL_INTERVAL_SECONDS: int = 3600
+
+    # сжимать ли колонку rates (экономия места ценой отказа от zero-copy)
+    ARCHIVE_COMPRESS_RATES: bool = False
+
+    # =========================
+    # Risk metrics
+    # =========================
+
+    # не чаще одной выборки курса пары за N секунд (равные интервалы доходностей)
+    RISK_SAMPLE_SECONDS: int = 3600
+
+    # размер скользящего окна — число доходностей
+    RISK_WINDOW: int = 24 * 30
+
+    # RiskMetrics: вес прошлого в EWMA
+    RISK_EWMA_LAMBDA: float = 0.94
 
     # =========================
     # Network settings
@@ -69,3 +135,23 @@ class ParserConfig:
 
     REQUEST_TIMEOUT: int = 10
 
+    # =========================
+    # Provider protection
+    # =========================
+
+    # token bucket: (запросов, за секунд) — ёмкость и скорость пополнения
+    RATE_LIMITS: dict[str, tuple[int, int]] = field(
+        default_factory=lambda: {
+            "CoinGecko": (10, 60),
+            "ExchangeRate-API": (5, 3600),
+        }
+    )
+    DEFAULT_RATE_LIMIT: tuple[int, int] = (10, 60)
+
+    # circuit breaker: ошибок подряд до "open" и пауза до пробного вызова
+    BREAKER_FAILURE_THRESHOLD: int = 3
+    BREAKER_RESET_SECONDS: int = 300
+    # сколько ждать итога пробного вызова (half-open), прежде чем
+    # разрешить новую пробу: пробовавший процесс мог упасть
+    BREAKER_PROBE_TIMEOUT_SECONDS: int = 60
+
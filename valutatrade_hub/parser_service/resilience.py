@@ -0,0 +1,267 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from valutatrade_hub.infra.locks import FileLock
+from valutatrade_hub.parser_service.config import ParserConfig
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class TokenBucket:
+    """
+    Token bucket: capacity токенов, пополнение refill_per_sec в секунду.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_sec: float,
+        tokens: float | None = None,
+        updated: float | None = None,
+    ) -> None:
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = updated
+
+    def try_take(self, now: float) -> bool:
+        if self.updated is not None:
+            elapsed = max(0.0, now - self.updated)
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_sec)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"tokens": round(self.tokens, 6), "updated": self.updated}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker: closed → open (после failure_threshold ошибок подряд)
+    → half-open (через reset_seconds, одна пробная попытка) → closed / open.
+
+    В half-open пропускается ровно один вызов: probe_until — отметка
+    пробы "в полёте", до её итога (record_*) остальные получают отказ.
+    Проба без итога дольше probe_timeout (процесс упал) считается
+    потерянной, и следующий вызов становится новой пробой.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_seconds: float,
+        probe_timeout: float,
+        state: str = CLOSED,
+        failures: int = 0,
+        opened_at: float | None = None,
+        probe_until: float | None = None,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.probe_timeout = probe_timeout
+        self.state = state
+        self.failures = failures
+        self.opened_at = opened_at
+        self.probe_until = probe_until
+
+    def allow(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+
+        if self.state == OPEN:
+            if now - (self.opened_at or 0.0) < self.reset_seconds:
+                return False
+            self.state = HALF_OPEN
+        elif self.probe_until is not None and now < self.probe_until:
+            # проба уже идёт
+            return False
+
+        self.probe_until = now + self.probe_timeout
+        return True
+
+    def cancel_probe(self) -> None:
+        """
+        Разрешённая проба не состоялась (например, отказ лимита).
+        """
+        if self.state == HALF_OPEN:
+            self.probe_until = None
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_until = None
+
+    def record_failure(self, now: float) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = now
+        self.probe_until = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened_at": self.opened_at,
+            "probe_until": self.probe_until,
+        }
+
+
+class ProviderGuard:
+    """
+    Rate limiting и circuit breaker для провайдеров курсов.
+
+    Состояние хранится рядом с rates.json (PROVIDERS_STATE_PATH), чтобы
+    лимиты и "открытые" провайдеры учитывались между запусками CLI
+    и планировщика. Каждое обращение (acquire / record_*) перечитывает,
+    меняет и сохраняет состояние под lock-файлом: токены и ошибки
+    параллельных процессов складываются, а не затирают друг друга.
+    """
+
+    def __init__(
+        self,
+        config: ParserConfig | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.config = config or ParserConfig()
+        self.clock = clock
+        self.state_path = Path(self.config.PROVIDERS_STATE_PATH)
+        self.lock = FileLock(self.state_path.with_suffix(".lock"))
+
+        self._buckets: dict[str, TokenBucket] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    # =========================
+    # public API
+    # =========================
+
+    def acquire(self, source: str) -> str | None:
+        """
+        Разрешение на вызов провайдера.
+        Возвращает None, если вызов разрешён, иначе — причину отказа.
+        """
+        with self.lock:
+            self._load()
+            now = self.clock()
+
+            breaker = self._breaker(source)
+            if not breaker.allow(now):
+                reason = "circuit open"
+            elif not self._bucket(source).try_take(now):
+                breaker.cancel_probe()
+                reason = "rate limit exceeded"
+            else:
+                reason = None
+
+            # и отказ сохраняется: переход open → half-open тоже состояние
+            self._save()
+
+        return reason
+
+    def record_success(self, source: str) -> None:
+        with self.lock:
+            self._load()
+            self._breaker(source).record_success()
+            self._save()
+
+    def record_failure(self, source: str) -> None:
+        with self.lock:
+            self._load()
+            self._breaker(source).record_failure(self.clock())
+            self._save()
+
+    def states(self) -> dict[str, str]:
+        self._load()
+        return {source: b.state for source, b in self._breakers.items()}
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    def _save(self) -> None:
+        data = {
+            source: {
+                "breaker": self._breaker(source).to_dict(),
+                "bucket": self._bucket(source).to_dict(),
+            }
+            for source in sorted(set(self._breakers) | set(self._buckets))
+        }
+
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding="utf-8",
+            delete=False,
+            dir=self.state_path.parent,
+        ) as tmp:
+            json.dump(data, tmp, indent=4, ensure_ascii=False)
+            temp_name = tmp.name
+
+        os.replace(temp_name, self.state_path)
+
+    def _bucket(self, source: str) -> TokenBucket:
+        if source not in self._buckets:
+            capacity, refill = self._limits(source)
+            self._buckets[source] = TokenBucket(capacity, refill)
+        return self._buckets[source]
+
+    def _breaker(self, source: str) -> CircuitBreaker:
+        if source not in self._breakers:
+            self._breakers[source] = CircuitBreaker(
+                self.config.BREAKER_FAILURE_THRESHOLD,
+                self.config.BREAKER_RESET_SECONDS,
+                self.config.BREAKER_PROBE_TIMEOUT_SECONDS,
+            )
+        return self._breakers[source]
+
+    def _limits(self, source: str) -> tuple[float, float]:
+        capacity, per_seconds = self.config.RATE_LIMITS.get(
+            source, self.config.DEFAULT_RATE_LIMIT
+        )
+        return float(capacity), capacity / per_seconds
+
+    def _load(self) -> None:
+        self._buckets, self._breakers = {}, {}
+
+        if not self.state_path.exists() or self.state_path.stat().st_size == 0:
+            return
+
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            # состояние — лишь оптимизация: битый файл = чистый старт
+            return
+
+        for source, state in data.items():
+            capacity, refill = self._limits(source)
+            bucket = state.get("bucket", {})
+            self._buckets[source] = TokenBucket(
+                capacity,
+                refill,
+                tokens=min(capacity, bucket.get("tokens", capacity)),
+                updated=bucket.get("updated"),
+            )
+
+            breaker = state.get("breaker", {})
+            self._breakers[source] = CircuitBreaker(
+                self.config.BREAKER_FAILURE_THRESHOLD,
+                self.config.BREAKER_RESET_SECONDS,
+                self.config.BREAKER_PROBE_TIMEOUT_SECONDS,
+                state=breaker.get("state", CLOSED),
+                failures=breaker.get("failures", 0),
+                opened_at=breaker.get("opened_at"),
+                probe_until=breaker.get("probe_until"),
+            )
@@ -0,0 +1,220 @@
+"""
+Скользящие риск-метрики по парам, обновляемые по мере прихода snapshot.
+
+На пару — одна выборка не чаще RISK_SAMPLE_SECONDS (равные интервалы
+для доходностей). Каждое обновление O(1) (амортизированно):
+- окно из RISK_WINDOW лог-доходностей: сумма и сумма квадратов
+  → среднее и волатильность без прохода по окну;
+- min / max курса за окно: монотонные очереди;
+- EWMA дисперсии доходностей (RiskMetrics, lambda = RISK_EWMA_LAMBDA)
+  и EWMA курса.
+
+Состояние хранится отдельно от snapshot — в risk.json (RatesStorage.
+load_risk / save_risk): окна доходностей и очереди не раздувают
+rates.json, который читается на каждый запрос курса.
+"""
+
+import math
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any
+
+from valutatrade_hub.parser_service.config import ParserConfig
+
+
+def _to_epoch(timestamp: str) -> float:
+    dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class RollingStats:
+    """
+    Статистика одной пары за последние `window` выборок.
+    """
+
+    def __init__(self, window: int, ewma_lambda: float) -> None:
+        self.window = window
+        self.ewma_lambda = ewma_lambda
+
+        self.last_rate: float | None = None
+        self.last_sample: float | None = None
+
+        self.returns: deque[float] = deque()
+        self.sum = 0.0
+        self.sumsq = 0.0
+
+        # (номер выборки, курс) — монотонные очереди для min / max
+        self.seq = 0
+        self.mins: deque[tuple[int, float]] = deque()
+        self.maxs: deque[tuple[int, float]] = deque()
+
+        self.ewma_var: float | None = None
+        self.ewma_rate: float | None = None
+
+    def update(self, rate: float, sampled_at: float) -> None:
+        lam = self.ewma_lambda
+
+        if self.last_rate:
+            r = math.log(rate / self.last_rate)
+
+            self.returns.append(r)
+            self.sum += r
+            self.sumsq += r * r
+            if len(self.returns) > self.window:
+                old = self.returns.popleft()
+                self.sum -= old
+                self.sumsq -= old * old
+
+            if self.ewma_var is None:
+                self.ewma_var = r * r
+            else:
+                self.ewma_var = lam * self.ewma_var + (1 - lam) * r * r
+
+        if self.ewma_rate is None:
+            self.ewma_rate = rate
+        else:
+            self.ewma_rate = lam * self.ewma_rate + (1 - lam) * rate
+
+        # окно курсов: window доходностей = window + 1 точка
+        self.seq += 1
+        oldest = self.seq - self.window
+        while self.mins and self.mins[-1][1] >= rate:
+            self.mins.pop()
+        self.mins.append((self.seq, rate))
+        while self.mins[0][0] < oldest:
+            self.mins.popleft()
+        while self.maxs and self.maxs[-1][1] <= rate:
+            self.maxs.pop()
+        self.maxs.append((self.seq, rate))
+        while self.maxs[0][0] < oldest:
+            self.maxs.popleft()
+
+        self.last_rate = rate
+        self.last_sample = sampled_at
+
+    def volatility(self) -> float:
+        n = len(self.returns)
+        if n < 2:
+            return 0.0
+        mean = self.sum / n
+        # накопленная погрешность сумм не должна давать отрицательную дисперсию
+        variance = max(0.0, (self.sumsq - n * mean * mean) / (n - 1))
+        return math.sqrt(variance)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "samples": len(self.returns),
+            "last_return": self.returns[-1] if self.returns else None,
+            "mean_return": self.sum / len(self.returns) if self.returns else None,
+            "volatility": self.volatility(),
+            "ewma_volatility": (
+                math.sqrt(self.ewma_var) if self.ewma_var is not None else None
+            ),
+            "ewma_rate": self.ewma_rate,
+            "min": self.mins[0][1] if self.mins else None,
+            "max": self.maxs[0][1] if self.maxs else None,
+        }
+
+    # =========================
+    # persistence
+    # =========================
+
+    def to_state(self) -> dict[str, Any]:
+        return {
+            "last_rate": self.last_rate,
+            "last_sample": self.last_sample,
+            "returns": list(self.returns),
+            "seq": self.seq,
+            "mins": [list(m) for m in self.mins],
+            "maxs": [list(m) for m in self.maxs],
+            "ewma_var": self.ewma_var,
+            "ewma_rate": self.ewma_rate,
+        }
+
+    @classmethod
+    def from_state(
+        cls,
+        state: dict[str, Any],
+        window: int,
+        ewma_lambda: float,
+    ) -> "RollingStats":
+        stats = cls(window, ewma_lambda)
+        stats.last_rate = state.get("last_rate")
+        stats.last_sample = state.get("last_sample")
+        # окно могли уменьшить в конфигурации — берём хвост
+        stats.returns = deque(state.get("returns", [])[-window:])
+        stats.sum = sum(stats.returns)
+        stats.sumsq = sum(r * r for r in stats.returns)
+        stats.seq = state.get("seq", 0)
+        stats.mins = deque((int(i), r) for i, r in state.get("mins", []))
+        stats.maxs = deque((int(i), r) for i, r in state.get("maxs", []))
+        stats.ewma_var = state.get("ewma_var")
+        stats.ewma_rate = state.get("ewma_rate")
+        return stats
+
+
+class RiskTracker:
+    """
+    RollingStats всех пар + сериализация в/из risk.json.
+    """
+
+    def __init__(self, config: ParserConfig | None = None) -> None:
+        self.config = config or ParserConfig()
+        self.stats: dict[str, RollingStats] = {}
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: dict[str, Any],
+        config: ParserConfig | None = None,
+    ) -> "RiskTracker":
+        """
+        Обратное к to_dict().
+        """
+        tracker = cls(config)
+        for pair, entry in data.items():
+            tracker.stats[pair] = RollingStats.from_state(
+                entry.get("state", {}),
+                tracker.config.RISK_WINDOW,
+                tracker.config.RISK_EWMA_LAMBDA,
+            )
+        return tracker
+
+    def observe(self, rates: dict[str, float], updated_at: str) -> list[str]:
+        """
+        Учитывает курсы snapshot. Пара берётся в выборку, если с её
+        прошлой выборки прошло не меньше RISK_SAMPLE_SECONDS.
+
+        Возвращает пары, по которым добавлена выборка.
+        """
+        now = _to_epoch(updated_at)
+        sampled = []
+
+        for pair, rate in rates.items():
+            if not rate or rate <= 0:
+                continue
+
+            stats = self.stats.get(pair)
+            if stats is None:
+                stats = self.stats[pair] = RollingStats(
+                    self.config.RISK_WINDOW, self.config.RISK_EWMA_LAMBDA
+                )
+            elif now - (stats.last_sample or 0) < self.config.RISK_SAMPLE_SECONDS:
+                continue
+
+            stats.update(rate, now)
+            sampled.append(pair)
+
+        return sampled
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            pair: {
+                **stats.summary(),
+                "sample_seconds": self.config.RISK_SAMPLE_SECONDS,
+                "state": stats.to_state(),
+            }
+            for pair, stats in self.stats.items()
+        }
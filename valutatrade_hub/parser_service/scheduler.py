@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+from valutatrade_hub.core.rate_policy import RatesPolicy
+from valutatrade_hub.core.usecases import get_alert_book, get_leaderboard, get_order_book
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.logging_config import setup_logging
+from valutatrade_hub.parser_service.api_clients import (
+    BaseApiClient,
+    CoinGeckoClient,
+    ExchangeRateApiClient,
+)
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import RatesStorage
+from valutatrade_hub.parser_service.updater import RatesUpdater
+
+
+logger = logging.getLogger("valutatrade")
+
+
+class RatesScheduler:
+    """
+    Планировщик обновления курсов по политикам TTL.
+
+    Каждый провайдер опрашивается не чаще, чем того требует самая
+    "быстрая" из его пар (минимальный TTL по RatesPolicy):
+    CoinGecko с крипто-парами — раз в десятки секунд,
+    ExchangeRate-API с фиатом — раз в час.
+    """
+
+    def __init__(
+        self,
+        updater: RatesUpdater,
+        policy: RatesPolicy | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.updater = updater
+        self.clock = clock
+
+        if policy is None:
+            settings = SettingsLoader()
+            policy = RatesPolicy(
+                settings.get("RATES_TTL_POLICIES", {}),
+                default_ttl=settings.get("RATES_TTL_SECONDS"),
+            )
+        self.policy = policy
+
+        # первый запуск — сразу по всем провайдерам
+        self._next_run: dict[int, float] = {id(c): 0.0 for c in updater.clients}
+
+    def interval_for(self, client: BaseApiClient) -> int:
+        pairs = client.pairs()
+        if not pairs:
+            return self.policy.default_ttl
+        return min(self.policy.ttl_for(pair) for pair in pairs)
+
+    def due_clients(self) -> list[BaseApiClient]:
+        now = self.clock()
+        return [c for c in self.updater.clients if self._next_run[id(c)] <= now]
+
+    def run_pending(self) -> dict | None:
+        """
+        Обновляет только провайдеров, у которых подошёл срок.
+        """
+        due = self.due_clients()
+        if not due:
+            return None
+
+        now = self.clock()
+        for client in due:
+            self._next_run[id(client)] = now + self.interval_for(client)
+
+        return self.updater.run_update(clients=due)
+
+    def seconds_until_next(self) -> float:
+        return max(0.0, min(self._next_run.values(), default=0.0) - self.clock())
+
+    def run_forever(self, stop_event: threading.Event | None = None) -> None:
+        stop_event = stop_event or threading.Event()
+
+        while not stop_event.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.exception(f"Scheduler: update failed: {e}")
+
+            stop_event.wait(self.seconds_until_next())
+
+
+def main() -> None:
+    setup_logging()
+
+    config = ParserConfig()
+    storage = RatesStorage(config)
+    storage.subscribe(get_order_book().on_snapshot)
+    storage.subscribe(get_alert_book().on_snapshot)
+    storage.subscribe(get_leaderboard().on_snapshot)
+
+    updater = RatesUpdater(
+        clients=[CoinGeckoClient(config), ExchangeRateApiClient(config)],
+        storage=storage,
+    )
+
+    scheduler = RatesScheduler(updater)
+    for client in updater.clients:
+        print(f"{client.source_name}: every {scheduler.interval_for(client)}s")
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+
+# =========================
+# binary snapshot format
+# =========================
+#
+# header (little-endian, 16 байт):
+#   magic       4s   b"VTRS"
+#   version     H
+#   reserved    H
+#   count       I    число пар
+#   slots       I    размер хеш-индекса (степень двойки, >= 2 * count)
+#
+# index[slots]  (16 байт на слот, открытая адресация, линейное пробирование):
+#   key         12s  код пары ("BTC_USD"), дополненный нулями
+#   record      I    номер записи + 1 (0 — пустой слот)
+#
+# records[count] (24 байта на запись):
+#   rate        d
+#   updated_at  d    epoch seconds (UTC), последнее изменение курса
+#   checked_at  d    epoch seconds (UTC), последнее подтверждение курса
+#
+# Слот ищется по crc32(key) — хеш стабилен между процессами.
+
+SNAPSHOT_MAGIC = b"VTRS"
+SNAPSHOT_VERSION = 2
+
+_HEADER = struct.Struct("<4sHHII")
+_SLOT = struct.Struct("<12sI")
+_RECORD = struct.Struct("<ddd")
+
+_KEY_SIZE = 12
+
+
+def _encode_key(pair: str) -> bytes:
+    key = pair.encode("ascii")
+    if len(key) > _KEY_SIZE:
+        raise ValueError(f"Слишком длинный код пары: {pair}")
+    return key.ljust(_KEY_SIZE, b"\0")
+
+
+def _to_epoch(timestamp: str) -> float:
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def write_binary_snapshot(path: Path, pairs: dict[str, dict[str, Any]]) -> None:
+    """
+    Публикует бинарный snapshot курсов: временный файл → rename.
+
+    pairs: {"BTC_USD": {"rate": ..., "updated_at": ISO, "checked_at": ISO}, ...}
+    (без checked_at — время изменения)
+    """
+    count = len(pairs)
+    slots = 1
+    while slots < 2 * max(count, 1):
+        slots <<= 1
+
+    index = bytearray(_SLOT.size * slots)
+    records = bytearray()
+
+    for number, (pair, info) in enumerate(pairs.items(), start=1):
+        key = _encode_key(pair)
+        slot = zlib.crc32(key) & (slots - 1)
+        while _SLOT.unpack_from(index, slot * _SLOT.size)[1]:
+            slot = (slot + 1) & (slots - 1)
+        _SLOT.pack_into(index, slot * _SLOT.size, key, number)
+
+        records += _RECORD.pack(
+            float(info["rate"]),
+            _to_epoch(info["updated_at"]),
+            _to_epoch(info.get("checked_at") or info["updated_at"]),
+        )
+
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, count, slots)
+
+    with tempfile.NamedTemporaryFile(delete=False, dir=path.parent) as tmp:
+        tmp.write(header)
+        tmp.write(index)
+        tmp.write(records)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+        temp_name = tmp.name
+
+    os.replace(temp_name, path)
+
+
+class _Mapping:
+    """
+    Отображённый файл snapshot; заменяется целиком, не изменяется.
+    """
+
+    __slots__ = ("mmap", "inode", "slots")
+
+    def __init__(self, mapped: mmap.mmap, inode: tuple[int, int], slots: int) -> None:
+        self.mmap = mapped
+        self.inode = inode
+        self.slots = slots
+
+
+class RatesSnapshotReader:
+    """
+    Читатель бинарного snapshot курсов через mmap.
+
+    - поиск пары за O(1) по хеш-индексу, без разбора JSON;
+    - файл переоткрывается, только если writer опубликовал новый
+      snapshot (сменились inode / mtime после rename);
+    - безопасен для множества процессов: writer никогда
+      не изменяет опубликованный файл на месте;
+    - безопасен для потоков: новое отображение подменяет ссылку
+      целиком (переоткрытие — под lock), а старое не закрывается
+      явно — его освобождает сборщик, когда последний читатель
+      отпустит ссылку.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._mapping: _Mapping | None = None
+        self._lock = threading.Lock()
+
+    # =========================
+    # public API
+    # =========================
+
+    def get(self, pair: str) -> tuple[float, float, float] | None:
+        """
+        Возвращает (rate, updated_at epoch, checked_at epoch)
+        или None, если пары нет.
+        """
+        mapping = self._refresh()
+        if mapping is None:
+            return None
+        return self._lookup(mapping, pair)
+
+    def get_many(self, pairs: Iterable[str]) -> dict[str, tuple[float, float, float]]:
+        """
+        Несколько пар из одного опубликованного snapshot (одно
+        отображение): значения согласованы между собой.
+        Отсутствующих пар в результате нет.
+        """
+        mapping = self._refresh()
+        if mapping is None:
+            return {}
+
+        found = {}
+        for pair in pairs:
+            hit = self._lookup(mapping, pair)
+            if hit is not None:
+                found[pair] = hit
+        return found
+
+    def items(self) -> Iterator[tuple[str, float, float, float]]:
+        """
+        Все пары snapshot: (pair, rate, updated_at epoch, checked_at epoch).
+        """
+        mapping = self._refresh()
+        if mapping is None:
+            return
+
+        base = _HEADER.size
+        records = base + mapping.slots * _SLOT.size
+
+        for slot in range(mapping.slots):
+            key, number = _SLOT.unpack_from(mapping.mmap, base + slot * _SLOT.size)
+            if not number:
+                continue
+            rate, updated_at, checked_at = _RECORD.unpack_from(
+                mapping.mmap, records + (number - 1) * _RECORD.size
+            )
+            yield key.rstrip(b"\0").decode("ascii"), rate, updated_at, checked_at
+
+    def close(self) -> None:
+        with self._lock:
+            mapping, self._mapping = self._mapping, None
+        if mapping is not None:
+            mapping.mmap.close()
+
+    # =========================
+    # internal helpers
+    # =========================
+
+    @staticmethod
+    def _lookup(mapping: _Mapping, pair: str) -> tuple[float, float, float] | None:
+        key = _encode_key(pair)
+        mask = mapping.slots - 1
+        slot = zlib.crc32(key) & mask
+        base = _HEADER.size
+
+        for _ in range(mapping.slots):
+            slot_key, number = _SLOT.unpack_from(mapping.mmap, base + slot * _SLOT.size)
+            if not number:
+                return None
+            if slot_key == key:
+                offset = base + mapping.slots * _SLOT.size + (number - 1) * _RECORD.size
+                return _RECORD.unpack_from(mapping.mmap, offset)
+            slot = (slot + 1) & mask
+
+        return None
+
+    def _refresh(self) -> _Mapping | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._mapping = None
+            return None
+
+        inode = (stat.st_ino, stat.st_mtime_ns)
+        mapping = self._mapping
+        if mapping is not None and mapping.inode == inode:
+            return mapping
+
+        with self._lock:
+            mapping = self._mapping
+            if mapping is not None and mapping.inode == inode:
+                return mapping
+
+            try:
+                with open(self.path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                # файл заменили между stat и open / пустой файл
+                return mapping
+
+            magic, version, _, count, slots = _HEADER.unpack_from(mapped, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                mapped.close()
+                self._mapping = None
+                return None
+
+            self._mapping = _Mapping(mapped, inode, slots)
+            return self._mapping
@@ -1,10 +1,22 @@
 import json
+import logging
 import os
 import tempfile
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
+from valutatrade_hub.infra.locks import FileLock
+from valutatrade_hub.parser_service.archive import RatesArchive
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.snapshot import RatesSnapshotReader, write_binary_snapshot
+
+
+logger = logging.getLogger("valutatrade")
+
+# подписчик snapshot: (изменившиеся пары {pair: rate}, updated_at)
+SnapshotListener = Callable[[dict[str, float], str], None]
 
 
 class RatesStorage:
@@ -13,11 +25,19 @@ class RatesStorage:
 
     Отвечает за:
     - snapshot текущих курсов (rates.json)
+    - бинарную копию snapshot для mmap-читателей (rates.bin) с heartbeat
+      пар (checked_at), переписываемую на каждую проверку
+    - состояние риск-метрик (risk.json) — отдельно от горячего rates.json
     - append-only журнал истории (exchange_rates.json)
+    - перенос старой истории в архив (RatesArchive), не чаще
+      ARCHIVE_ROLL_INTERVAL_SECONDS после записи истории
 
     НЕ содержит бизнес-логики:
     - не проверяет TTL
     - не делает reverse-rate
+
+    Бизнес-логика, реагирующая на новые курсы (ордера, алерты),
+    подключается через subscribe() и получает только изменившиеся пары.
     """
 
     def __init__(self, config: ParserConfig | None = None) -> None:
@@ -25,6 +45,19 @@ class RatesStorage:
 
         self.rates_path = Path(self.config.RATES_FILE_PATH)
         self.history_path = Path(self.config.HISTORY_FILE_PATH)
+        self.binary_path = Path(self.config.RATES_BINARY_PATH)
+        self.risk_path = Path(self.config.RISK_FILE_PATH)
+        self.risk_lock = FileLock(self.risk_path.with_suffix(".lock"))
+        # чтение-слияние-запись rates.json / rates.bin; тот же lock-файл
+        # берёт обновление пары из CLI (core.usecases._refresh_pair)
+        self.rates_lock = FileLock(self.rates_path.with_suffix(".lock"))
+        self._listeners: list[SnapshotListener] = []
+
+        # запись истории и её перенос в архив — под одним lock:
+        # иначе roll перезапишет exchange_rates.json без чужих записей
+        self.history_lock = FileLock(self.history_path.with_suffix(".lock"))
+        self.archive = RatesArchive(self)
+        self._next_roll = 0.0
 
         # гарантируем, что каталог data/ существует
         self.rates_path.parent.mkdir(parents=True, exist_ok=True)
@@ -37,55 +70,107 @@ class RatesStorage:
     # public API
     # =========================
 
-    def save_snapshot(self, rates: dict[str, float], updated_at: str) -> None:
+    def save_snapshot(
+        self,
+        rates: dict[str, float],
+        updated_at: str,
+        sources: dict[str, dict[str, Any]] | None = None,
+    ) -> int:
         """
         Сохраняет snapshot текущих курсов в rates.json
         и добавляет записи в exchange_rates.json (append-only).
 
+        Сравнение с предыдущим snapshot — с точностью RATE_EPSILON /
+        RATE_EPSILON_BY_PAIR:
+        - изменившаяся пара → новый rate/updated_at + запись в историю;
+        - неизменившаяся пара → только heartbeat (checked_at) в rates.bin:
+          по нему читатели судят о свежести (курс, не менявшийся дольше
+          TTL, но только что подтверждённый, не устарел);
+        - rates.json, история и подписчики — только при изменениях;
+          проверка без изменений переписывает лишь небольшой rates.bin.
+
         rates: {"BTC_USD": 59337.21, ...}
         updated_at: ISO-UTC timestamp
+        sources: метаданные агрегации по паре (RatesAggregator),
+                 {"BTC_USD": {"source": ..., "sources": {...}, "spread": ...}}
+
+        Чтение, слияние и запись rates.json / rates.bin — под rates_lock:
+        обновления подмножества пар (планировщик по провайдерам, CLI)
+        не теряют пары, записанные другим процессом.
+
+        Возвращает количество изменившихся пар.
         """
-        snapshot = {
-            "pairs": {},
-            "last_refresh": updated_at,
-        }
+        with self.rates_lock:
+            changed = self._merge_snapshot(rates, updated_at, sources or {})
 
-        for pair, rate in rates.items():
-            source = self._detect_source(pair)
+        if not changed:
+            return 0
 
-            snapshot["pairs"][pair] = {
-                "rate": rate,
-                "updated_at": updated_at,
-                "source": source,
-            }
+        self._maybe_roll()
+        self._notify(changed, updated_at)
+        return len(changed)
 
-            self._append_history(
-                pair=pair,
-                rate=rate,
-                timestamp=updated_at,
-                source=source,
-            )
+    def subscribe(self, listener: SnapshotListener) -> None:
+        """
+        Подписка на опубликованные snapshot (вызывается после записи).
+        """
+        self._listeners.append(listener)
 
-        self._atomic_write(self.rates_path, snapshot)
+    def load_snapshot(self) -> dict[str, Any]:
+        """
+        Загружает текущий snapshot (rates.json).
+
+        Гарантии:
+        - всегда возвращает dict
+        - отсутствующий / пустой / битый файл → {}
+        """
+        data = self._load_json_file(self.rates_path)
+        if not isinstance(data, dict):
+            return {}
+        return data
+
+    def load_risk(self) -> dict[str, Any]:
+        """
+        Риск-метрики по парам (RiskTracker.to_dict()); нет файла → {}.
+        До первой записи risk.json читаются метрики, сохранённые
+        прежними версиями в rates.json.
+        """
+        if not self.risk_path.exists():
+            return self.load_snapshot().get("risk", {})
+
+        data = self._load_json_file(self.risk_path)
+        if not isinstance(data, dict):
+            return {}
+        return data
+
+    def save_risk(self, risk: dict[str, Any]) -> None:
+        self._atomic_write(self.risk_path, risk)
 
     # =========================
     # history helpers
     # =========================
 
-    def _append_history(
+    def _append_history_records(self, records: list[dict[str, Any]]) -> None:
+        """
+        Добавляет пачку записей за одну перезапись exchange_rates.json.
+        """
+        with self.history_lock:
+            history = self._load_history()
+            history.extend(records)
+
+            self._atomic_write(self.history_path, history)
+
+    def _make_history_record(
         self,
         pair: str,
         rate: float,
         timestamp: str,
         source: str,
         meta: dict[str, Any] | None = None,
-    ) -> None:
-        """
-        Добавляет запись в exchange_rates.json (append-only).
-        """
+    ) -> dict[str, Any]:
         from_currency, to_currency = pair.split("_", 1)
 
-        record = {
+        return {
             "id": f"{pair}_{timestamp}",
             "from_currency": from_currency,
             "to_currency": to_currency,
@@ -95,11 +180,6 @@ class RatesStorage:
             "meta": meta or {},
         }
 
-        history = self._load_history()
-        history.append(record)
-
-        self._atomic_write(self.history_path, history)
-
     # =========================
     # internal helpers
     # =========================
@@ -113,22 +193,123 @@ class RatesStorage:
         - пустой файл → []
         - битый формат → []
         """
-        if not self.history_path.exists():
+        data = self._load_json_file(self.history_path)
+        if not isinstance(data, list):
             return []
 
-        if self.history_path.stat().st_size == 0:
-            return []
+        return data
+
+    def _load_json_file(self, path: Path) -> Any:
+        """
+        Читает JSON-файл; отсутствующий / пустой / битый файл → None.
+        """
+        if not path.exists():
+            return None
+
+        if path.stat().st_size == 0:
+            return None
 
         try:
-            with open(self.history_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
         except json.JSONDecodeError:
-            return []
+            return None
 
-        if not isinstance(data, list):
-            return []
+    def _merge_snapshot(
+        self,
+        rates: dict[str, float],
+        updated_at: str,
+        sources: dict[str, dict[str, Any]],
+    ) -> dict[str, float]:
+        """
+        Слияние проверки с текущим snapshot (под rates_lock).
+        Возвращает изменившиеся пары {pair: rate}.
+        """
+        previous_snapshot = self.load_snapshot()
+        self._move_legacy_risk(previous_snapshot)
+        previous = previous_snapshot.get("pairs", {})
+        pairs = dict(previous)
+        history_records = []
+        changed: dict[str, float] = {}
+        # последние подтверждения пар (rates.bin); пары, не вошедшие
+        # в эту проверку, сохраняют свои
+        heartbeats = self._load_heartbeats()
 
-        return data
+        for pair, rate in rates.items():
+            heartbeats[pair] = updated_at
+            old = previous.get(pair)
+            if old is not None and not self._has_moved(pair, old["rate"], rate):
+                continue
+
+            pair_meta = sources.get(pair, {})
+            source = pair_meta.get("source") or self._detect_source(pair)
+
+            entry = {
+                "rate": rate,
+                "updated_at": updated_at,
+                "checked_at": updated_at,
+                "source": source,
+            }
+
+            # разброс по источникам — только если их было несколько
+            history_meta = None
+            if "sources" in pair_meta:
+                history_meta = {
+                    "sources": pair_meta["sources"],
+                    "spread": pair_meta["spread"],
+                }
+                entry.update(history_meta)
+
+            pairs[pair] = entry
+            changed[pair] = rate
+
+            history_records.append(
+                self._make_history_record(
+                    pair=pair,
+                    rate=rate,
+                    timestamp=updated_at,
+                    source=source,
+                    meta=history_meta,
+                )
+            )
+
+        if history_records:
+            self._append_history_records(history_records)
+            self._atomic_write(self.rates_path, {
+                **previous_snapshot,
+                "pairs": pairs,
+                "last_refresh": updated_at,
+            })
+
+        # rates.bin — на каждую проверку (heartbeat)
+        write_binary_snapshot(self.binary_path, {
+            pair: {**entry, "checked_at": heartbeats.get(pair) or entry.get("checked_at")}
+            for pair, entry in pairs.items()
+        })
+
+        return changed
+
+    def _load_heartbeats(self) -> dict[str, str]:
+        """
+        checked_at пар из опубликованного rates.bin (ISO-UTC).
+        """
+        reader = RatesSnapshotReader(self.binary_path)
+        try:
+            return {
+                pair: datetime.fromtimestamp(checked_at, timezone.utc).isoformat()
+                for pair, _, _, checked_at in reader.items()
+            }
+        finally:
+            reader.close()
+
+    def _has_moved(self, pair: str, old_rate: float, new_rate: float) -> bool:
+        """
+        Изменился ли курс больше допустимого (относительного) epsilon.
+        """
+        epsilon = self.config.RATE_EPSILON_BY_PAIR.get(
+            pair, self.config.RATE_EPSILON
+        )
+        return abs(new_rate - old_rate) > epsilon * abs(old_rate)
 
     def _atomic_write(self, path: Path, data: Any) -> None:
         """
@@ -148,6 +329,45 @@ class RatesStorage:
 
         os.replace(temp_name, path)
 
+    def _maybe_roll(self) -> None:
+        """
+        Перенос истории старше ARCHIVE_AFTER_DAYS в архив, не чаще
+        ARCHIVE_ROLL_INTERVAL_SECONDS (первый — при первой записи истории).
+        """
+        now = time.time()
+        if now < self._next_roll:
+            return
+        self._next_roll = now + self.config.ARCHIVE_ROLL_INTERVAL_SECONDS
+
+        # сбой архива не должен ломать обновление курсов
+        try:
+            moved = self.archive.roll()
+        except Exception as e:
+            logger.exception(f"Rates archive roll failed: {e}")
+            return
+        if moved:
+            logger.info(f"Rates archive: {moved} history records archived")
+
+    def _move_legacy_risk(self, snapshot: dict[str, Any]) -> None:
+        """
+        Риск-метрики, записанные прежними версиями в rates.json,
+        переносятся в risk.json (snapshot пишется уже без них).
+        """
+        risk = snapshot.pop("risk", None)
+        if risk is None:
+            return
+        with self.risk_lock:
+            if not self.risk_path.exists():
+                self.save_risk(risk)
+
+    def _notify(self, changed: dict[str, float], updated_at: str) -> None:
+        # ошибка подписчика не должна ломать обновление курсов
+        for listener in self._listeners:
+            try:
+                listener(changed, updated_at)
+            except Exception as e:
+                logger.exception(f"Snapshot listener failed: {e}")
+
     def _detect_source(self, pair: str) -> str:
         """
         Определяет источник курса по валютной паре.
@@ -3,72 +3,118 @@ import logging
 from datetime import datetime
 
 from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.parser_service.aggregator import RatesAggregator
 from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.resilience import ProviderGuard
+from valutatrade_hub.parser_service.risk import RiskTracker
 
 
 logger = logging.getLogger("valutatrade")
 
 
 class RatesUpdater:
-    def __init__(self, clients: list[BaseApiClient], storage) -> None:
+    def __init__(
+        self,
+        clients: list[BaseApiClient],
+        storage,
+        aggregator: RatesAggregator | None = None,
+        guard: ProviderGuard | None = None,
+    ) -> None:
         self.clients = clients
         self.storage = storage
-
-    def run_update(self) -> dict:
+        self.aggregator = aggregator or RatesAggregator(storage.config)
+        self.guard = guard or ProviderGuard(storage.config)
+
+    def run_update(self, clients: list[BaseApiClient] | None = None) -> dict:
+        """
+        clients: подмножество клиентов для опроса (по умолчанию — все);
+        используется планировщиком для провайдеров, чьи пары устарели.
+        """
         logger.info("Starting rates update")
 
-        all_rates: dict[str, float] = {}
+        quotes: dict[str, dict[str, float]] = {}
         sources_ok: list[str] = []
         errors: list[str] = []
 
-        for client in self.clients:
+        for client in self.clients if clients is None else clients:
             name = client.__class__.__name__
+            source = client.source_name
+
+            # провайдер "open" или исчерпал квоту — не ждём REQUEST_TIMEOUT
+            rejected = self.guard.acquire(source)
+            if rejected:
+                msg = f"{name}: skipped ({rejected})"
+                errors.append(msg)
+                logger.warning(msg)
+                continue
 
             try:
                 rates = client.fetch_rates()
+                self.guard.record_success(source)
                 if not rates:
                     logger.warning(f"{name}: no rates returned")
                     continue
 
-                all_rates.update(rates)
+                quotes.setdefault(source, {}).update(rates)
                 sources_ok.append(name)
 
                 logger.info(f"{name}: fetched {len(rates)} rates")
 
             except ApiRequestError as e:
+                self.guard.record_failure(source)
                 msg = f"{name}: {e}"
                 errors.append(msg)
                 logger.error(msg)
 
             except Exception as e:
+                self.guard.record_failure(source)
                 msg = f"{name}: unexpected error: {e}"
                 errors.append(msg)
                 logger.exception(msg)
 
+        breakers = self.guard.states()
+
+        # несколько источников могут котировать одну пару —
+        # консенсус вместо "последний клиент побеждает"
+        all_rates, sources_meta = self.aggregator.aggregate(quotes)
+
         if not all_rates:
             logger.warning("No rates collected from any source")
             return {
                 "count": 0,
+                "changed": 0,
                 "last_refresh": None,
                 "sources": sources_ok,
                 "errors": errors,
+                "breakers": breakers,
             }
 
         refreshed_at = datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
-        self.storage.save_snapshot(
+        # риск-метрики — в risk.json: перечитываем под lock, чтобы
+        # не затереть выборки другого процесса (CLI / планировщик)
+        with self.storage.risk_lock:
+            risk = RiskTracker.from_dict(self.storage.load_risk(), self.storage.config)
+            if risk.observe(all_rates, refreshed_at):
+                self.storage.save_risk(risk.to_dict())
+
+        changed = self.storage.save_snapshot(
             rates=all_rates,
             updated_at=refreshed_at,
+            sources=sources_meta,
         )
 
         logger.info(
-            f"Rates update finished: {len(all_rates)} pairs, sources={sources_ok}"
+            f"Rates update finished: {len(all_rates)} pairs, "
+            f"{changed} changed, sources={sources_ok}"
         )
 
         return {
             "count": len(all_rates),
+            "changed": changed,
             "last_refresh": refreshed_at,
             "sources": sources_ok,
             "errors": errors,
+            "breakers": breakers,
         }
 